@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
-DXF Offset Analysis Tool - Standalone Version
-スタンドアロン版：すべての機能を1ファイルに統合
+DXF Offset Analysis Tool
+ラベル位置から2つのDXFファイル間のオフセットを推定するコマンドラインツール
 
 使用方法:
     python analyze_offset.py fileA.dxf fileB.dxf
@@ -17,7 +17,10 @@ import argparse
 import ezdxf
 from collections import defaultdict
 import numpy as np
-import re
+
+# ラベル文字列の整形は extract_labels と同じ（メモ化済みの）処理を共有する。
+# utils パッケージが必要なため、このファイルはリポジトリ直下に置いたまま実行する
+from utils.extract_labels import clean_mtext_format_codes
 
 
 def extract_labels_with_positions(dxf_path):
@@ -40,14 +43,8 @@ def extract_labels_with_positions(dxf_path):
 
         # Extract MTEXT entities
         for entity in msp.query('MTEXT'):
-            # Clean MTEXT format codes
-            text = entity.text.strip()
-            # Remove common MTEXT format codes
-            text = re.sub(r'\\[fFhHwWcCpPqQaAlLtT][^;]*;', '', text)
-            text = re.sub(r'\\[pP]x[^;]*;', '', text)
-            text = text.replace('\\P', ' ')
-            text = text.replace('¥', '\\')  # Japanese yen symbol to backslash
-            text = text.strip()
+            # Clean MTEXT format codes (same cleaning as extract_labels)
+            text = clean_mtext_format_codes(entity.text)
 
             if text:
                 pos = (entity.dxf.insert.x, entity.dxf.insert.y)
@@ -11,10 +11,19 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 utils_path = os.path.join(current_dir, 'utils')
 sys.path.insert(0, utils_path)
 
-from utils.compare_dxf import compare_dxf_files_and_generate_dxf
+from utils.compare_dxf import (
+    compare_dxf_files_and_generate_dxf,
+    compare_dxf_layouts,
+    FilterConfig,
+    OUTPUT_MODE_FULL,
+    OUTPUT_MODE_CHANGES_ONLY,
+    OUTPUT_MODE_CHANGES_WITH_CONTEXT,
+)
 from utils.common_utils import save_uploadedfile, handle_error
 from utils.label_diff import (
     compute_label_differences,
+    LABEL_MATCH_ROUNDED,
+    LABEL_MATCH_NEIGHBOR,
     filter_unchanged_by_prefix,
     build_diff_labels_workbook,
     build_unchanged_labels_workbook
@@ -179,6 +188,52 @@ def app():
                 help="図面の位置座標の比較における許容誤差です。大きくすると微小な違いを無視します。"
             )
 
+            # ラベル照合方式
+            label_match_mode = st.selectbox(
+                "ラベル照合方式",
+                options=[
+                    (LABEL_MATCH_ROUNDED, "丸め座標が一致するラベルを照合"),
+                    (LABEL_MATCH_NEIGHBOR, "許容誤差内の近傍ラベルを照合（丸め境界をまたぐずれも一致扱い）"),
+                ],
+                index=0,
+                format_func=lambda x: x[1],
+                help="diff_labels.xlsx 作成時のラベルの対応付け方法です。近傍照合では隣接セルも探索し、距離の近いラベルから対応付けます。"
+            )[0]
+
+            detect_label_moves = st.checkbox(
+                "移動したラベルを検出",
+                value=False,
+                help="座標の照合で対応の付かなかった同じラベルの削除・追加を、距離の近い順に「移動」として対応付け、diff_labels.xlsx の Moved シートに出力します。"
+            )
+
+            # 出力モード設定
+            output_mode = st.selectbox(
+                "出力モード",
+                options=[
+                    (OUTPUT_MODE_FULL, "全て出力（変更なしを含む）"),
+                    (OUTPUT_MODE_CHANGES_ONLY, "差分のみ"),
+                    (OUTPUT_MODE_CHANGES_WITH_CONTEXT, "差分 + 簡略コンテキスト（図面枠・長い線分）"),
+                ],
+                index=0,
+                format_func=lambda x: x[1],
+                help="差分のみを出力すると、出力DXFのサイズと書き出し時間が変更量に比例するようになります。"
+            )[0]
+
+            context_min_length = st.number_input(
+                "コンテキストに残す線分の最小長",
+                min_value=0.0,
+                value=50.0,
+                format="%.2f",
+                disabled=output_mode != OUTPUT_MODE_CHANGES_WITH_CONTEXT,
+                help="「差分 + 簡略コンテキスト」モードで CONTEXT レイヤーに残す線分の最小長です。"
+            )
+
+            compare_layouts = st.checkbox(
+                "ペーパー空間レイアウトも比較",
+                value=False,
+                help="A/B のレイアウトを名前で対応付けてレイアウトごとに比較し、出力DXFの同名レイアウトに差分を書き出します。"
+            )
+
         with col2:
             st.write("**レイヤー色設定**")
             deleted_color = st.selectbox(
@@ -202,6 +257,50 @@ def app():
                 format_func=lambda x: x[1]
             )[0]
 
+        st.write("---")
+        st.write("**図形比較の対象フィルタ**")
+        st.caption("カンマ区切りで指定します（大文字・小文字は区別しません）。空欄の項目はフィルタしません。")
+
+        filter_col1, filter_col2 = st.columns(2)
+        with filter_col1:
+            include_layers = st.text_input(
+                "対象レイヤー",
+                value="",
+                help="指定したレイヤーのエンティティだけを比較します。ブロック内のレイヤー0の要素はブロック参照のレイヤーで判定します。"
+            )
+            include_blocks = st.text_input(
+                "展開するブロック名",
+                value="",
+                help="指定したブロックのブロック参照だけを展開して比較します。"
+            )
+            include_types = st.text_input(
+                "対象エンティティタイプ",
+                value="",
+                help="例: LINE, LWPOLYLINE, TEXT, ATTRIB"
+            )
+        with filter_col2:
+            exclude_layers = st.text_input(
+                "除外レイヤー",
+                value="",
+                help="指定したレイヤーのエンティティを比較から除外します。"
+            )
+            exclude_blocks = st.text_input(
+                "除外ブロック名",
+                value="",
+                help="指定したブロックのブロック参照を展開せずに除外します。"
+            )
+            exclude_types = st.text_input(
+                "除外エンティティタイプ",
+                value="",
+                help="例: HATCH, DIMENSION（INSERT を指定するとブロック参照全体を除外します）"
+            )
+
+        filter_config = FilterConfig(
+            include_layers=include_layers, exclude_layers=exclude_layers,
+            include_blocks=include_blocks, exclude_blocks=exclude_blocks,
+            include_types=include_types, exclude_types=exclude_types
+        )
+
         st.write("---")
         st.write("**ラベル比較設定**")
 
@@ -310,8 +409,9 @@ def app():
                         # オフセット補正の取得
                         offset_b = st.session_state.offset_pairs.get(idx, None)
 
-                        # DXF比較処理
-                        success, entity_counts = compare_dxf_files_and_generate_dxf(
+                        # DXF比較処理（レイアウト比較時はモデル空間＋ペーパー空間をレイアウト単位で比較）
+                        compare_function = compare_dxf_layouts if compare_layouts else compare_dxf_files_and_generate_dxf
+                        success, entity_counts = compare_function(
                             temp_file_a,
                             temp_file_b,
                             temp_output,
@@ -319,7 +419,10 @@ def app():
                             deleted_color=deleted_color,
                             added_color=added_color,
                             unchanged_color=unchanged_color,
-                            offset_b=offset_b
+                            offset_b=offset_b,
+                            output_mode=output_mode,
+                            context_min_length=context_min_length,
+                            filter_config=filter_config
                         )
 
                         if success:
@@ -340,10 +443,12 @@ def app():
                             # ラベル比較処理を追加
                             try:
                                 # ラベルの差分を計算
-                                change_rows, unchanged_entries, _extra_info = compute_label_differences(
+                                change_rows, unchanged_entries, extra_info = compute_label_differences(
                                     temp_file_b,  # 新ファイル
                                     temp_file_a,  # 旧ファイル
-                                    tolerance=tolerance
+                                    tolerance=tolerance,
+                                    match_mode=label_match_mode,
+                                    detect_moves=detect_label_moves
                                 )
 
                                 # シート名を生成（ファイル名から拡張子を除いたもの）
@@ -354,7 +459,8 @@ def app():
                                     'sheet_name': sheet_name,
                                     'rows': change_rows,
                                     'old_label_name': f'Old: {Path(file_a.name).stem}',
-                                    'new_label_name': f'New: {Path(file_b.name).stem}'
+                                    'new_label_name': f'New: {Path(file_b.name).stem}',
+                                    'moved_rows': extra_info['moved_rows'] if detect_label_moves else None
                                 })
 
                                 # unchanged_labels用のデータをフィルタリング
@@ -477,6 +583,18 @@ def app():
                                     f"変更なし: {entity_counts['unchanged_entities']}, "
                                     f"合計: {entity_counts['total_entities']}"
                                 )
+                                if 'written_total' in entity_counts:
+                                    st.caption(
+                                        f"📝 出力 ({entity_counts['output_mode']}): "
+                                        f"{entity_counts['written_total']}件, "
+                                        f"{entity_counts['output_bytes'] / 1024:,.0f} KB"
+                                    )
+                                for layout_name, layout_counts in entity_counts.get('layouts', {}).items():
+                                    st.caption(
+                                        f"🗂 {layout_name}: 削除 {layout_counts['deleted_entities']}, "
+                                        f"追加 {layout_counts['added_entities']}, "
+                                        f"変更なし {layout_counts['unchanged_entities']}"
+                                    )
 
                         with col2:
                             st.download_button(
@@ -0,0 +1,328 @@
+"""utils/compare_dxf.py のテスト（図面は ezdxf で tmp_path に作成する）"""
+
+import gc
+import pickle
+import random
+import shutil
+import weakref
+
+import ezdxf
+
+from utils.compare_dxf import (
+    DIFF_ENGINE_COLUMNAR,
+    DIFF_ENGINE_SIGNATURE,
+    OUTPUT_MODES,
+    BaselineIndex,
+    CoordinateTransformer,
+    DeferredExpandedEntity,
+    EntityExpander,
+    FilterConfig,
+    LayerConfig,
+    OutputGenerator,
+    ToleranceConfig,
+    compare_dxf_files_and_generate_dxf,
+    summarize_dxf_differences,
+)
+
+
+def _block_drawing(path, shift=0.0):
+    """LINE・LWPOLYLINE・TEXT を持つブロックを INSERT / MINSERT で配置した図面を保存する"""
+    doc = ezdxf.new()
+    block = doc.blocks.new('PART')
+    block.add_line((0, 0), (10, 0))
+    block.add_lwpolyline([(0, 0, 0.5), (5, 0), (5, 5)], format='xyb', close=True)
+    block.add_text('P1', dxfattribs={'insert': (1, 1), 'height': 2.5})
+    msp = doc.modelspace()
+    msp.add_blockref('PART', (100 + shift, 0), dxfattribs={'rotation': 30})
+    msp.add_blockref('PART', (0, 100)).grid(size=(2, 3), spacing=(20, 30))
+    msp.add_line((0, 0), (0, 50 + shift))
+    doc.saveas(path)
+
+
+def test_columnar_baseline_releases_document(tmp_path, monkeypatch):
+    # 代表行は ezdxf エンティティを参照しないため、抽出後に基準ドキュメントは解放される
+    path = str(tmp_path / 'a.dxf')
+    _block_drawing(path)
+    documents = []
+    readfile = ezdxf.readfile
+
+    def tracking_readfile(*args, **kwargs):
+        doc = readfile(*args, **kwargs)
+        documents.append(weakref.ref(doc))
+        return doc
+
+    monkeypatch.setattr(ezdxf, 'readfile', tracking_readfile)
+    baseline = BaselineIndex(path, diff_engine=DIFF_ENGINE_COLUMNAR)
+    gc.collect()
+
+    assert documents and all(ref() is None for ref in documents)
+    assert any(isinstance(e, DeferredExpandedEntity) for e in baseline.entities.values())
+
+
+def test_deferred_entity_pickles_without_materializing(tmp_path):
+    path = str(tmp_path / 'a.dxf')
+    _block_drawing(path)
+    baseline = BaselineIndex(path, diff_engine=DIFF_ENGINE_COLUMNAR)
+    deferred = [e for e in baseline.entities.values() if isinstance(e, DeferredExpandedEntity)]
+
+    restored = pickle.loads(pickle.dumps(deferred))
+
+    assert all(e._entity is None for e in deferred)
+    assert all(isinstance(e, DeferredExpandedEntity) and e._entity is None for e in restored)
+    for original, copy in zip(deferred, restored):
+        assert copy.instance_count == original.instance_count
+        assert copy.layer == original.layer
+        assert copy.text_content == original.text_content
+        assert copy.attributes.keys() == original.attributes.keys()
+
+
+def _random_spec(rng):
+    """図面の要素（タプル）を1つ作る。座標は 0.5 刻みに許容誤差内の揺らぎを加える"""
+    def coordinate():
+        return rng.randint(-200, 200) * 0.5 + rng.choice([0.0, 0.0, 0.001, -0.002])
+
+    kind = rng.choice(['LINE', 'LINE', 'LWPOLYLINE', 'CIRCLE', 'TEXT', 'INSERT', 'INSERT', 'MINSERT'])
+    if kind == 'LINE':
+        return kind, (coordinate(), coordinate()), (coordinate(), coordinate()), rng.choice(['0', 'L1'])
+    if kind == 'LWPOLYLINE':
+        points = tuple((coordinate(), coordinate(), rng.choice([0, 0, 0.5]), rng.choice([0, 0, 0.25]))
+                       for _ in range(rng.randint(2, 4)))
+        return kind, points, rng.random() < 0.5
+    if kind == 'CIRCLE':
+        return kind, (coordinate(), coordinate()), rng.choice([1, 2.5, 10])
+    if kind == 'TEXT':
+        return kind, rng.choice(['A', 'B', 'P1']), (coordinate(), coordinate())
+    insert = (kind, rng.choice(['B0', 'B1']), (coordinate(), coordinate()), rng.choice([0, 30, 90, 180]),
+              rng.choice([(1, 1), (2, 2), (1, -1), (0.5, 2)]))
+    if kind == 'MINSERT':
+        insert += ((rng.randint(1, 3), rng.randint(1, 3)), (rng.choice([10, 25]), rng.choice([10, 40])))
+    return insert
+
+
+def _draw_specs(path, specs):
+    """_random_spec の要素から図面を作成して保存する"""
+    doc = ezdxf.new()
+    for name, bulge in (('B0', 0.0), ('B1', 0.5)):
+        block = doc.blocks.new(name)
+        block.add_line((0, 0), (4, 0))
+        block.add_lwpolyline([(0, 0, 0, 0, bulge), (3, 1, 0.2, 0.2, 0), (3, 4)], format='xyseb')
+        block.add_circle((1, 1), 0.5)
+        block.add_text(name, dxfattribs={'insert': (0, -1), 'height': 1})
+    msp = doc.modelspace()
+    for spec in specs:
+        kind = spec[0]
+        if kind == 'LINE':
+            msp.add_line(spec[1], spec[2], dxfattribs={'layer': spec[3]})
+        elif kind == 'LWPOLYLINE':
+            points = [(x, y, width, width, bulge) for x, y, bulge, width in spec[1]]
+            msp.add_lwpolyline(points, format='xyseb', close=spec[2])
+        elif kind == 'CIRCLE':
+            msp.add_circle(spec[1], spec[2])
+        elif kind == 'TEXT':
+            msp.add_text(spec[1], dxfattribs={'insert': spec[2], 'height': 2.5})
+        else:
+            _kind, name, insert, rotation, (sx, sy) = spec[:5]
+            ref = msp.add_blockref(name, insert, dxfattribs={'rotation': rotation, 'xscale': sx, 'yscale': sy})
+            if kind == 'MINSERT':
+                ref.grid(size=spec[5], spacing=spec[6])
+    doc.saveas(path)
+
+
+def test_columnar_engine_matches_signature_engine_on_random_drawings(tmp_path):
+    count_keys = ('deleted_entities', 'added_entities', 'unchanged_entities')
+    written_keys = ('written_deleted', 'written_added', 'written_unchanged', 'written_context', 'written_total')
+    file_a, file_b, output = (str(tmp_path / name) for name in ('a.dxf', 'b.dxf', 'out.dxf'))
+    for seed in range(15):
+        rng = random.Random(seed)
+        specs_a = [_random_spec(rng) for _ in range(rng.randint(5, 30))]
+        # B: 一部を削除し、重複と新しい要素を加える
+        specs_b = [spec for spec in specs_a if rng.random() > 0.2]
+        specs_b += rng.sample(specs_a, min(3, len(specs_a))) + [_random_spec(rng) for _ in range(rng.randint(0, 5))]
+        rng.shuffle(specs_b)
+        _draw_specs(file_a, specs_a)
+        _draw_specs(file_b, specs_b)
+
+        for output_mode in OUTPUT_MODES:
+            results = {}
+            for engine in (DIFF_ENGINE_SIGNATURE, DIFF_ENGINE_COLUMNAR):
+                success, counts = compare_dxf_files_and_generate_dxf(
+                    file_a, file_b, output, output_mode=output_mode, context_min_length=5.0,
+                    precheck_identical=False, diff_engine=engine)
+                assert success, f'seed={seed} engine={engine}'
+                results[engine] = [counts[key] for key in count_keys + written_keys]
+            assert results[DIFF_ENGINE_COLUMNAR] == results[DIFF_ENGINE_SIGNATURE], \
+                f'seed={seed} output_mode={output_mode}'
+
+
+def _line_endpoints(lines):
+    return sorted(tuple(round(v, 6) for v in (*tuple(start)[:2], *tuple(end)[:2])) for start, end in lines)
+
+
+def test_minsert_grid_matches_ezdxf_multi_insert():
+    # 回転・非一様スケール・ミラーを含む MINSERT の各グリッド要素が ezdxf の配置と一致する
+    doc = ezdxf.new()
+    block = doc.blocks.new('CELL')
+    block.add_line((1, 2), (6, 2))
+    block.add_line((1, 2), (1, 5))
+    msp = doc.modelspace()
+    minsert = msp.add_blockref('CELL', (30, -10), dxfattribs={'rotation': 35, 'xscale': 2, 'yscale': -0.5})
+    minsert.grid(size=(3, 4), spacing=(7, 11))
+
+    expander = EntityExpander(CoordinateTransformer(ToleranceConfig()))
+    expanded = [e for e in expander.expand_insert_entities(doc, 'A') if e.dxftype == 'LINE']
+    expected = [(line.dxf.start, line.dxf.end)
+                for insert in minsert.multi_insert() for line in insert.virtual_entities()]
+
+    assert len(expanded) == 3 * 4 * 2
+    assert _line_endpoints((e.attributes['start'], e.attributes['end']) for e in expanded) == \
+        _line_endpoints(expected)
+
+
+def test_identical_drawings_short_circuit(tmp_path):
+    file_a, copy, resaved, output = (str(tmp_path / name) for name in ('a.dxf', 'copy.dxf', 'resaved.dxf', 'o.dxf'))
+    _block_drawing(file_a)
+    shutil.copyfile(file_a, copy)
+    # 再保存するとヘッダーのタイムスタンプ等が変わるが、エンティティ内容は同じ
+    doc = ezdxf.readfile(file_a)
+    doc.saveas(resaved)
+    assert _file_bytes(resaved) != _file_bytes(file_a)
+
+    _success, full_counts = summarize_dxf_differences(file_a, file_a, precheck_identical=False)
+    for file_b, expected in ((copy, 'identical_file'), (resaved, 'identical_content')):
+        for engine in (DIFF_ENGINE_SIGNATURE, DIFF_ENGINE_COLUMNAR):
+            success, counts = compare_dxf_files_and_generate_dxf(file_a, file_b, output, diff_engine=engine)
+            assert success and counts['short_circuit'] == expected
+            assert counts['diff_entities'] == 0
+            assert counts['unchanged_entities'] == full_counts['unchanged_entities']
+
+            success, summary = summarize_dxf_differences(file_a, file_b, diff_engine=engine)
+            assert success and summary['short_circuit'] == expected
+            assert summary['diff_entities'] == 0
+
+    # オフセット指定時と、内容が異なる場合は省略しない
+    _success, counts = compare_dxf_files_and_generate_dxf(file_a, copy, output, offset_b=(5, 0))
+    assert counts['short_circuit'] is None and counts['diff_entities'] > 0
+    _block_drawing(copy, shift=1.0)
+    _success, counts = compare_dxf_files_and_generate_dxf(file_a, copy, output)
+    assert counts['short_circuit'] is None and counts['diff_entities'] > 0
+
+
+def _file_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _summaries(tmp_path, draw_a, draw_b):
+    """draw_a / draw_b でモデル空間に作図した2図面を両エンジンで比較したサマリー"""
+    paths = []
+    for name, draw in (('a.dxf', draw_a), ('b.dxf', draw_b)):
+        doc = ezdxf.new()
+        draw(doc.modelspace())
+        doc.saveas(tmp_path / name)
+        paths.append(str(tmp_path / name))
+    return [summarize_dxf_differences(*paths, diff_engine=engine)[1]
+            for engine in (DIFF_ENGINE_SIGNATURE, DIFF_ENGINE_COLUMNAR)]
+
+
+def test_lwpolyline_fingerprint_covers_bulge_width_and_closed_flag(tmp_path):
+    points = [(0, 0, 0, 0, 0), (10, 0, 0, 0, 0.5), (10, 10, 0, 0, 0), (0, 10, 0, 0, 0)]
+
+    def polyline(vertices, close=False):
+        return lambda msp: msp.add_lwpolyline(vertices, format='xyseb', close=close)
+
+    changed = {
+        'bulge': points[:2] + [(10, 10, 0, 0, -0.3)] + points[3:],
+        'width': points[:2] + [(10, 10, 0.5, 0.5, 0)] + points[3:],
+        'middle vertex': points[:2] + [(10, 12, 0, 0, 0)] + points[3:],
+    }
+    for name, vertices in changed.items():
+        for counts in _summaries(tmp_path, polyline(points), polyline(vertices)):
+            assert (counts['deleted_entities'], counts['added_entities']) == (1, 1), name
+    for counts in _summaries(tmp_path, polyline(points), polyline(points, close=True)):
+        assert (counts['deleted_entities'], counts['added_entities']) == (1, 1), 'closed'
+
+    # 許容誤差内の揺らぎは同一とみなす
+    nudged = [(x + 0.001, y, start, end, bulge + 1e-6) for x, y, start, end, bulge in points]
+    for counts in _summaries(tmp_path, polyline(points), polyline(nudged)):
+        assert (counts['diff_entities'], counts['unchanged_entities']) == (0, 1)
+
+
+def test_descriptor_fingerprint_covers_inner_geometry(tmp_path):
+    # 始点・終点が同じでも、内部の制御点・境界・頂点が違えば別エンティティになる
+    def spline(middle):
+        return lambda msp: msp.add_spline([(0, 0), middle, (20, 0)])
+
+    def hatch(corner):
+        def draw(msp):
+            msp.add_hatch(color=2).paths.add_polyline_path([(0, 0), (10, 0), corner, (0, 10)], is_closed=True)
+        return draw
+
+    def polyline(middle):
+        return lambda msp: msp.add_polyline2d([(0, 0), middle, (20, 0)])
+
+    for name, draw, before, after in (('SPLINE', spline, (10, 5), (10, 8)),
+                                      ('HATCH', hatch, (10, 10), (12, 10)),
+                                      ('POLYLINE', polyline, (10, 5), (10, 8))):
+        for counts in _summaries(tmp_path, draw(before), draw(after)):
+            assert (counts['deleted_entities'], counts['added_entities']) == (1, 1), name
+        for counts in _summaries(tmp_path, draw(before), draw((before[0] + 0.001, before[1]))):
+            assert (counts['diff_entities'], counts['unchanged_entities']) == (0, 1), name
+
+
+def test_filter_config_include_and_exclude(tmp_path):
+    file_a, file_b = str(tmp_path / 'a.dxf'), str(tmp_path / 'b.dxf')
+    for path, shift in ((file_a, 0), (file_b, 5)):
+        doc = ezdxf.new()
+        # ブロック内レイヤー "0" の要素は INSERT のレイヤー（DIM）で判定される
+        doc.blocks.new('MARK').add_line((0, 0), (1, 1))
+        msp = doc.modelspace()
+        msp.add_line((0, 0), (10, 0), dxfattribs={'layer': 'WALL'})
+        msp.add_line((0, 20), (10 + shift, 20), dxfattribs={'layer': 'DIM'})
+        msp.add_text('T', dxfattribs={'layer': 'WALL', 'insert': (0, 30 + shift)})
+        msp.add_blockref('MARK', (50 + shift, 0), dxfattribs={'layer': 'DIM'})
+        doc.saveas(path)
+
+    cases = (
+        (None, (3, 3, 1)),
+        (FilterConfig(exclude_layers=['dim']), (1, 1, 1)),
+        (FilterConfig(include_layers='WALL'), (1, 1, 1)),
+        (FilterConfig(include_layers=['WALL'], exclude_types=['TEXT']), (0, 0, 1)),
+        (FilterConfig(include_types=['LINE']), (2, 2, 1)),
+        (FilterConfig(exclude_blocks=['MARK']), (2, 2, 1)),
+        (FilterConfig(exclude_types=['INSERT']), (2, 2, 1)),
+    )
+    for filter_config, expected in cases:
+        for engine in (DIFF_ENGINE_SIGNATURE, DIFF_ENGINE_COLUMNAR):
+            success, counts = summarize_dxf_differences(file_a, file_b, diff_engine=engine,
+                                                        filter_config=filter_config)
+            assert success
+            actual = (counts['deleted_entities'], counts['added_entities'], counts['unchanged_entities'])
+            assert actual == expected, (filter_config and filter_config.cache_key(), engine)
+
+
+def test_context_check_does_not_materialize_other_types(tmp_path):
+    path = str(tmp_path / 'a.dxf')
+    _block_drawing(path)
+    baseline = BaselineIndex(path, diff_engine=DIFF_ENGINE_COLUMNAR)
+    generator = OutputGenerator(baseline.transformer, LayerConfig())
+    deferred = [e for e in baseline.entities.values() if isinstance(e, DeferredExpandedEntity)]
+
+    flags = {e.dxftype: generator.is_context_entity(e, 5.0) for e in deferred}
+
+    assert flags['TEXT'] is False and flags['LINE'] is True
+    assert all(e._entity is None for e in deferred if e.dxftype not in ('LINE', 'LWPOLYLINE'))
+
+
+def test_reused_template_writes_the_same_handles(tmp_path):
+    # スレッドごとのテンプレートを使い回しても、出力のハンドルは毎回同じ
+    file_a, file_b = str(tmp_path / 'a.dxf'), str(tmp_path / 'b.dxf')
+    _block_drawing(file_a)
+    _block_drawing(file_b, shift=1.0)
+    outputs = []
+    for index in range(3):
+        output = str(tmp_path / f'o{index}.dxf')
+        assert compare_dxf_files_and_generate_dxf(file_a, file_b, output, precheck_identical=False)[0]
+        doc = ezdxf.readfile(output)
+        outputs.append(([e.dxf.handle for e in doc.modelspace()], doc.header['$HANDSEED']))
+
+    assert outputs[1] == outputs[0] and outputs[2] == outputs[0]
@@ -0,0 +1,182 @@
+"""utils/extract_labels.py のテスト（図面は ezdxf でメモリ上に作成する）"""
+
+import multiprocessing
+import signal
+import threading
+import time
+
+import ezdxf
+import pytest
+
+import utils.extract_labels as extract_labels_module
+from utils.extract_labels import (
+    _ExtractionTimeout,
+    _call_with_timeout,
+    _titleblock_frame_bbox,
+    extract_title_info,
+    get_title_and_subtitle,
+    iter_multiple_dxf_files,
+    process_multiple_dxf_files,
+)
+
+
+def _drawing_with_frame(width, height=210):
+    doc = ezdxf.new()
+    block = doc.blocks.new('TB')
+    corners = [(0, 0), (width, 0), (width, height), (0, height)]
+    for start, end in zip(corners, corners[1:] + corners[:1]):
+        block.add_line(start, end, dxfattribs={'lineweight': 100, 'color': 7})
+    insert = doc.modelspace().add_blockref('TB', (0, 0))
+    return doc, insert.dxf.handle
+
+
+def test_frame_bbox_is_not_shared_between_documents():
+    # 同じブロック名・要素数・変換行列でも、枠の大きさは図面ごとに求める（A3 → A1）
+    doc_a3, handle_a3 = _drawing_with_frame(420)
+    doc_a1, handle_a1 = _drawing_with_frame(841)
+
+    assert _titleblock_frame_bbox(doc_a3, handle_a3) == (-1.0, 421.0, -1.0, 211.0)
+    assert _titleblock_frame_bbox(doc_a1, handle_a1) == (-1.0, 842.0, -1.0, 211.0)
+    assert _titleblock_frame_bbox(doc_a3, handle_a3) == (-1.0, 421.0, -1.0, 211.0)
+
+
+def _titleblock_drawing(path, drawing_number=True, subtitle=True, stray_labels=()):
+    """TITLE・DWG No. を持つタイトルブロックを INSERT した図面を保存する。
+
+    stray_labels はタイトルブロック外（モデル空間直下）に置く (テキスト, 座標)。
+    """
+    doc = ezdxf.new()
+    block = doc.blocks.new('TITLEBLOCK')
+    corners = [(0, 0), (420, 0), (420, 297), (0, 297)]
+    for start, end in zip(corners, corners[1:] + corners[:1]):
+        block.add_line(start, end, dxfattribs={'lineweight': 100, 'color': 7})
+    block.add_text('TITLE', dxfattribs={'insert': (300, 40), 'height': 2.5})
+    block.add_text('REVISION', dxfattribs={'insert': (300, 60), 'height': 2.5})
+    block.add_text('DWG No.', dxfattribs={'insert': (300, 10), 'height': 2.5})
+    block.add_text('PUMP CONTROL', dxfattribs={'insert': (320, 40), 'height': 3.5})
+    if subtitle:
+        block.add_text('PANEL WIRING', dxfattribs={'insert': (320, 32), 'height': 3.5})
+    if drawing_number:
+        block.add_text('EE1234-567A', dxfattribs={'insert': (320, 10), 'height': 3.5})
+    msp = doc.modelspace()
+    msp.add_blockref('TITLEBLOCK', (0, 0))
+    for index in range(200):
+        msp.add_text(f'R{index}', dxfattribs={'insert': (index % 20 * 10, index // 20 * 10 + 100)})
+    for text, point in stray_labels:
+        msp.add_text(text, dxfattribs={'insert': point, 'height': 2.5})
+    doc.saveas(path)
+    return str(path)
+
+
+def test_title_fast_mode_matches_full_mode(tmp_path):
+    path = _titleblock_drawing(tmp_path / 'EE1234-567A.dxf')
+
+    fast_info = extract_title_info(path, fast=True)
+    full_info = extract_title_info(path, fast=False)
+
+    assert fast_info['mode'] == 'fast'
+    assert full_info['mode'] == 'full'
+    for key in ('title', 'subtitle', 'main_drawing_number', 'source_drawing_number'):
+        assert fast_info[key] == full_info[key]
+    assert full_info['title'] == 'PUMP CONTROL'
+    assert full_info['subtitle'] == 'PANEL WIRING'
+
+
+def test_title_fast_mode_falls_back_without_drawing_number(tmp_path):
+    # 図番が無いと全体処理は全ラベルからタイトルを選ぶ。タイトルブロックの
+    # 周辺矩形より外（TITLE の右下）のラベルもサブタイトル候補になるため、
+    # 周辺だけの判定は採用せず全体処理と同じ結果を返す
+    path = _titleblock_drawing(
+        tmp_path / 'no_number.dxf',
+        drawing_number=False,
+        subtitle=False,
+        stray_labels=[('W42', (330, -150))],
+    )
+
+    fast_info = extract_title_info(path, fast=True)
+    full_info = extract_title_info(path, fast=False)
+
+    assert fast_info['mode'] == 'full'
+    assert full_info['subtitle'] == 'W42'
+    assert (fast_info['title'], fast_info['subtitle']) == (full_info['title'], full_info['subtitle'])
+    assert get_title_and_subtitle(path) == (full_info['title'], full_info['subtitle'])
+
+
+def _write_drawings(directory, count):
+    paths = []
+    for index in range(count):
+        doc = ezdxf.new()
+        doc.modelspace().add_text(f'R{index}', dxfattribs={'insert': (0, 0)})
+        path = directory / f'd{index}.dxf'
+        doc.saveas(path)
+        paths.append(str(path))
+    return paths
+
+
+def test_process_multiple_dxf_files_streams_results(tmp_path):
+    paths = _write_drawings(tmp_path, 3)
+    received = []
+
+    results = process_multiple_dxf_files(
+        paths, progress_callback=lambda *args: received.append(args))
+
+    assert [args[:3] for args in received] == [(i + 1, 3, path) for i, path in enumerate(paths)]
+    for done, total, path, labels, info in received:
+        assert (labels, info) == results[path]
+    assert [labels for _d, _t, _p, labels, _i in iter_multiple_dxf_files(paths)] == [['R0'], ['R1'], ['R2']]
+
+
+@pytest.fixture
+def fork_start_method():
+    """プロセスプールの開始方式を fork に固定する（ワーカーに monkeypatch を引き継ぐため）"""
+    if not hasattr(signal, 'SIGALRM') or 'fork' not in multiprocessing.get_all_start_methods():
+        pytest.skip('SIGALRM と fork が使える環境でのみ実行する')
+    previous = multiprocessing.get_start_method(allow_none=True)
+    multiprocessing.set_start_method('fork', force=True)
+    yield
+    multiprocessing.set_start_method(previous, force=True)
+
+
+def _sleep_for_extraction(*args, **kwargs):
+    time.sleep(30)
+
+
+def test_timeout_applies_outside_main_thread(tmp_path, monkeypatch, fork_start_method):
+    # Streamlit のスクリプトスレッドと同様、メインスレッド以外からの逐次実行でも打ち切る
+    paths = _write_drawings(tmp_path, 1)
+    monkeypatch.setattr(extract_labels_module, 'extract_labels', _sleep_for_extraction)
+    results = {}
+
+    def _run():
+        results.update(process_multiple_dxf_files(paths, timeout=0.5))
+
+    worker = threading.Thread(target=_run)
+    worker.start()
+    worker.join(20)
+
+    assert not worker.is_alive()
+    assert results[paths[0]][1]['timed_out'] is True
+
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGALRM'), reason='SIGALRM が使える環境でのみ打ち切る')
+def test_call_with_timeout_interrupts_and_restores_the_handler():
+    previous = signal.getsignal(signal.SIGALRM)
+
+    with pytest.raises(_ExtractionTimeout):
+        _call_with_timeout(lambda: time.sleep(30), 0.2)
+
+    assert signal.getsignal(signal.SIGALRM) is previous
+    assert signal.getitimer(signal.ITIMER_REAL) == (0.0, 0.0)
+    assert _call_with_timeout(lambda: 'done', 5) == 'done'
+    assert _call_with_timeout(lambda: 'done', None) == 'done'
+
+
+def test_call_with_timeout_runs_without_timeout_off_the_main_thread():
+    # メインスレッド以外では SIGALRM を設定できないため、打ち切らずに最後まで実行する
+    results = []
+    worker = threading.Thread(
+        target=lambda: results.append(_call_with_timeout(lambda: time.sleep(0.3) or 'done', 0.05)))
+    worker.start()
+    worker.join(10)
+
+    assert results == ['done']
@@ -0,0 +1,152 @@
+"""utils/label_diff.py のテスト"""
+
+import random
+
+import numpy as np
+import pandas as pd
+
+from utils.label_diff import (
+    _MOVE_CANDIDATES_PER_LABEL,
+    _match_moved_labels,
+    _nearest_same_label_candidates,
+    count_labels_by_coordinate,
+    find_label_change_pairs,
+    find_label_change_pairs_vectorized,
+    group_labels_by_coordinate,
+    match_labels_with_neighbors,
+    round_label_arrays,
+    round_labels_with_coordinates,
+)
+
+
+_CHANGE_COLUMNS = ['Coordinate X', 'Coordinate Y', 'Old Label', 'New Label']
+
+
+def _loop_diff(labels_new, labels_old, tolerance):
+    """ループ版（従来実装）での change_rows / unchanged_entries"""
+    group_new = group_labels_by_coordinate(round_labels_with_coordinates(labels_new, tolerance))
+    group_old = group_labels_by_coordinate(round_labels_with_coordinates(labels_old, tolerance))
+    change_rows, unchanged_entries = find_label_change_pairs(group_new, group_old)
+    change_rows.sort(key=lambda r: ((r['Old Label'] or ''), (r['New Label'] or '')))
+    return change_rows, unchanged_entries
+
+
+def _vectorized_diff(labels_new, labels_old, tolerance):
+    counts = count_labels_by_coordinate(
+        round_label_arrays(labels_new, tolerance), round_label_arrays(labels_old, tolerance))
+    change_rows, unchanged_entries, _moved_rows = find_label_change_pairs_vectorized(counts, sort_by_label=True)
+    return change_rows, unchanged_entries
+
+
+def _random_labels(rng, count, words, span):
+    # 丸め境界付近（偶数丸め・-0.0）や整数座標も混ぜる
+    return [
+        (
+            rng.choice(words),
+            rng.choice([rng.uniform(-span, span), float(rng.randint(-5, 5)), rng.randint(-3, 3) * 0.005, -0.004]),
+            rng.choice([rng.uniform(-span, span), 1.0, 0.015]),
+        )
+        for _ in range(count)
+    ]
+
+
+def test_vectorized_diff_matches_loop_version_on_random_inputs():
+    for seed in range(300):
+        rng = random.Random(seed)
+        words = [''.join(rng.choice('ABR12') for _ in range(rng.randint(1, 3))) for _ in range(rng.randint(1, 8))]
+        labels_new = _random_labels(rng, rng.randint(0, 60), words, rng.choice([0.05, 1, 10]))
+        labels_old = _random_labels(rng, rng.randint(0, 60), words, rng.choice([0.05, 1, 10]))
+        if rng.random() < 0.5:
+            labels_old += labels_new[:rng.randint(0, len(labels_new))]
+        tolerance = rng.choice([0.01, 0.1, 0, 1, 0.005])
+
+        expected = _loop_diff(labels_new, labels_old, tolerance)
+        actual = _vectorized_diff(labels_new, labels_old, tolerance)
+
+        assert actual == expected, f'seed={seed} tolerance={tolerance}'
+        # ワークブック用の DataFrame も辞書のリストから作ったものと同じ
+        pd.testing.assert_frame_equal(actual[0].to_frame(_CHANGE_COLUMNS),
+                                      pd.DataFrame(expected[0], columns=_CHANGE_COLUMNS),
+                                      check_dtype=bool(expected[0]))
+        if tolerance:
+            # 整数の許容誤差では座標も int になる（round() 版と同じ型）
+            assert [type(r['Coordinate X']) for r in actual[0]] == [type(r['Coordinate X']) for r in expected[0]]
+
+
+def test_moved_labels_with_many_repeated_texts():
+    # 同じラベルの集団が遠くへ移動した場合も全ペアを列挙しない（旧実装は 6000 件で約 30 秒）
+    count = 6000
+    rng = np.random.default_rng(1)
+    old_xy = rng.uniform(0, 100, (count, 2))
+    new_xy = rng.uniform(0, 100, (count, 2)) + (500, 0)
+    codes = np.zeros(count, dtype=np.int64)
+
+    cand_new, _cand_old, _distance = _nearest_same_label_candidates(
+        new_xy, codes, old_xy, codes, 0.01, 1000.0, _MOVE_CANDIDATES_PER_LABEL)
+    assert np.bincount(cand_new).max() <= _MOVE_CANDIDATES_PER_LABEL
+
+    moved_new, moved_old, distance = _match_moved_labels(new_xy, codes, old_xy, codes, 0.01)
+
+    assert len(moved_new) == count
+    assert len(set(moved_old.tolist())) == count
+    assert distance.min() >= 400 and distance.max() <= np.hypot(600, 100)
+
+
+def test_moved_labels_match_global_greedy_on_small_inputs():
+    # 候補を近傍に絞っても、少数のラベルでは全ペアを距離順に処理した結果と同じ
+    for seed in range(100):
+        rng = random.Random(seed)
+        n_new, n_old = rng.randint(0, 30), rng.randint(0, 30)
+        new_xy = np.array([(rng.uniform(0, 100), rng.uniform(0, 100)) for _ in range(n_new)]).reshape(-1, 2)
+        old_xy = np.array([(rng.uniform(0, 100), rng.uniform(0, 100)) for _ in range(n_old)]).reshape(-1, 2)
+        new_codes = np.array([rng.randint(0, 3) for _ in range(n_new)], dtype=np.int64)
+        old_codes = np.array([rng.randint(0, 3) for _ in range(n_old)], dtype=np.int64)
+
+        moved_new, moved_old, _distance = _match_moved_labels(new_xy, new_codes, old_xy, old_codes, 0.5)
+
+        pairs = sorted(
+            (float(np.hypot(*(new_xy[i] - old_xy[j]))), i, j)
+            for i in range(n_new) for j in range(n_old) if new_codes[i] == old_codes[j]
+        )
+        used_new, used_old, expected = set(), set(), set()
+        for _d, i, j in pairs:
+            if i not in used_new and j not in used_old:
+                used_new.add(i)
+                used_old.add(j)
+                expected.add((i, j))
+        assert set(zip(moved_new.tolist(), moved_old.tolist())) == expected, f'seed={seed}'
+
+
+def test_neighbor_match_across_rounding_boundary():
+    # 0.0149 と 0.0151 は丸め座標（0.01 / 0.02）が異なるが、距離は許容誤差以内
+    labels_old = [('R1', 0.0149, 5.0)]
+    labels_new = [('R1', 0.0151, 5.0)]
+
+    change_rows, unchanged_entries, _moved = match_labels_with_neighbors(labels_new, labels_old, 0.01)
+    assert change_rows == []
+    assert [(e['label'], e['count']) for e in unchanged_entries] == [('R1', 1)]
+
+    # 従来方式では追加・削除になる
+    rounded_rows, _unchanged = _vectorized_diff(labels_new, labels_old, 0.01)
+    assert len(rounded_rows) == 2
+
+
+def test_neighbor_match_pairs_rename_within_tolerance():
+    labels_old = [('R1', 10.0, 10.0), ('C5', 50.0, 50.0)]
+    labels_new = [('R2', 10.004, 9.997), ('C5', 50.0, 50.0)]
+
+    change_rows, unchanged_entries, _moved = match_labels_with_neighbors(labels_new, labels_old, 0.01)
+    assert change_rows == [{'Coordinate X': 10.0, 'Coordinate Y': 10.0, 'Old Label': 'R1', 'New Label': 'R2'}]
+    assert [e['label'] for e in unchanged_entries] == ['C5']
+
+
+def test_neighbor_match_far_label_is_added_and_deleted():
+    # 許容誤差の外（対角方向で X・Y の差はそれぞれ許容誤差以内だが距離は超える場合も含む）
+    for new_position in ((15.0, 15.0), (10.008, 10.008)):
+        labels_old = [('R1', 10.0, 10.0)]
+        labels_new = [('R1', *new_position)]
+
+        change_rows, unchanged_entries, _moved = match_labels_with_neighbors(labels_new, labels_old, 0.01)
+        assert unchanged_entries == []
+        assert len(change_rows) == 2
+        assert {(r['Old Label'], r['New Label']) for r in change_rows} == {(None, 'R1'), ('R1', None)}
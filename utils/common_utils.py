@@ -17,33 +17,19 @@ def handle_error(e, show_traceback=True):
         st.error(traceback.format_exc())
 
 
-def filter_non_circuit_symbols(labels, debug=False):
-    """機器符号フォーマットに一致しないラベルをフィルタリングする"""
-    patterns = [
+# ラベル分類のカテゴリとパターン
+# 'circuit_symbol': 機器符号フォーマット（filter_non_circuit_symbols で残すラベル）
+# 'standard_symbol': 標準の機器符号（validate_circuit_symbols で妥当とみなすラベル）
+LABEL_CATEGORY_PATTERNS = {
+    'circuit_symbol': [
         r'^[A-Za-z]{2,}$',               # 英文字のみ（2文字以上）
         r'^[A-Za-z]+\d+$',               # 英文字+数字
         r'^[A-Za-z]+\d+[A-Za-z]+$',      # 英文字+数字+英文字
         r'^[A-Za-z]{2,}\([^)]*\)$',      # 英文字のみ+括弧
         r'^[A-Za-z]+\d+\([^)]*\)$',      # 英文字+数字+括弧
         r'^[A-Za-z]+\d+[A-Za-z]+\([^)]*\)$',  # 英文字+数字+英文字+括弧
-    ]
-
-    filtered_labels = []
-    excluded_count = 0
-
-    for label in labels:
-        is_match = any(re.match(p, label) for p in patterns)
-        if is_match:
-            filtered_labels.append(label)
-        else:
-            excluded_count += 1
-
-    return filtered_labels, excluded_count
-
-
-def validate_circuit_symbols(labels):
-    """機器符号の妥当性をチェックし、適合しないものを返す"""
-    standard_patterns = [
+    ],
+    'standard_symbol': [
         r'^CB\d+$', r'^ELB\(CB\)\d+$', r'^MCCB\d+$', r'^NFB\d+$',
         r'^R\d*$', r'^C\d*$', r'^L\d*$', r'^Q\d*$',
         r'^U\d*[A-Z]*$',
@@ -54,30 +40,98 @@ def validate_circuit_symbols(labels):
         r'^H\d*[A-Z]*$', r'^HL\d*$', r'^PL\d*$',
         r'^X\d*[A-Z]*$', r'^CN\d*$', r'^TB\d*$',
         r'^F\d*$', r'^T\d*$', r'^A\d*$',
-    ]
+    ],
+}
+
+
+def _compile_alternation(patterns):
+    """パターン群を1つの選択（alternation）にまとめてコンパイルする。
+
+    各パターンを非捕捉グループで囲むため、re.match での判定結果は
+    「いずれかのパターンに re.match する」と同じになる。
+    """
+    return re.compile('|'.join(f'(?:{p})' for p in patterns))
+
+
+_LABEL_CATEGORY_REGEXES = {
+    category: _compile_alternation(patterns)
+    for category, patterns in LABEL_CATEGORY_PATTERNS.items()
+}
 
-    invalid_symbols = []
-    for label in labels:
-        if not any(re.match(p, label) for p in standard_patterns):
-            invalid_symbols.append(label)
 
-    return invalid_symbols
+def classify_labels(labels, use_pandas=False):
+    """ラベル配列をカテゴリごとに1パスで分類する。
 
+    カテゴリごとにコンパイル済みの結合パターンで判定する（以前はラベルごとに
+    未コンパイルのパターン文字列を1つずつ re.match していた）。use_pandas=True
+    では pandas の文字列演算（Series.str.match）でまとめて判定する。
 
-def process_circuit_symbol_labels(labels, filter_non_parts=False, validate_ref_designators=False, debug=False):
-    """ラベルに対して機器符号処理を統合的に実行する"""
+    Returns:
+        {'masks': {カテゴリ: [bool, ...]}, 'counts': {カテゴリ: 件数, 'total': 総数}}
+        masks は labels と同じ順序。
+    """
+    labels = list(labels)
+    if use_pandas:
+        import pandas as pd
+        series = pd.Series(labels, dtype=object)
+        masks = {
+            category: series.str.match(regex).fillna(False).astype(bool).tolist()
+            for category, regex in _LABEL_CATEGORY_REGEXES.items()
+        }
+    else:
+        matchers = [(category, regex.match) for category, regex in _LABEL_CATEGORY_REGEXES.items()]
+        masks = {category: [] for category, _ in matchers}
+        for label in labels:
+            for category, match in matchers:
+                masks[category].append(match(label) is not None)
+
+    counts = {category: sum(mask) for category, mask in masks.items()}
+    counts['total'] = len(labels)
+    return {'masks': masks, 'counts': counts}
+
+
+def filter_non_circuit_symbols(labels, debug=False):
+    """機器符号フォーマットに一致しないラベルをフィルタリングする"""
+    mask = classify_labels(labels)['masks']['circuit_symbol']
+    filtered_labels = [label for label, keep in zip(labels, mask) if keep]
+    excluded_count = len(mask) - len(filtered_labels)
+
+    return filtered_labels, excluded_count
+
+
+def validate_circuit_symbols(labels):
+    """機器符号の妥当性をチェックし、適合しないものを返す"""
+    mask = classify_labels(labels)['masks']['standard_symbol']
+    return [label for label, valid in zip(labels, mask) if not valid]
+
+
+def process_circuit_symbol_labels(labels, filter_non_parts=False, validate_ref_designators=False, debug=False,
+                                  use_pandas=False):
+    """ラベルに対して機器符号処理を統合的に実行する
+
+    フィルタリングと妥当性チェックは classify_labels() の1回の分類結果から
+    求める。filter_non_parts=True のときは 'category_counts'
+    （classify_labels の counts）も返す。
+    """
     result = {
         'labels': labels.copy(),
         'filtered_count': 0,
-        'invalid_ref_designators': []
+        'invalid_ref_designators': [],
+        'category_counts': {},
     }
 
     if filter_non_parts:
-        filtered_labels, filtered_count = filter_non_circuit_symbols(labels, debug)
-        result['labels'] = filtered_labels
-        result['filtered_count'] = filtered_count
-
-    if validate_ref_designators and filter_non_parts:
-        result['invalid_ref_designators'] = validate_circuit_symbols(result['labels'])
+        classification = classify_labels(labels, use_pandas=use_pandas)
+        masks = classification['masks']
+        result['labels'] = [label for label, keep in zip(labels, masks['circuit_symbol']) if keep]
+        result['filtered_count'] = len(labels) - len(result['labels'])
+        result['category_counts'] = classification['counts']
+
+        if validate_ref_designators:
+            result['invalid_ref_designators'] = [
+                label for label, keep, valid
+                in zip(labels, masks['circuit_symbol'], masks['standard_symbol'])
+                if keep and not valid
+            ]
 
     return result
@@ -1,8 +1,10 @@
 import ezdxf
+from ezdxf.path import from_hatch_boundary_path
+from ezdxf.render import MeshBuilder
 import hashlib
-import json
+import io
 import math
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from pathlib import Path
 from typing import Dict, List, Tuple, Set, Optional, Any
 from decimal import Decimal, getcontext
@@ -11,6 +13,8 @@ import numpy as np
 import tempfile
 import os
 import gc
+import threading
+import time
 
 # 高精度計算設定
 getcontext().prec = 50
@@ -18,6 +22,26 @@ getcontext().prec = 50
 logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 差分DXFの出力モード
+OUTPUT_MODE_FULL = 'full'                                   # 従来どおり UNCHANGED を全件出力
+OUTPUT_MODE_CHANGES_ONLY = 'changes_only'                   # DELETED / ADDED のみ出力
+OUTPUT_MODE_CHANGES_WITH_CONTEXT = 'changes_with_context'   # 差分 + 簡略化した CONTEXT レイヤー
+OUTPUT_MODES = (OUTPUT_MODE_FULL, OUTPUT_MODE_CHANGES_ONLY, OUTPUT_MODE_CHANGES_WITH_CONTEXT)
+
+# レイアウト別比較でモデル空間を表す名前（ezdxf のレイアウト名と同じ）
+MODEL_LAYOUT_NAME = 'Model'
+
+# 展開時にジオメトリ記述子（ExpandedEntity.descriptor）を作成する複合エンティティ
+DESCRIPTOR_TYPES = ('SPLINE', 'HATCH', 'POLYLINE', 'DIMENSION', 'LEADER')
+
+# DIMENSION の定義点（記述子の points の行順）
+DIMENSION_POINT_ATTRS = ('defpoint', 'defpoint2', 'defpoint3', 'defpoint4', 'defpoint5', 'text_midpoint')
+
+# POLYLINE 記述子の種別（codes[0]）
+POLYLINE_KIND_2D = 0
+POLYLINE_KIND_3D = 1
+POLYLINE_KIND_MESH = 2
+
 
 class ToleranceConfig:
     """許容誤差設定クラス"""
@@ -29,6 +53,8 @@ class ToleranceConfig:
         self.text_position_tolerance = base_tolerance * 2
         self.angle_tolerance = 0.1
         self.length_tolerance = base_tolerance
+        self.bulge_tolerance = 1e-4  # LWPOLYLINE の bulge（tan(中心角/4)、無次元）
+        self.parameter_tolerance = 1e-4  # SPLINE のノット・重み、角度寸法値などの無次元パラメータ
         
     def get_tolerance_for_entity(self, entity_type: str, attribute: str = None) -> float:
         """エンティティタイプ・属性に応じた許容誤差を取得"""
@@ -42,6 +68,73 @@ class ToleranceConfig:
             return self.coordinate_tolerance
 
 
+class FilterConfig:
+    """展開前に適用するレイヤー・ブロック名・エンティティタイプのフィルタ設定
+
+    include_* を指定した場合はそれに含まれるものだけを対象にし、exclude_* に含まれるものは
+    常に除外する。名前は DXF と同じく大文字・小文字を区別しない。
+    - レイヤー: ブロック内のレイヤー "0" のエンティティは INSERT のレイヤーで判定する
+    - ブロック名: INSERT にのみ適用する（モデルスペース直下のエンティティは対象外）
+    - エンティティタイプ: 展開後のタイプ（LINE, TEXT, ATTRIB 等）で判定する。
+      INSERT は exclude_types に含めた場合のみブロック参照ごと除外する
+    """
+
+    def __init__(self, include_layers=None, exclude_layers=None,
+                 include_blocks=None, exclude_blocks=None,
+                 include_types=None, exclude_types=None):
+        self.include_layers = self._normalize(include_layers)
+        self.exclude_layers = self._normalize(exclude_layers) or frozenset()
+        self.include_blocks = self._normalize(include_blocks)
+        self.exclude_blocks = self._normalize(exclude_blocks) or frozenset()
+        self.include_types = self._normalize(include_types)
+        self.exclude_types = self._normalize(exclude_types) or frozenset()
+
+    @staticmethod
+    def _normalize(names) -> Optional[frozenset]:
+        """名前のリスト（またはカンマ区切り文字列）を大文字の frozenset に変換（未指定は None）"""
+        if names is None:
+            return None
+        if isinstance(names, str):
+            names = names.split(',')
+        normalized = frozenset(name.strip().upper() for name in names if name and name.strip())
+        return normalized or None
+
+    def is_active(self) -> bool:
+        """いずれかのフィルタが指定されているか"""
+        return any([self.include_layers, self.exclude_layers, self.include_blocks,
+                    self.exclude_blocks, self.include_types, self.exclude_types])
+
+    def accepts_insert(self, insert_entity) -> bool:
+        """INSERT を展開するか（ブロック名と INSERT 自体の除外指定で判定）"""
+        if 'INSERT' in self.exclude_types:
+            return False
+        block_name = insert_entity.dxf.name.upper()
+        if self.include_blocks is not None and block_name not in self.include_blocks:
+            return False
+        return block_name not in self.exclude_blocks
+
+    def accepts(self, entity, insert_layer: Optional[str] = None) -> bool:
+        """エンティティを展開・ハッシュ化の対象にするか（タイプとレイヤーで判定）"""
+        entity_type = entity.dxftype()
+        if entity_type in self.exclude_types:
+            return False
+        if self.include_types is not None and entity_type not in self.include_types:
+            return False
+        layer = entity.dxf.get('layer', '0')
+        if insert_layer is not None and layer == '0':
+            layer = insert_layer
+        layer = layer.upper()
+        if self.include_layers is not None and layer not in self.include_layers:
+            return False
+        return layer not in self.exclude_layers
+
+    def cache_key(self) -> tuple:
+        """結果キャッシュのキーに使うタプル"""
+        return tuple(tuple(sorted(names)) if names else None
+                     for names in (self.include_layers, self.exclude_layers, self.include_blocks,
+                                   self.exclude_blocks, self.include_types, self.exclude_types))
+
+
 class CoordinateTransformer:
     """座標変換専用クラス"""
     
@@ -133,6 +226,28 @@ class CoordinateTransformer:
             logger.warning(f"Error creating transformation matrix: {e}")
             return np.eye(4, dtype=np.float64)
     
+    def create_grid_offsets(self, insert_entity) -> Optional[np.ndarray]:
+        """MINSERT の各グリッド要素の平行移動量を (k, 3) 配列で返す（通常の INSERT は None）
+
+        グリッドは INSERT の回転のみを受け、スケールは適用しない（ezdxf の multi_insert と同じ）。
+        間隔が 0 の方向は1要素として扱う。
+        """
+        dxf = insert_entity.dxf
+        row_spacing = float(dxf.get('row_spacing', 0.0))
+        column_spacing = float(dxf.get('column_spacing', 0.0))
+        row_count = int(dxf.get('row_count', 1)) if row_spacing else 1
+        column_count = int(dxf.get('column_count', 1)) if column_spacing else 1
+        if row_count * column_count <= 1:
+            return None
+
+        rows, columns = np.meshgrid(np.arange(row_count), np.arange(column_count), indexing='ij')
+        local = np.column_stack([columns.ravel() * column_spacing, rows.ravel() * row_spacing])
+        rotation = math.radians(float(dxf.get('rotation', 0.0)))
+        cos_r, sin_r = math.cos(rotation), math.sin(rotation)
+        offsets = np.zeros((len(local), 3), dtype=np.float64)
+        offsets[:, :2] = local @ np.array([[cos_r, sin_r], [-sin_r, cos_r]])
+        return offsets
+
     def transform_point(self, point: Tuple[float, float, float], 
                        transform_matrix: np.ndarray) -> Tuple[float, float, float]:
         """点を変換行列で変換"""
@@ -160,14 +275,144 @@ class CoordinateTransformer:
             return (1.0, 1.0, 1.0)
 
 
+class ExpandedEntity:
+    """絶対座標に展開済みのエンティティ（署名生成と差分出力に必要な情報のみ保持）
+
+    dxftype: エンティティタイプ
+    attributes: 絶対座標に変換済みのDXF属性（出力時の dxfattribs にも使う）
+    text_content: テキスト内容（TEXT / MTEXT / ATTRIB 等）
+    scale_factors: INSERT のスケール（等倍の場合は None）
+    attrib_tag: ATTRIB タグ（署名用）
+    instance_count: 同一署名のインスタンス数（DiffAnalyzer が集計）
+    descriptor: 複合エンティティ（DESCRIPTOR_TYPES）のジオメトリ記述子（それ以外は None）
+
+    descriptor は numpy 配列の辞書で、キーごとに扱いが決まっている。
+      points  (n, 3): 制御点・境界点・定義点など（絶対座標に変換済み）
+      widths  (n, 2): POLYLINE 頂点の始点幅・終点幅（INSERT スケール適用済み）
+      bulges  (n,):   POLYLINE 頂点の bulge（鏡像変換で符号反転済み）
+      lengths (k,):   長さ寸法値・ハッチングパターン尺度など（INSERT スケール適用済み）
+      params  (k,):   ノット・重み・角度など座標変換の影響を受けない数値
+      codes   (k,):   次数・フラグ・要素数・パスコマンド・面インデックスなどの整数列
+      label   str:    パターン名・寸法スタイル・寸法テキストなど
+    """
+
+    __slots__ = ('dxftype', 'attributes', 'text_content', 'scale_factors', 'attrib_tag', 'instance_count',
+                 'descriptor')
+
+    def __init__(self, dxftype: str, attributes: Dict, text_content: Optional[str] = None,
+                 scale_factors: Optional[Tuple[float, float, float]] = None, attrib_tag: str = '',
+                 descriptor: Optional[Dict[str, Any]] = None):
+        self.dxftype = dxftype
+        self.attributes = attributes
+        self.text_content = text_content
+        self.scale_factors = scale_factors
+        self.attrib_tag = attrib_tag
+        self.instance_count = 1
+        self.descriptor = descriptor
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+
+class DeferredExpandedEntity:
+    """列指向テーブルの行から、必要になった時点で ExpandedEntity を組み立てる代理オブジェクト
+
+    GeometryTableBuilder はテーブル化したエンティティを ExpandedEntity にせずに集計するため、
+    重複除去後の代表行だけをこの代理オブジェクトで保持する。dxftype / instance_count / layer は
+    展開せずに参照でき、attributes など ExpandedEntity の他の属性に触れた時点（出力DXFへの
+    書き出し時など）で EntityExpander.build_absolute_entity で変換する。
+    保持するのは snapshot_entity で取り出した値だけで、ezdxf のエンティティ（とその
+    ドキュメント）は参照しない。展開後は変換元の値を解放する。
+    """
+
+    __slots__ = ('dxftype', 'instance_count', '_source', '_entity')
+
+    def __init__(self, dxftype: str, attributes: Dict, text_content: Optional[str],
+                 transform_matrix: np.ndarray, grid_offset: Optional[np.ndarray],
+                 expander: 'EntityExpander'):
+        self.dxftype = dxftype
+        self.instance_count = 1
+        self._source = (attributes, text_content, transform_matrix, grid_offset, expander)
+        self._entity = None
+
+    @property
+    def layer(self) -> str:
+        """展開元エンティティのレイヤー（ExpandedEntity の attributes['layer'] と同じ値）"""
+        if self._entity is not None:
+            return self._entity.attributes.get('layer', '0')
+        return self._source[0].get('layer', '0')
+
+    def materialize(self) -> ExpandedEntity:
+        """ExpandedEntity を組み立てて返す（2回目以降は組み立て済みのものを返す）"""
+        entity = self._entity
+        if entity is None:
+            attributes, text_content, transform_matrix, grid_offset, expander = self._source
+            try:
+                entity = expander.build_absolute_entity(self.dxftype, attributes, transform_matrix,
+                                                        text_content=text_content)
+            except Exception as e:
+                logger.warning(f"Error transforming entity {self.dxftype}: {e}")
+                entity = ExpandedEntity(self.dxftype, {})
+            else:
+                if grid_offset is not None:
+                    entity = expander.replicate_on_grid(entity, np.array([np.zeros(3), grid_offset]))[1]
+            self._entity = entity
+            self._source = None
+        entity.instance_count = self.instance_count
+        return entity
+
+    def __getattr__(self, name):
+        # __slots__ 以外の属性（attributes / text_content など）は展開して参照する
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.materialize(), name)
+
+    def __reduce__(self):
+        # 展開済みなら ExpandedEntity として、未展開なら変換元の値のまま保存する
+        if self._entity is not None:
+            return _expanded_entity_from_state, (self.materialize().__getstate__(),)
+        return _deferred_entity_from_state, (self.dxftype, self.instance_count, self._source)
+
+
+def _expanded_entity_from_state(state: tuple) -> ExpandedEntity:
+    """pickle 用: ExpandedEntity.__getstate__ の値から ExpandedEntity を復元"""
+    entity = ExpandedEntity.__new__(ExpandedEntity)
+    entity.__setstate__(state)
+    return entity
+
+
+def _deferred_entity_from_state(dxftype: str, instance_count: int, source: tuple) -> DeferredExpandedEntity:
+    """pickle 用: 未展開の DeferredExpandedEntity を復元"""
+    entity = DeferredExpandedEntity(dxftype, *source)
+    entity.instance_count = instance_count
+    return entity
+
+
+def entity_layer(absolute_entity) -> str:
+    """ExpandedEntity / DeferredExpandedEntity のレイヤー名（代理オブジェクトは展開しない）"""
+    if isinstance(absolute_entity, DeferredExpandedEntity):
+        return absolute_entity.layer
+    return absolute_entity.attributes.get('layer', '0')
+
+
 class EntityExpander:
     """INSERTエンティティ展開専用クラス"""
 
+    # 絶対座標に変換する点属性
+    COORDINATE_ATTRS = ('insert', 'center', 'start', 'end', 'location', 'base_point')
+
     def __init__(self, transformer: CoordinateTransformer, debug: bool = False,
-                 global_offset: Optional[Tuple[float, float]] = None):
+                 global_offset: Optional[Tuple[float, float]] = None,
+                 filter_config: Optional[FilterConfig] = None):
         self.transformer = transformer
         self.debug = debug
         self.global_offset = global_offset  # グローバルオフセット (dx, dy)
+        # 展開前に適用するフィルタ（除外したエンティティは変換もハッシュ化もしない）
+        self.filter_config = filter_config if filter_config is not None and filter_config.is_active() else None
         self.excluded_attributes = {
             'handle', 'owner', 'reactors', 'dictionary', 'extension_dict',
             'objectid', 'uuid', 'app_data', 'doc', 'entitydb', 'is_alive',
@@ -184,8 +429,9 @@ class EntityExpander:
             # LWPOLYLINE特別処理
             if entity.dxftype() == 'LWPOLYLINE':
                 vertices = self._extract_lwpolyline_vertices(entity)
-                if vertices:
+                if vertices is not None and len(vertices):
                     clean_attrs['vertices'] = vertices
+                    clean_attrs['closed'] = bool(getattr(entity, 'closed', False))
             
             return clean_attrs
             
@@ -194,63 +440,237 @@ class EntityExpander:
                 logger.debug(f"Error getting attributes for {entity.dxftype()}: {e}")
             return {}
     
-    def _extract_lwpolyline_vertices(self, entity) -> List[Tuple[float, float]]:
-        """LWPOLYLINE頂点情報を抽出"""
-        vertices = []
-        
-        # 複数の方法で頂点を取得を試行
-        methods = [
-            lambda: list(entity.get_points()) if hasattr(entity, 'get_points') else [],
-            lambda: [(v.x, v.y) for v in entity.vertices] if hasattr(entity, 'vertices') else [],
-            lambda: [(v[0], v[1]) for v in entity.vertices] if hasattr(entity, 'vertices') else []
-        ]
-        
-        for method in methods:
-            try:
-                points = method()
-                if points:
-                    vertices = [(float(p[0]), float(p[1])) for p in points if len(p) >= 2]
-                    break
-            except Exception:
-                continue
-        
-        return vertices
+    def _extract_lwpolyline_vertices(self, entity) -> Optional[np.ndarray]:
+        """LWPOLYLINE頂点情報を (x, y, start_width, end_width, bulge) の (n, 5) 配列として抽出"""
+        # ezdxf は頂点を (n, 5) の配列で保持しているため、そのままコピーする
+        try:
+            values = np.array(entity.lwpoints.values, dtype=np.float64)
+            if values.size:
+                return values.reshape(-1, 5)
+        except Exception:
+            pass
+
+        try:
+            points = list(entity.get_points('xyseb'))
+            if points:
+                return np.asarray(points, dtype=np.float64).reshape(-1, 5)
+        except Exception:
+            pass
+
+        return None
     
-    def transform_entity_to_absolute(self, entity, transform_matrix: np.ndarray) -> Optional[Dict]:
+    def transform_entity_to_absolute(self, entity, transform_matrix: np.ndarray) -> Optional[ExpandedEntity]:
         """エンティティを絶対座標に変換"""
         try:
             entity_type = entity.dxftype()
-            clean_attrs = self.safe_get_dxf_attributes(entity)
-            transformed_attrs = clean_attrs.copy()
-            
-            # スケールファクターを抽出
-            scale_x, scale_y, scale_z = self.transformer.extract_scale_factors(transform_matrix)
-            is_scaled = not all(math.isclose(s, 1.0, rel_tol=1e-6) for s in [scale_x, scale_y, scale_z])
-            
-            # 座標属性を変換
-            self._transform_coordinate_attributes(clean_attrs, transformed_attrs, transform_matrix)
-            
-            # サイズ関連属性の変換
-            if is_scaled:
-                self._transform_size_attributes(entity_type, clean_attrs, transformed_attrs, 
-                                              scale_x, scale_y, scale_z)
-            
-            # テキスト内容の取得
-            text_content = getattr(entity, 'text', None) or getattr(entity.dxf, 'text', None)
-            
-            return {
-                'dxftype': entity_type,
-                'attributes': transformed_attrs,
-                'text_content': text_content,
-                'is_transformed': True,
-                'original_entity_id': id(entity),
-                'scale_factors': (scale_x, scale_y, scale_z) if is_scaled else None
-            }
-            
+            clean_attrs, text_content = self.snapshot_entity(entity)
+
+            # 複合エンティティのジオメトリ記述子
+            descriptor = None
+            if entity_type in DESCRIPTOR_TYPES:
+                descriptor = self.extract_descriptor(entity)
+
+            return self.build_absolute_entity(entity_type, clean_attrs, transform_matrix,
+                                              text_content=text_content, descriptor=descriptor)
+
         except Exception as e:
             logger.warning(f"Error transforming entity {entity.dxftype()}: {e}")
             return None
-    
+
+    def snapshot_entity(self, entity) -> Tuple[Dict, Optional[str]]:
+        """変換に必要な値（ブロック座標系の DXF 属性・テキスト内容）だけを取り出す
+
+        戻り値はドキュメントを参照しないため、ドキュメントを解放した後でも
+        build_absolute_entity で ExpandedEntity を組み立てられる。
+        """
+        clean_attrs = self.safe_get_dxf_attributes(entity)
+        # テキスト内容の取得（DIMENSION の text は寸法テキストのオーバーライドなので記述子側で扱う）
+        text_content = None
+        if entity.dxftype() != 'DIMENSION':
+            text_content = getattr(entity, 'text', None) or getattr(entity.dxf, 'text', None)
+        return clean_attrs, text_content
+
+    def build_absolute_entity(self, entity_type: str, clean_attrs: Dict, transform_matrix: np.ndarray,
+                              text_content: Optional[str] = None,
+                              descriptor: Optional[Dict[str, Any]] = None) -> ExpandedEntity:
+        """snapshot_entity の値を絶対座標に変換して ExpandedEntity を組み立てる"""
+        transformed_attrs = clean_attrs.copy()
+
+        # スケールファクターを抽出
+        scale_x, scale_y, scale_z = self.transformer.extract_scale_factors(transform_matrix)
+        is_scaled = not all(math.isclose(s, 1.0, rel_tol=1e-6) for s in [scale_x, scale_y, scale_z])
+
+        # 座標属性を変換
+        self._transform_coordinate_attributes(clean_attrs, transformed_attrs, transform_matrix)
+
+        # サイズ関連属性の変換
+        if is_scaled:
+            self._transform_size_attributes(entity_type, clean_attrs, transformed_attrs,
+                                            scale_x, scale_y, scale_z)
+
+        if descriptor is not None:
+            self._transform_descriptor(descriptor, transform_matrix, scale_x, scale_y)
+
+        return ExpandedEntity(
+            entity_type,
+            transformed_attrs,
+            text_content=text_content,
+            scale_factors=(scale_x, scale_y, scale_z) if is_scaled else None,
+            descriptor=descriptor
+        )
+
+    def extract_descriptor(self, entity) -> Optional[Dict[str, Any]]:
+        """複合エンティティのジオメトリ記述子をブロック座標系のまま抽出"""
+        entity_type = entity.dxftype()
+        try:
+            if entity_type == 'SPLINE':
+                return self._spline_descriptor(entity)
+            elif entity_type == 'HATCH':
+                return self._hatch_descriptor(entity)
+            elif entity_type == 'POLYLINE':
+                return self._polyline_descriptor(entity)
+            elif entity_type == 'DIMENSION':
+                return self._dimension_descriptor(entity)
+            elif entity_type == 'LEADER':
+                return self._leader_descriptor(entity)
+        except Exception as e:
+            if self.debug:
+                logger.debug(f"Error extracting descriptor for {entity_type}: {e}")
+        return None
+
+    @staticmethod
+    def _points_array(points) -> np.ndarray:
+        """点列を (n, 3) 配列に変換"""
+        return np.array([(p[0], p[1], p[2] if len(p) > 2 else 0.0) for p in points],
+                        dtype=np.float64).reshape(-1, 3)
+
+    def _spline_descriptor(self, entity) -> Dict[str, Any]:
+        """SPLINE: 制御点＋フィット点、ノット・重み、次数とフラグ"""
+        control_points = self._points_array(entity.control_points)
+        fit_points = self._points_array(entity.fit_points)
+        knots = np.asarray(entity.knots, dtype=np.float64)
+        weights = np.asarray(entity.weights, dtype=np.float64)
+        return {
+            'points': np.vstack([control_points, fit_points]),
+            'params': np.concatenate([knots, weights]),
+            'codes': np.array([entity.dxf.get('degree', 3), entity.dxf.get('flags', 0),
+                               len(control_points), len(fit_points), len(knots), len(weights)],
+                              dtype=np.int64),
+        }
+
+    def _hatch_descriptor(self, entity) -> Dict[str, Any]:
+        """HATCH: 境界パスを直線・ベジェ曲線のコマンド列に正規化した点列
+
+        codes は [塗りつぶし, パス数, (パスフラグ, コマンド数, コマンド種別...) × パス数]。
+        points はパスごとに始点、続いて各コマンドの制御点と終点を並べる。
+        """
+        codes = [int(entity.dxf.get('solid_fill', 1)), 0]
+        points = []
+        ocs = entity.ocs()
+        elevation = entity.dxf.elevation.z
+        for boundary in entity.paths:
+            path = from_hatch_boundary_path(boundary, ocs, elevation=elevation)
+            for sub_path in (path.sub_paths() if path.has_sub_paths else [path]):
+                commands = list(sub_path.commands())
+                codes.extend([boundary.path_type_flags, len(commands)])
+                points.append(sub_path.start)
+                for command in commands:
+                    codes.append(int(command.type))
+                    points.extend(command[1:])  # 制御点（ctrl / ctrl1, ctrl2）
+                    points.append(command.end)
+                codes[1] += 1
+        descriptor = {
+            'points': self._points_array(points),
+            'codes': np.asarray(codes, dtype=np.int64),
+            'label': entity.dxf.get('pattern_name', ''),
+        }
+        if not codes[0]:
+            # パターン尺度・角度はパターン塗りつぶしのときだけ意味を持つ
+            descriptor['lengths'] = np.array([entity.dxf.get('pattern_scale', 1.0)], dtype=np.float64)
+            descriptor['params'] = np.array([entity.dxf.get('pattern_angle', 0.0)], dtype=np.float64)
+        return descriptor
+
+    def _polyline_descriptor(self, entity) -> Dict[str, Any]:
+        """POLYLINE: 2D/3D は頂点・幅・bulge、ポリフェース/ポリゴンメッシュは頂点と面"""
+        if entity.is_poly_face_mesh or entity.is_polygon_mesh:
+            mesh = MeshBuilder.from_polyface(entity)
+            codes = [POLYLINE_KIND_MESH, len(mesh.faces)]
+            for face in mesh.faces:
+                codes.append(len(face))
+                codes.extend(face)
+            return {
+                'points': self._points_array(mesh.vertices),
+                'codes': np.asarray(codes, dtype=np.int64),
+            }
+
+        vertices = list(entity.vertices)
+        kind = POLYLINE_KIND_3D if entity.is_3d_polyline else POLYLINE_KIND_2D
+        descriptor = {
+            'points': self._points_array([v.dxf.location for v in vertices]),
+            'codes': np.array([kind, int(entity.is_closed)], dtype=np.int64),
+        }
+        if kind == POLYLINE_KIND_2D:
+            default_start = entity.dxf.get('default_start_width', 0.0)
+            default_end = entity.dxf.get('default_end_width', 0.0)
+            descriptor['widths'] = np.array(
+                [(v.dxf.get('start_width', default_start), v.dxf.get('end_width', default_end))
+                 for v in vertices], dtype=np.float64).reshape(-1, 2)
+            descriptor['bulges'] = np.array([v.dxf.get('bulge', 0.0) for v in vertices], dtype=np.float64)
+        return descriptor
+
+    def _dimension_descriptor(self, entity) -> Dict[str, Any]:
+        """DIMENSION: 定義点（固定6点）、寸法値、寸法タイプ、寸法スタイルとテキスト"""
+        points = np.zeros((len(DIMENSION_POINT_ATTRS), 3), dtype=np.float64)
+        present = 0
+        for i, attr_name in enumerate(DIMENSION_POINT_ATTRS):
+            if entity.dxf.hasattr(attr_name):
+                points[i] = tuple(entity.dxf.get(attr_name))
+                present |= 1 << i
+        # フラグ 32（寸法ジオメトリブロックの参照）は描画状態なので比較対象から外す
+        dimtype = entity.dxf.get('dimtype', 0) & ~32
+        measurement = entity.get_measurement()
+        measurement = float(measurement) if isinstance(measurement, (int, float)) else 0.0
+        descriptor = {
+            'points': points,
+            'params': np.array([entity.dxf.get('angle', 0.0)], dtype=np.float64),
+            'codes': np.array([dimtype, present], dtype=np.int64),
+            'label': f"{entity.dxf.get('dimstyle', 'Standard')}|{entity.dxf.get('text', '')}",
+        }
+        # 角度寸法（2: 2線, 5: 3点）の寸法値はスケールの影響を受けない
+        if dimtype & 0x0F in (2, 5):
+            descriptor['params'] = np.append(descriptor['params'], measurement)
+        else:
+            descriptor['lengths'] = np.array([measurement], dtype=np.float64)
+        return descriptor
+
+    def _leader_descriptor(self, entity) -> Dict[str, Any]:
+        """LEADER: 頂点列、矢印・パス種別・注釈種別、寸法スタイル"""
+        return {
+            'points': self._points_array(entity.vertices),
+            'codes': np.array([entity.dxf.get('has_arrowhead', 1), entity.dxf.get('path_type', 0),
+                               entity.dxf.get('annotation_type', 3)], dtype=np.int64),
+            'label': entity.dxf.get('dimstyle', 'Standard'),
+        }
+
+    def _transform_descriptor(self, descriptor: Dict[str, Any], transform_matrix: np.ndarray,
+                              scale_x: float, scale_y: float):
+        """記述子の点列を1回の行列積で絶対座標に変換し、長さ系の値にスケールを適用"""
+        points = descriptor['points']
+        if len(points):
+            points = points @ transform_matrix[:3, :3].T + transform_matrix[:3, 3]
+            if self.global_offset is not None:
+                points[:, :2] += self.global_offset
+            descriptor['points'] = points
+
+        avg_scale = (scale_x + scale_y) / 2.0
+        for key in ('widths', 'lengths'):
+            if key in descriptor:
+                descriptor[key] = descriptor[key] * avg_scale
+
+        # 鏡像変換（行列式が負）では円弧の向きが反転する
+        if 'bulges' in descriptor and np.linalg.det(transform_matrix[:2, :2]) < 0:
+            descriptor['bulges'] = -descriptor['bulges']
+
     def _apply_global_offset(self, point: Tuple[float, float, float]) -> Tuple[float, float, float]:
         """グローバルオフセットを適用"""
         if self.global_offset is None:
@@ -262,9 +682,7 @@ class EntityExpander:
     def _transform_coordinate_attributes(self, clean_attrs: Dict, transformed_attrs: Dict,
                                        transform_matrix: np.ndarray):
         """座標属性を変換"""
-        coordinate_attrs = ['insert', 'center', 'start', 'end', 'location', 'base_point']
-
-        for attr_name in coordinate_attrs:
+        for attr_name in self.COORDINATE_ATTRS:
             if attr_name in clean_attrs:
                 original_point = clean_attrs[attr_name]
                 try:
@@ -304,20 +722,19 @@ class EntityExpander:
             except Exception:
                 pass
         
-        # LWPOLYLINE頂点の変換
+        # LWPOLYLINE頂点の変換（全頂点を1回の行列積で変換）
         if 'vertices' in clean_attrs:
             original_vertices = clean_attrs['vertices']
-            transformed_vertices = []
+            transformed_vertices = original_vertices.copy()
 
-            for vertex in original_vertices:
-                if len(vertex) >= 2:
-                    vertex_3d = (vertex[0], vertex[1], 0.0) if len(vertex) == 2 else vertex
-                    transformed_vertex = self.transformer.transform_point(vertex_3d, transform_matrix)
+            linear = transform_matrix[:2, :2]
+            transformed_vertices[:, :2] = original_vertices[:, :2] @ linear.T + transform_matrix[:2, 3]
+            if self.global_offset is not None:
+                transformed_vertices[:, :2] += self.global_offset
 
-                    # グローバルオフセットを適用
-                    transformed_vertex = self._apply_global_offset(transformed_vertex)
-
-                    transformed_vertices.append(transformed_vertex[:2])
+            # 鏡像変換（行列式が負）では円弧の向きが反転する
+            if np.linalg.det(linear) < 0:
+                transformed_vertices[:, 4] = -transformed_vertices[:, 4]
 
             transformed_attrs['vertices'] = transformed_vertices
     
@@ -345,64 +762,126 @@ class EntityExpander:
         
         if entity_type in ['TEXT', 'MTEXT', 'ATTRIB'] and 'height' in clean_attrs:
             transformed_attrs['height'] = clean_attrs['height'] * scale_y
+
+        if entity_type == 'LWPOLYLINE' and 'vertices' in transformed_attrs:
+            avg_scale = (scale_x + scale_y) / 2.0
+            transformed_attrs['vertices'][:, 2:4] *= avg_scale
+            if 'const_width' in clean_attrs:
+                transformed_attrs['const_width'] = clean_attrs['const_width'] * avg_scale
     
-    def expand_insert_entities(self, doc, doc_label: str) -> List[Dict]:
-        """INSERTエンティティを展開して絶対座標エンティティリストを作成"""
+    def replicate_on_grid(self, template: ExpandedEntity, grid_offsets: np.ndarray) -> List[ExpandedEntity]:
+        """1要素目として変換済みのエンティティを MINSERT の全グリッド要素に配置
+
+        グリッド要素間の違いは平行移動だけなので、ブロック内エンティティの変換は1回で済ませ、
+        座標属性・頂点・記述子の点列をそれぞれ全要素分まとめて (k, n, 3) の配列演算で移動する。
+        """
+        attrs = template.attributes
+        point_names = [name for name in self.COORDINATE_ATTRS
+                       if isinstance(attrs.get(name), tuple) and len(attrs[name]) == 3]
+        moved_points = None
+        if point_names:
+            base = np.array([attrs[name] for name in point_names], dtype=np.float64)
+            moved_points = (base[None, :, :] + grid_offsets[:, None, :]).tolist()
+
+        moved_vertices = None
+        if 'vertices' in attrs:
+            moved_vertices = np.repeat(attrs['vertices'][None, :, :], len(grid_offsets), axis=0)
+            moved_vertices[:, :, :2] += grid_offsets[:, None, :2]
+
+        descriptor = template.descriptor
+        moved_descriptor_points = None
+        if descriptor is not None:
+            moved_descriptor_points = descriptor['points'][None, :, :] + grid_offsets[:, None, :]
+
+        replicas = [template]  # 1要素目（移動量 0）はテンプレートそのもの
+        for i in range(1, len(grid_offsets)):
+            cell_attrs = dict(attrs)
+            if moved_points is not None:
+                for name, point in zip(point_names, moved_points[i]):
+                    cell_attrs[name] = tuple(point)
+            if moved_vertices is not None:
+                cell_attrs['vertices'] = moved_vertices[i]
+            cell_descriptor = None
+            if descriptor is not None:
+                cell_descriptor = dict(descriptor, points=moved_descriptor_points[i])
+            replicas.append(ExpandedEntity(
+                template.dxftype, cell_attrs,
+                text_content=template.text_content,
+                scale_factors=template.scale_factors,
+                attrib_tag=template.attrib_tag,
+                descriptor=cell_descriptor))
+        return replicas
+
+    def expand_insert_entities(self, doc, doc_label: str, layout=None,
+                               table_builder: Optional['GeometryTableBuilder'] = None) -> List[ExpandedEntity]:
+        """INSERTエンティティを展開して絶対座標エンティティリストを作成
+
+        layout を指定した場合はそのレイアウト（ペーパー空間）を、省略時はモデル空間を展開する。
+        table_builder を指定した場合、テーブル化できるエンティティは ExpandedEntity を作らずに
+        table_builder.add_source でタイプ別の列に直接追加し、戻り値には含めない。
+        """
         expanded_entities = []
+        filter_config = self.filter_config
         
-        msp = doc.modelspace()
-        for entity in msp:
+        space = layout if layout is not None else doc.modelspace()
+        for entity in space:
             entity_type = entity.dxftype()
             
             if entity_type == 'INSERT':
+                if filter_config is not None and not filter_config.accepts_insert(entity):
+                    continue
                 try:
                     transform_matrix = self.transformer.create_transformation_matrix(entity)
+                    # MINSERT: グリッド要素ごとの平行移動量（通常の INSERT は None）
+                    grid_offsets = self.transformer.create_grid_offsets(entity)
                     block_name = entity.dxf.name
+                    insert_layer = entity.dxf.get('layer', '0')
                     
                     if block_name in doc.blocks:
                         block = doc.blocks[block_name]
+                        matrix_id = table_builder.add_matrix(transform_matrix) if table_builder is not None else None
                         
                         # ブロック内エンティティを変換
                         for block_entity in block:
                             if block_entity.dxftype() not in ['ATTDEF']:
+                                if filter_config is not None and not filter_config.accepts(block_entity, insert_layer):
+                                    continue
+                                if matrix_id is not None and table_builder.add_source(block_entity, matrix_id, grid_offsets):
+                                    continue
                                 absolute_entity = self.transform_entity_to_absolute(
                                     block_entity, transform_matrix)
                                 if absolute_entity:
-                                    absolute_entity['insert_info'] = {
-                                        'block_name': block_name,
-                                        'insert_point': tuple(entity.dxf.insert),
-                                        'rotation': getattr(entity.dxf, 'rotation', 0.0),
-                                        'scale': (
-                                            getattr(entity.dxf, 'xscale', 1.0),
-                                            getattr(entity.dxf, 'yscale', 1.0),
-                                            getattr(entity.dxf, 'zscale', 1.0)
-                                        )
-                                    }
-                                    expanded_entities.append(absolute_entity)
+                                    if grid_offsets is None:
+                                        expanded_entities.append(absolute_entity)
+                                    else:
+                                        expanded_entities.extend(self.replicate_on_grid(absolute_entity, grid_offsets))
                         
                         # ATTRIB処理
                         if hasattr(entity, 'attribs'):
+                            identity_matrix = np.eye(4)
                             for attrib in entity.attribs:
-                                identity_matrix = np.eye(4)
+                                if filter_config is not None and not filter_config.accepts(attrib, insert_layer):
+                                    continue
                                 absolute_attrib = self.transform_entity_to_absolute(
                                     attrib, identity_matrix)
                                 if absolute_attrib:
-                                    absolute_attrib['insert_info'] = {
-                                        'block_name': block_name,
-                                        'insert_point': tuple(entity.dxf.insert),
-                                        'is_insert_attrib': True
-                                    }
-                                    expanded_entities.append(absolute_attrib)
+                                    if grid_offsets is None:
+                                        expanded_entities.append(absolute_attrib)
+                                    else:
+                                        expanded_entities.extend(self.replicate_on_grid(absolute_attrib, grid_offsets))
                                     
                 except Exception as e:
                     logger.warning(f"Error expanding INSERT {block_name}: {e}")
             
             elif entity_type != 'ATTDEF':
                 # 直接エンティティ
+                if filter_config is not None and not filter_config.accepts(entity):
+                    continue
+                if table_builder is not None and table_builder.add_source(entity, table_builder.IDENTITY_MATRIX_ID):
+                    continue
                 identity_matrix = np.eye(4)
                 absolute_entity = self.transform_entity_to_absolute(entity, identity_matrix)
                 if absolute_entity:
-                    absolute_entity['is_direct_modelspace'] = True
                     expanded_entities.append(absolute_entity)
         
         return expanded_entities
@@ -415,11 +894,11 @@ class SignatureGenerator:
         self.transformer = transformer
         self.debug = debug
     
-    def create_absolute_entity_signature(self, absolute_entity: Dict) -> str:
+    def create_absolute_entity_signature(self, absolute_entity: ExpandedEntity) -> str:
         """絶対座標エンティティの署名生成"""
+        entity_type = absolute_entity.dxftype
         try:
-            entity_type = absolute_entity['dxftype']
-            attrs = absolute_entity['attributes']
+            attrs = absolute_entity.attributes
             
             signature_parts = [entity_type]
             
@@ -438,15 +917,14 @@ class SignatureGenerator:
             # 同じ最終座標・属性の entities は INSERT 元に関係なく同一として扱う
             
             # テキスト内容
-            text_content = absolute_entity.get('text_content')
+            text_content = absolute_entity.text_content
             if text_content and text_content.strip():
                 clean_text = text_content.strip().replace('\n', '').replace('\r', '')
                 signature_parts.append(f"text_{clean_text}")
             
             # ATTRIB固有情報
             if entity_type == 'ATTRIB':
-                attrib_tag = absolute_entity.get('attrib_tag', '')
-                signature_parts.append(f"tag_{attrib_tag}")
+                signature_parts.append(f"tag_{absolute_entity.attrib_tag}")
             
             # 重要な属性
             self._add_important_attributes(signature_parts, attrs, entity_type, absolute_entity)
@@ -454,6 +932,10 @@ class SignatureGenerator:
             # ジオメトリ詳細
             self._add_geometry_details(signature_parts, entity_type, attrs)
             
+            # 複合エンティティのジオメトリ記述子
+            if absolute_entity.descriptor is not None:
+                signature_parts.append(f"desc_{self.descriptor_fingerprint(absolute_entity.descriptor)}")
+            
             return "_".join(str(p) for p in signature_parts)
             
         except Exception as e:
@@ -462,7 +944,7 @@ class SignatureGenerator:
             return f"{entity_type}_error_{id(absolute_entity)}"
     
     def _add_important_attributes(self, signature_parts: List, attrs: Dict, 
-                                entity_type: str, absolute_entity: Dict):
+                                entity_type: str, absolute_entity: ExpandedEntity):
         """重要な属性を署名に追加"""
         important_attrs = ['color', 'height', 'radius', 'start_angle', 'end_angle']
         
@@ -470,7 +952,7 @@ class SignatureGenerator:
             if attr_name in attrs:
                 value = attrs[attr_name]
                 if isinstance(value, (int, float)):
-                    if attr_name in ['height', 'radius'] and absolute_entity.get('scale_factors'):
+                    if attr_name in ['height', 'radius'] and absolute_entity.scale_factors:
                         tolerance = self.transformer.tolerance_config.get_tolerance_for_entity(
                             entity_type, attr_name) * 2
                     else:
@@ -528,17 +1010,64 @@ class SignatureGenerator:
                 math.radians(self.transformer.tolerance_config.angle_tolerance))
             signature_parts.append(f"ellipse_{center}_{major_axis}_{ratio}_{start_param}_{end_param}")
         
+        elif entity_type == 'VIEWPORT' and 'center' in attrs:
+            # ペーパー空間上の大きさと、表示するモデル空間の範囲
+            view_center = self.transformer.normalize_coordinate_with_context(
+                attrs.get('view_center_point', (0, 0)), entity_type)
+            sizes = [self.transformer.normalize_coordinate_precise(
+                attrs.get(name, 0.0), self.transformer.tolerance_config.length_tolerance)
+                for name in ('width', 'height', 'view_height')]
+            signature_parts.append(f"viewport_{sizes}_{view_center}")
+        
         elif entity_type == 'LWPOLYLINE' and 'vertices' in attrs:
-            vertices = attrs['vertices']
-            if vertices:
-                normalized_vertices = []
-                for vertex in vertices[:5]:  # 最初の5頂点のみ
-                    if len(vertex) >= 2:
-                        norm_vertex = self.transformer.normalize_coordinate_with_context(
-                            (vertex[0], vertex[1]), entity_type)
-                        normalized_vertices.append(norm_vertex)
-                if normalized_vertices:
-                    signature_parts.append(f"lwpoly_vertices_{normalized_vertices}")
+            fingerprint = self.lwpolyline_fingerprint(attrs['vertices'], attrs.get('closed', False))
+            if fingerprint:
+                signature_parts.append(f"lwpoly_{fingerprint}")
+
+    def lwpolyline_fingerprint(self, vertices: np.ndarray, closed: bool) -> Optional[str]:
+        """LWPOLYLINE の全頂点 (x, y, 始点幅, 終点幅, bulge) と閉じフラグのフィンガープリント
+
+        全頂点を列ごとの許容誤差で一括量子化し、整数配列のバイト列をハッシュ化する。
+        """
+        if vertices is None or not len(vertices):
+            return None
+        tc = self.transformer.tolerance_config
+        tolerances = np.array([
+            tc.get_tolerance_for_entity('LWPOLYLINE'),
+            tc.get_tolerance_for_entity('LWPOLYLINE'),
+            tc.length_tolerance,
+            tc.length_tolerance,
+            tc.bulge_tolerance,
+        ])
+        quantized = np.rint(np.asarray(vertices, dtype=np.float64) / tolerances).astype(np.int64)
+        digest = hashlib.blake2b(quantized.tobytes(), digest_size=16)
+        digest.update(b'closed' if closed else b'open')
+        return f"{len(quantized)}_{digest.hexdigest()}"
+
+    def descriptor_fingerprint(self, descriptor: Dict[str, Any]) -> str:
+        """ジオメトリ記述子の固定長フィンガープリント
+
+        キーごとの許容誤差で配列を一括量子化し、形状とバイト列をハッシュ化する。
+        """
+        tc = self.transformer.tolerance_config
+        tolerances = {
+            'points': tc.coordinate_tolerance,
+            'widths': tc.length_tolerance,
+            'bulges': tc.bulge_tolerance,
+            'lengths': tc.length_tolerance,
+            'params': tc.parameter_tolerance,
+        }
+        digest = hashlib.blake2b(digest_size=16)
+        for key, tolerance in tolerances.items():
+            values = descriptor.get(key)
+            if values is not None:
+                quantized = np.rint(values / tolerance).astype(np.int64)
+                digest.update(f"{key}{quantized.shape}".encode('ascii'))
+                digest.update(quantized.tobytes())
+        if 'codes' in descriptor:
+            digest.update(descriptor['codes'].tobytes())
+        digest.update(descriptor.get('label', '').encode('utf-8'))
+        return f"{len(descriptor['points'])}_{digest.hexdigest()}"
 
 
 class DiffAnalyzer:
@@ -548,138 +1077,410 @@ class DiffAnalyzer:
         self.signature_generator = signature_generator
         self.debug = debug
     
-    def generate_enhanced_hash(self, entity_data: Dict) -> Optional[str]:
-        """改善されたハッシュ生成"""
-        if entity_data is None:
-            return None
-        
+    def generate_enhanced_hash(self, absolute_entity: ExpandedEntity) -> Optional[str]:
+        """署名からハッシュを生成"""
         try:
-            signature = entity_data.get('absolute_signature', '')
-            if signature:
-                hash_value = hashlib.sha256(signature.encode('utf-8')).hexdigest()
-            else:
-                json_str = json.dumps(entity_data, sort_keys=True, ensure_ascii=False, 
-                                    separators=(',', ':'), default=str)
-                hash_value = hashlib.sha256(json_str.encode('utf-8')).hexdigest()
-            
-            return hash_value
-            
+            signature = self.signature_generator.create_absolute_entity_signature(absolute_entity)
+            return hashlib.sha256(signature.encode('utf-8')).hexdigest()
+
         except Exception as e:
             logger.warning(f"Failed to generate hash: {e}")
             return None
     
-    def create_entity_data_from_absolute(self, absolute_entity: Dict) -> Optional[Dict]:
-        """絶対座標エンティティからハッシュ用データ作成"""
-        try:
-            absolute_signature = self.signature_generator.create_absolute_entity_signature(absolute_entity)
-            
-            entity_data = {
-                'dxftype': absolute_entity['dxftype'],
-                'absolute_signature': absolute_signature,
-                'attributes': absolute_entity['attributes'],
-                'text_content': absolute_entity.get('text_content'),
-                'is_transformed': absolute_entity.get('is_transformed', False)
-            }
-            
-            if absolute_entity['dxftype'] == 'ATTRIB':
-                if 'attrib_tag' in absolute_entity:
-                    entity_data['attrib_tag'] = absolute_entity['attrib_tag']
-            
-            if 'insert_info' in absolute_entity:
-                entity_data['insert_info'] = absolute_entity['insert_info']
-            
-            self._extract_geometry_details(absolute_entity, entity_data)
-            
-            return entity_data
-            
-        except Exception as e:
-            logger.warning(f"Error creating entity data: {e}")
-            return None
-    
-    def _extract_geometry_details(self, absolute_entity: Dict, entity_data: Dict):
-        """ジオメトリ詳細情報の抽出"""
-        try:
-            entity_type = absolute_entity['dxftype']
-            attrs = absolute_entity['attributes']
-            
-            if entity_type == 'LINE' and 'start' in attrs and 'end' in attrs:
-                start = self.signature_generator.transformer.normalize_coordinate_with_context(
-                    attrs['start'], entity_type)
-                end = self.signature_generator.transformer.normalize_coordinate_with_context(
-                    attrs['end'], entity_type)
-                entity_data['line_geometry'] = {'start': start, 'end': end}
-            
-            elif entity_type == 'CIRCLE' and 'center' in attrs and 'radius' in attrs:
-                center = self.signature_generator.transformer.normalize_coordinate_with_context(
-                    attrs['center'], entity_type)
-                entity_data['circle_geometry'] = {'center': center, 'radius': attrs['radius']}
-            
-            elif entity_type == 'ARC' and 'center' in attrs:
-                center = self.signature_generator.transformer.normalize_coordinate_with_context(
-                    attrs['center'], entity_type)
-                entity_data['arc_geometry'] = {
-                    'center': center, 
-                    'radius': attrs.get('radius', 0),
-                    'start_angle': attrs.get('start_angle', 0), 
-                    'end_angle': attrs.get('end_angle', 0)
-                }
-            
-            elif entity_type == 'ELLIPSE' and 'center' in attrs:
-                center = self.signature_generator.transformer.normalize_coordinate_with_context(
-                    attrs['center'], entity_type)
-                major_axis = self.signature_generator.transformer.normalize_coordinate_with_context(
-                    attrs.get('major_axis', (1, 0, 0)), entity_type)
-                entity_data['ellipse_geometry'] = {
-                    'center': center,
-                    'major_axis': major_axis,
-                    'ratio': attrs.get('ratio', 1.0),
-                    'start_param': attrs.get('start_param', 0.0),
-                    'end_param': attrs.get('end_param', 2 * math.pi)
-                }
-                
-        except Exception:
-            pass
-    
-    def extract_entities_from_doc(self, doc, doc_label: str, expander: EntityExpander) -> Tuple[Dict[str, List], Dict[str, Dict], Dict[str, Set[str]]]:
-        """ドキュメントからエンティティを抽出"""
-        entities_by_hash = defaultdict(list)
-        hash_to_entity_data = {}
-        hash_to_locations = defaultdict(set)
+    def extract_entities_from_doc(self, doc, doc_label: str, expander: EntityExpander,
+                                  layout=None) -> Dict[str, ExpandedEntity]:
+        """ドキュメントからエンティティを抽出（layout 省略時はモデル空間）
+
+        戻り値は署名ハッシュ → 最初のインスタンスの辞書。同一署名の2件目以降は
+        出力にも件数にも使わないため保持せず、instance_count のみ加算する。
+        """
+        entities_by_hash: Dict[str, ExpandedEntity] = {}
         
-        absolute_entities = expander.expand_insert_entities(doc, doc_label)
+        absolute_entities = expander.expand_insert_entities(doc, doc_label, layout)
         
         for absolute_entity in absolute_entities:
-            try:
-                entity_data = self.create_entity_data_from_absolute(absolute_entity)
-                if entity_data:
-                    entity_hash = self.generate_enhanced_hash(entity_data)
-                    if entity_hash:
-                        if absolute_entity.get('is_direct_modelspace'):
-                            location = 'modelspace'
-                        else:
-                            insert_info = absolute_entity.get('insert_info', {})
-                            block_name = insert_info.get('block_name', 'unknown')
-                            location = f"expanded_from_{block_name}"
-                        
-                        virtual_entity = {
-                            'data': entity_data,
-                            'absolute_entity': absolute_entity
-                        }
-                        
-                        entities_by_hash[entity_hash].append((location, virtual_entity))
-                        hash_to_entity_data[entity_hash] = entity_data
-                        hash_to_locations[entity_hash].add(location)
-                        
-            except Exception as e:
-                logger.warning(f"Error processing entity: {e}")
+            self.add_hashed_entity(entities_by_hash, absolute_entity)
         
-        return entities_by_hash, hash_to_entity_data, hash_to_locations
+        return entities_by_hash
+
+    def add_hashed_entity(self, entities_by_hash: Dict[Any, ExpandedEntity], absolute_entity: ExpandedEntity):
+        """署名ハッシュでエンティティを登録（同一署名はインスタンス数のみ加算）"""
+        try:
+            entity_hash = self.generate_enhanced_hash(absolute_entity)
+            if entity_hash:
+                first = entities_by_hash.get(entity_hash)
+                if first is None:
+                    entities_by_hash[entity_hash] = absolute_entity
+                else:
+                    first.instance_count += 1
+                    
+        except Exception as e:
+            logger.warning(f"Error processing entity: {e}")
+
+
+class GeometryTableBuilder:
+    """固定長ジオメトリを持つエンティティをタイプ別の列指向テーブルに詰める
+
+    LINE: start xyz, end xyz / CIRCLE: center xyz, radius /
+    ARC: center xyz, radius, start_angle, end_angle / POINT: location xyz /
+    TEXT: insert xyz, height, rotation（＋テキスト） / LWPOLYLINE: 頂点列（可変長）
+    EntityExpander.expand_insert_entities から add_source で展開元エンティティを受け取り、
+    ブロック座標系の値・色・INSERT の変換行列番号だけを列に追加する（ExpandedEntity は作らない）。
+    座標変換・スケール適用・量子化・重複除去は build_keys で配列全体に対して行い、
+    重複除去後の代表行だけを DeferredExpandedEntity として返す。
+    テーブル化できないエンティティ（タイプ対象外・属性欠落）は add_source が False を返す。
+    """
+
+    TABLE_TYPES = ('LINE', 'CIRCLE', 'ARC', 'POINT', 'TEXT', 'LWPOLYLINE')
+
+    # 行の先頭から並ぶ点（xyz）の個数
+    POINT_COUNTS = {'LINE': 2, 'CIRCLE': 1, 'ARC': 1, 'POINT': 1, 'TEXT': 1}
+
+    # 直接エンティティ（モデル空間・レイアウト直下）の変換行列番号
+    IDENTITY_MATRIX_ID = 0
+
+    def __init__(self, expander: 'EntityExpander'):
+        self.expander = expander
+        self.rows: Dict[str, List[Tuple[float, ...]]] = {t: [] for t in self.TABLE_TYPES}
+        self.colors: Dict[str, List[int]] = {t: [] for t in self.TABLE_TYPES}
+        self.matrix_ids: Dict[str, List[int]] = {t: [] for t in self.TABLE_TYPES}
+        self.sources: Dict[str, List[Any]] = {t: [] for t in self.TABLE_TYPES}
+        # MINSERT の行: タイプ → [(行番号, グリッド移動量 (k, 3))]
+        self.grid_rows: Dict[str, List[Tuple[int, np.ndarray]]] = {t: [] for t in self.TABLE_TYPES}
+        self.texts: List[str] = []
+        self.matrices: List[np.ndarray] = [np.eye(4)]
+
+    def add_matrix(self, transform_matrix: np.ndarray) -> int:
+        """INSERT の変換行列を登録し、add_source に渡す行列番号を返す"""
+        self.matrices.append(transform_matrix)
+        return len(self.matrices) - 1
+
+    def add_source(self, entity, matrix_id: int, grid_offsets: Optional[np.ndarray] = None) -> bool:
+        """展開元エンティティの値をブロック座標系のまま列に追加（テーブル化できない場合は False）
+
+        値の取り出し方は transform_entity_to_absolute → 旧 ExpandedEntity テーブル化と同じ
+        （属性が存在しない場合の既定値・角度の 360 度剰余・TEXT のテキスト整形）。
+        """
+        entity_type = entity.dxftype()
+        if entity_type not in self.rows:
+            return False
+        dxf = entity.dxf
+        # 設定済みの DXF 属性は DXFNamespace の __dict__ にあり、dxf.get(key) と同じ値を
+        # 属性ごとの関数呼び出しなしで参照できる（未設定の属性は存在しない）
+        attribs = vars(dxf)
+        try:
+            if entity_type == 'LINE':
+                start, end = attribs.get('start'), attribs.get('end')
+                if start is None or end is None:
+                    return False
+                row = (start.x, start.y, start.z, end.x, end.y, end.z)
+            elif entity_type == 'CIRCLE':
+                center, radius = attribs.get('center'), attribs.get('radius')
+                if center is None or radius is None:
+                    return False
+                row = (center.x, center.y, center.z, float(radius))
+            elif entity_type == 'ARC':
+                center = attribs.get('center')
+                if center is None:
+                    return False
+                row = (center.x, center.y, center.z,
+                       float(attribs.get('radius', 0.0)),
+                       float(attribs.get('start_angle', 0.0)) % 360.0,
+                       float(attribs.get('end_angle', 0.0)) % 360.0)
+            elif entity_type == 'POINT':
+                location = attribs.get('location')
+                if location is None:
+                    return False
+                row = (location.x, location.y, location.z)
+            elif entity_type == 'TEXT':
+                insert = attribs.get('insert')
+                if insert is None:
+                    return False
+                row = (insert.x, insert.y, insert.z,
+                       float(attribs.get('height', 0.0)),
+                       float(attribs.get('rotation', 0.0)) % 360.0)
+            else:  # LWPOLYLINE
+                vertices = self.expander._extract_lwpolyline_vertices(entity)
+                if vertices is None or not len(vertices):
+                    return False
+                row = (vertices, bool(getattr(entity, 'closed', False)))
+            color = int(attribs.get('color', 256))
+        except (AttributeError, TypeError, ValueError, IndexError):
+            return False
+
+        if entity_type == 'TEXT':
+            text = getattr(entity, 'text', None) or attribs.get('text')
+            self.texts.append((text or '').strip().replace('\n', '').replace('\r', ''))
+        rows = self.rows[entity_type]
+        if grid_offsets is not None:
+            self.grid_rows[entity_type].append((len(rows), grid_offsets))
+        rows.append(row)
+        self.colors[entity_type].append(color)
+        self.matrix_ids[entity_type].append(matrix_id)
+        self.sources[entity_type].append(entity)
+        return True
+
+    def _matrix_tables(self):
+        """登録済み変換行列の (行列 (m, 4, 4), スケール (m, 3), スケールありフラグ, 鏡像フラグ)"""
+        matrices = np.asarray(self.matrices, dtype=np.float64)
+        linear = matrices[:, :3, :3]
+        scale_x = np.sqrt(linear[:, 0, 0] ** 2 + linear[:, 1, 0] ** 2)
+        scale_y = np.sqrt(linear[:, 0, 1] ** 2 + linear[:, 1, 1] ** 2)
+        scale_z = np.sqrt(linear[:, 0, 2] ** 2 + linear[:, 1, 2] ** 2 + linear[:, 2, 2] ** 2)
+        scales = np.column_stack([scale_x, scale_y, scale_z])
+        # transform_entity_to_absolute と同じ math.isclose(s, 1.0, rel_tol=1e-6) 判定
+        is_scaled = ~np.all(np.abs(scales - 1.0) <= 1e-6 * np.maximum(np.abs(scales), 1.0), axis=1)
+        mirrored = np.linalg.det(matrices[:, :2, :2]) < 0
+        return matrices, scales, is_scaled, mirrored
+
+    def _grid_expansion(self, entity_type: str, row_count: int) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """MINSERT の行をグリッド要素数ぶん展開する (展開後 → 元の行番号, 展開後の移動量 or None)"""
+        grid_rows = self.grid_rows[entity_type]
+        if not grid_rows:
+            return np.arange(row_count), None
+        repeats = np.ones(row_count, dtype=np.int64)
+        for row_index, offsets in grid_rows:
+            repeats[row_index] = len(offsets)
+        row_index = np.repeat(np.arange(row_count), repeats)
+        offsets = np.zeros((len(row_index), 3), dtype=np.float64)
+        starts = np.concatenate([[0], np.cumsum(repeats)[:-1]])
+        for index, grid_offsets in grid_rows:
+            offsets[starts[index]:starts[index] + len(grid_offsets)] = grid_offsets
+        return row_index, offsets
+
+    def _absolute_points(self, local: np.ndarray, matrices: np.ndarray) -> np.ndarray:
+        """(n, 3) の点を行ごとの変換行列で絶対座標に変換し、グローバルオフセットを適用"""
+        points = (matrices[:, :3, 0] * local[:, 0:1] + matrices[:, :3, 1] * local[:, 1:2]
+                  + matrices[:, :3, 2] * local[:, 2:3] + matrices[:, :3, 3])
+        global_offset = self.expander.global_offset
+        if global_offset is not None:
+            points[:, 0] += global_offset[0]
+            points[:, 1] += global_offset[1]
+        return points
+
+    @staticmethod
+    def _grid_offsets_at(grid_offsets: Optional[np.ndarray], indices: np.ndarray) -> List[Optional[np.ndarray]]:
+        """展開後の行の移動量のリスト（MINSERT 以外・グリッドの1要素目は None）"""
+        if grid_offsets is None:
+            return [None] * len(indices)
+        moved = np.any(grid_offsets[indices] != 0, axis=1)
+        return [grid_offsets[i] if m else None for i, m in zip(indices.tolist(), moved.tolist())]
+
+    @staticmethod
+    def _quantize(values: np.ndarray, tolerances: List[float]) -> np.ndarray:
+        """列ごとの許容誤差で整数グリッドに量子化"""
+        tol = np.asarray(tolerances, dtype=np.float64)
+        safe_tol = np.where(tol > 0, tol, 1.0)
+        quantized = np.rint(values / safe_tol)
+        if np.any(tol <= 0):
+            # 許容誤差 0 の列は値そのもので比較（-0.0 は 0.0 に揃える）
+            raw = (values + 0.0).view(np.int64).astype(np.float64)
+            quantized = np.where(tol > 0, quantized, raw)
+        return quantized.astype(np.int64)
+
+    @staticmethod
+    def _unique_rows(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """整数キー行列の重複を除去し (行バイト列, 最初の行番号, 件数) を返す"""
+        keys = np.ascontiguousarray(keys, dtype=np.int64)
+        row_view = keys.view(np.dtype((np.void, keys.dtype.itemsize * keys.shape[1]))).ravel()
+        unique_rows, first_index, counts = np.unique(row_view, return_index=True, return_counts=True)
+        return unique_rows, first_index, counts
+
+    def build_keys(self, tolerance_config: ToleranceConfig) -> Dict[Any, DeferredExpandedEntity]:
+        """座標変換・量子化・正規順序付け・重複除去を配列単位で行い、キー → 代表行の辞書を返す
+
+        キーはファイルに依存しない (タイプ, 量子化行バイト列[, テキスト]) のタプルのため、
+        別ファイルの抽出結果と集合演算でそのまま突き合わせられる。
+        """
+        tc = tolerance_config
+        angle_tol = tc.angle_tolerance
+        column_tolerances = {
+            'LINE': [tc.get_tolerance_for_entity('LINE')] * 6,
+            'CIRCLE': [tc.get_tolerance_for_entity('CIRCLE')] * 3 + [tc.length_tolerance],
+            'ARC': [tc.get_tolerance_for_entity('ARC')] * 3 + [tc.length_tolerance, angle_tol, angle_tol],
+            'POINT': [tc.get_tolerance_for_entity('POINT')] * 3,
+            'TEXT': [tc.get_tolerance_for_entity('TEXT')] * 4 + [angle_tol],
+        }
+        matrices, scales, is_scaled, mirrored = self._matrix_tables()
+
+        entities_by_key: Dict[Any, DeferredExpandedEntity] = {}
+
+        for entity_type, tolerances in column_tolerances.items():
+            rows = self.rows[entity_type]
+            if not rows:
+                continue
+            values = np.asarray(rows, dtype=np.float64)
+            matrix_ids = np.asarray(self.matrix_ids[entity_type], dtype=np.int64)
+            row_matrices = matrices[matrix_ids]
+            for p in range(self.POINT_COUNTS[entity_type]):
+                values[:, 3 * p:3 * p + 3] = self._absolute_points(values[:, 3 * p:3 * p + 3], row_matrices)
+            # サイズ属性（transform_entity_to_absolute の _transform_size_attributes と同じ）
+            scaled = is_scaled[matrix_ids]
+            if entity_type in ('CIRCLE', 'ARC'):
+                avg_scale = (scales[matrix_ids, 0] + scales[matrix_ids, 1]) / 2.0
+                values[:, 3] = np.where(scaled, values[:, 3] * avg_scale, values[:, 3])
+            elif entity_type == 'TEXT':
+                values[:, 3] = np.where(scaled, values[:, 3] * scales[matrix_ids, 1], values[:, 3])
+
+            row_index, grid_offsets = self._grid_expansion(entity_type, len(values))
+            if grid_offsets is not None:
+                values = values[row_index]
+                for p in range(self.POINT_COUNTS[entity_type]):
+                    values[:, 3 * p:3 * p + 3] += grid_offsets
+
+            quantized = self._quantize(values, tolerances)
+            if entity_type == 'LINE':
+                # 端点の向きに依存しないよう、辞書順で小さい端点を start に揃える
+                start, end = quantized[:, :3], quantized[:, 3:]
+                diff = end - start
+                first_nonzero = np.argmax(diff != 0, axis=1)
+                swap = diff[np.arange(len(diff)), first_nonzero] < 0
+                quantized[swap] = np.hstack([end[swap], start[swap]])
+            colors = np.asarray(self.colors[entity_type], dtype=np.int64)[row_index]
+            keys = np.column_stack([quantized, colors])
+
+            if entity_type == 'TEXT':
+                text_array = np.asarray(self.texts, dtype=object)[row_index]
+                _, text_ids = np.unique(text_array, return_inverse=True)
+                keys = np.column_stack([keys, text_ids.astype(np.int64)])
+                _, first_index, counts = self._unique_rows(keys)
+                for index, row, offset, count in zip(first_index.tolist(), row_index[first_index].tolist(),
+                                                     self._grid_offsets_at(grid_offsets, first_index),
+                                                     counts.tolist()):
+                    key = (entity_type, keys[index, :-1].tobytes(), text_array[index])
+                    self._register(entities_by_key, key, entity_type, row, offset, count)
+            else:
+                unique_rows, first_index, counts = self._unique_rows(keys)
+                for row_bytes, row, offset, count in zip(unique_rows.tolist(), row_index[first_index].tolist(),
+                                                         self._grid_offsets_at(grid_offsets, first_index),
+                                                         counts.tolist()):
+                    self._register(entities_by_key, (entity_type, row_bytes), entity_type, row, offset, count)
+
+        if self.rows['LWPOLYLINE']:
+            self._build_lwpolyline_keys(entities_by_key, tc, matrices, scales, is_scaled, mirrored)
+
+        return entities_by_key
+
+    def _build_lwpolyline_keys(self, entities_by_key: Dict[Any, DeferredExpandedEntity], tc: ToleranceConfig,
+                               matrices: np.ndarray, scales: np.ndarray, is_scaled: np.ndarray,
+                               mirrored: np.ndarray):
+        """LWPOLYLINE（可変長）: 全頂点 (x, y, 始点幅, 終点幅, bulge) を連結して一括で変換・量子化し、
+        頂点数ごとに (色, 閉じ, 頂点数, 頂点列) の行にまとめて重複除去する
+        """
+        rows = self.rows['LWPOLYLINE']
+        vertex_counts = np.asarray([len(vertices) for vertices, _closed in rows], dtype=np.int64)
+        flat = np.concatenate([vertices for vertices, _closed in rows])
+        matrix_ids = np.asarray(self.matrix_ids['LWPOLYLINE'], dtype=np.int64)
+        vertex_matrix_ids = np.repeat(matrix_ids, vertex_counts)
+        m = matrices[vertex_matrix_ids]
+
+        # _transform_coordinate_attributes / _transform_size_attributes と同じ変換
+        x, y = flat[:, 0].copy(), flat[:, 1].copy()
+        flat[:, 0] = x * m[:, 0, 0] + y * m[:, 0, 1] + m[:, 0, 3]
+        flat[:, 1] = x * m[:, 1, 0] + y * m[:, 1, 1] + m[:, 1, 3]
+        global_offset = self.expander.global_offset
+        if global_offset is not None:
+            flat[:, 0] += global_offset[0]
+            flat[:, 1] += global_offset[1]
+        flat[:, 4] = np.where(mirrored[vertex_matrix_ids], -flat[:, 4], flat[:, 4])
+        avg_scale = (scales[vertex_matrix_ids, 0] + scales[vertex_matrix_ids, 1]) / 2.0
+        scaled = is_scaled[vertex_matrix_ids]
+        flat[:, 2:4] = np.where(scaled[:, None], flat[:, 2:4] * avg_scale[:, None], flat[:, 2:4])
+
+        # MINSERT: ポリライン単位で展開し、頂点に移動量を加える
+        row_index, grid_offsets = self._grid_expansion('LWPOLYLINE', len(rows))
+        vertex_starts = np.concatenate([[0], np.cumsum(vertex_counts)[:-1]])
+        if grid_offsets is not None:
+            lengths = vertex_counts[row_index]
+            expanded_starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+            vertex_index = (np.repeat(vertex_starts[row_index] - expanded_starts, lengths)
+                            + np.arange(int(lengths.sum())))
+            flat = flat[vertex_index]
+            flat[:, :2] += np.repeat(grid_offsets[:, :2], lengths, axis=0)
+            vertex_counts, vertex_starts = lengths, expanded_starts
+
+        lw_tol = tc.get_tolerance_for_entity('LWPOLYLINE')
+        quantized = self._quantize(
+            flat, [lw_tol, lw_tol, tc.length_tolerance, tc.length_tolerance, tc.bulge_tolerance])
+        colors = np.asarray(self.colors['LWPOLYLINE'], dtype=np.int64)[row_index]
+        closed = np.asarray([closed for _vertices, closed in rows], dtype=np.int64)[row_index]
+
+        for count in np.unique(vertex_counts).tolist():
+            members = np.flatnonzero(vertex_counts == count)
+            vertices = quantized[vertex_starts[members][:, None] + np.arange(count)].reshape(len(members), -1)
+            keys = np.column_stack([colors[members], closed[members],
+                                    np.full(len(members), count, dtype=np.int64), vertices])
+            unique_rows, first_index, counts = self._unique_rows(keys)
+            first_members = members[first_index]
+            for row_bytes, row, offset, instances in zip(unique_rows.tolist(), row_index[first_members].tolist(),
+                                                         self._grid_offsets_at(grid_offsets, first_members),
+                                                         counts.tolist()):
+                self._register(entities_by_key, ('LWPOLYLINE', row_bytes), 'LWPOLYLINE', row, offset, instances)
+
+    def _register(self, entities_by_key: Dict[Any, DeferredExpandedEntity], key, entity_type: str,
+                  row: int, grid_offset: Optional[np.ndarray], count: int):
+        first = entities_by_key.get(key)
+        if first is None:
+            attributes, text_content = self.expander.snapshot_entity(self.sources[entity_type][row])
+            entity = DeferredExpandedEntity(entity_type, attributes, text_content,
+                                            self.matrices[self.matrix_ids[entity_type][row]],
+                                            grid_offset, self.expander)
+            entity.instance_count = count
+            entities_by_key[key] = entity
+        else:
+            first.instance_count += count
+
+
+class ColumnarDiffAnalyzer(DiffAnalyzer):
+    """列指向テーブルによる差分検出クラス
+
+    LINE / CIRCLE / ARC / POINT / TEXT / LWPOLYLINE は展開時に GeometryTableBuilder の
+    タイプ別の列に直接追加し（ExpandedEntity を作らない）、座標変換・量子化・LINE 端点の
+    正規順序付け・重複除去を配列全体で行う。代表行は DeferredExpandedEntity として返し、
+    出力DXFに書き出す行だけが ExpandedEntity に展開される。
+    それ以外のタイプは DiffAnalyzer と同じ署名ハッシュで扱う。
+    戻り値の形式は DiffAnalyzer.extract_entities_from_doc と同じ（キー → 最初のインスタンス）。
+
+    署名方式との違い: LINE は向きを区別しない。比較対象は量子化したジオメトリ・色
+    （TEXT はテキスト・高さ・回転も）で、署名方式と同様にレイヤーは含めない。
+    """
+
+    def extract_entities_from_doc(self, doc, doc_label: str, expander: EntityExpander,
+                                  layout=None) -> Dict[Any, ExpandedEntity]:
+        """ドキュメントからエンティティを抽出（テーブル化できるタイプは列指向で処理）"""
+        entities_by_key: Dict[Any, ExpandedEntity] = {}
+        builder = GeometryTableBuilder(expander)
+
+        for absolute_entity in expander.expand_insert_entities(doc, doc_label, layout, table_builder=builder):
+            self.add_hashed_entity(entities_by_key, absolute_entity)
+
+        tolerance_config = self.signature_generator.transformer.tolerance_config
+        entities_by_key.update(builder.build_keys(tolerance_config))
+        return entities_by_key
+
+
+# 差分エンジン（diff_engine 引数）→ DiffAnalyzer クラス
+DIFF_ENGINE_SIGNATURE = 'signature'
+DIFF_ENGINE_COLUMNAR = 'columnar'
+DIFF_ENGINES = {
+    DIFF_ENGINE_SIGNATURE: DiffAnalyzer,
+    DIFF_ENGINE_COLUMNAR: ColumnarDiffAnalyzer,
+}
+
+
+def create_diff_analyzer(transformer: CoordinateTransformer,
+                         diff_engine: str = DIFF_ENGINE_SIGNATURE) -> DiffAnalyzer:
+    """差分エンジン名から DiffAnalyzer を作成"""
+    if diff_engine not in DIFF_ENGINES:
+        raise ValueError(f"Unknown diff engine: {diff_engine}")
+    return DIFF_ENGINES[diff_engine](SignatureGenerator(transformer, debug=False), debug=False)
 
 
 class LayerConfig:
     """レイヤー設定クラス"""
     
-    def __init__(self, deleted_color: int = 6, added_color: int = 4, unchanged_color: int = 7):
+    def __init__(self, deleted_color: int = 6, added_color: int = 4, unchanged_color: int = 7,
+                 context_color: int = 8):
         self.layer_settings = {
             'DELETED': {
                 'name': 'DELETED',
@@ -695,6 +1496,11 @@ class LayerConfig:
                 'name': 'UNCHANGED',
                 'color': unchanged_color,  # デフォルト: 白/黒
                 'description': 'Entities present in both files'
+            },
+            'CONTEXT': {
+                'name': 'CONTEXT',
+                'color': context_color,  # デフォルト: グレー
+                'description': 'Simplified unchanged entities (frames and long lines) for orientation'
             }
         }
     
@@ -707,6 +1513,85 @@ class LayerConfig:
         return self.layer_settings.get(diff_type.upper(), {}).get('color', 256)
 
 
+class DiffDocumentTemplate:
+    """差分出力用ドキュメントのテンプレート
+
+    ezdxf.new(setup=True) による標準線種・文字スタイル・寸法スタイルの生成と
+    差分レイヤー（DELETED / ADDED / UNCHANGED / CONTEXT）の作成を1回だけ行い、
+    以降の出力ではモデルスペースを空にして同じドキュメントを再利用する。
+    ezdxf のドキュメント複製（deepcopy や再読込）は setup=True の新規作成より
+    遅いため、複製ではなくリセット方式を採る。リセット時はハンドルの採番も出力前の
+    値に戻すため、同じ差分からは何回目の出力でも同じハンドルのファイルになる
+    （ezdxf が保存ごとに書き込む $VERSIONGUID と保存日時以外は同一）。
+    ドキュメントは共有できないため、スレッドごとに1つ保持する（get_diff_document_template）。
+    """
+
+    def __init__(self, dxfversion: str = 'R2018'):
+        self.dxfversion = dxfversion
+        self.doc = ezdxf.new(dxfversion, setup=True)
+        for diff_type in ['DELETED', 'ADDED', 'UNCHANGED', 'CONTEXT']:
+            self.doc.layers.new(diff_type)
+        self.base_block_names = {block.name for block in self.doc.blocks}
+        self.base_layout_names = set(self.doc.layouts.names())
+        # 初回の保存で ezdxf が追加する APPID・DICTIONARYVAR を先に作成しておく
+        # （初回の出力も2回目以降と同じハンドルになる）
+        self.doc.write(io.StringIO())
+        self.handle_seed = str(self.doc.entitydb.handles)
+        self.in_use = False
+
+    def acquire(self, layer_config: 'LayerConfig'):
+        """空のモデルスペースとレイヤー色を設定したドキュメントを返す"""
+        if self.in_use:
+            raise RuntimeError("DiffDocumentTemplate is already in use")
+        self.in_use = True
+        layers = self.doc.layers
+        for diff_type in ['DELETED', 'ADDED', 'UNCHANGED', 'CONTEXT']:
+            layer_name = layer_config.get_layer_name(diff_type)
+            if not layers.has_entry(layer_name):
+                layers.new(layer_name)
+            layers.get(layer_name).color = layer_config.get_layer_color(diff_type)
+        # 出力で作成するエンティティのハンドルはここから採番する（release で戻す）
+        self.handle_seed = str(self.doc.entitydb.handles)
+        return self.doc
+
+    def release(self):
+        """出力済みエンティティを破棄し、次の出力に備える"""
+        try:
+            self.doc.modelspace().delete_all_entities()
+            # レイアウト別の差分出力で作成したペーパー空間レイアウトを削除（既定のレイアウトは空にする）
+            for name in self.doc.layouts.names():
+                if name not in self.base_layout_names:
+                    self.doc.layouts.delete(name)
+                elif name != MODEL_LAYOUT_NAME:
+                    self.doc.layouts.get(name).delete_all_entities()
+            # DIMENSION の描画で作成された寸法ジオメトリブロック（*D...）を削除
+            for name in [block.name for block in self.doc.blocks if block.name not in self.base_block_names]:
+                self.doc.blocks.delete_block(name, safe=False)
+            entitydb = self.doc.entitydb
+            entitydb.purge()
+            # ハンドルの採番を出力前に戻す（残ったエンティティのハンドルとは重ならないようにする）
+            next_handle = max([int(self.handle_seed, 16)] + [int(handle, 16) + 1 for handle in entitydb.keys()])
+            entitydb.handles.reset('%X' % next_handle)
+        finally:
+            self.in_use = False
+
+
+_template_local = threading.local()
+
+
+def get_diff_document_template(dxfversion: str = 'R2018') -> DiffDocumentTemplate:
+    """現在のスレッド用の DiffDocumentTemplate を返す（未使用のものがなければ作成）"""
+    templates = getattr(_template_local, 'templates', None)
+    if templates is None:
+        templates = _template_local.templates = {}
+    template = templates.get(dxfversion)
+    if template is None or template.in_use:
+        template = DiffDocumentTemplate(dxfversion)
+        if dxfversion not in templates:
+            templates[dxfversion] = template
+    return template
+
+
 class OutputGenerator:
     """出力生成専用クラス"""
     
@@ -714,17 +1599,18 @@ class OutputGenerator:
         self.transformer = transformer
         self.layer_config = layer_config
         self.debug = debug
+        self.last_output_counts: Optional[Dict[str, Any]] = None  # 直近の create_diff_dxf の出力件数
         self.excluded_attributes = {
             'handle', 'owner', 'reactors', 'dictionary', 'extension_dict',
             'objectid', 'uuid', 'app_data', 'doc', 'entitydb', 'is_alive', 
             'is_virtual', 'is_copy', 'soft_pointer_ids', 'hard_pointer_ids'
         }
     
-    def create_entity_from_absolute(self, absolute_entity: Dict, target_space, layer_name: str, layer_color: int) -> bool:
+    def create_entity_from_absolute(self, absolute_entity: ExpandedEntity, target_space, layer_name: str, layer_color: int) -> bool:
         """絶対座標エンティティから実際のDXFエンティティを作成（レイヤー指定）"""
+        entity_type = absolute_entity.dxftype
         try:
-            entity_type = absolute_entity['dxftype']
-            attrs = absolute_entity['attributes']
+            attrs = absolute_entity.attributes
             
             dxfattribs = {k: v for k, v in attrs.items() 
                          if k not in self.excluded_attributes and v is not None}
@@ -791,22 +1677,22 @@ class OutputGenerator:
                         return False
                 
             elif entity_type == 'TEXT':
-                text_content = absolute_entity.get('text_content', '')
+                text_content = absolute_entity.text_content or ''
                 insert_pos = attrs.get('insert', (0, 0, 0))
                 text_attrs = dxfattribs.copy()
                 text_attrs['insert'] = insert_pos
                 target_space.add_text(text=text_content, dxfattribs=text_attrs)
                 
             elif entity_type == 'MTEXT':
-                text_content = absolute_entity.get('text_content', '')
+                text_content = absolute_entity.text_content or ''
                 insert_pos = attrs.get('insert', (0, 0, 0))
                 text_attrs = dxfattribs.copy()
                 text_attrs['insert'] = insert_pos
                 target_space.add_mtext(text=text_content, dxfattribs=text_attrs)
                 
             elif entity_type == 'ATTRIB':
-                text_content = absolute_entity.get('text_content', '')
-                attrib_tag = absolute_entity.get('attrib_tag', '')
+                text_content = absolute_entity.text_content or ''
+                attrib_tag = absolute_entity.attrib_tag
                 insert_pos = attrs.get('insert', (0, 0, 0))
                 
                 display_text = text_content if text_content else f"[{attrib_tag}]"
@@ -829,15 +1715,34 @@ class OutputGenerator:
                 target_space.add_point(location=location, dxfattribs=dxfattribs)
             
             elif entity_type == 'LWPOLYLINE':
-                vertices = attrs.get('vertices', [])
-                if vertices:
-                    vertex_points = [(v[0], v[1]) for v in vertices if len(v) >= 2]
-                    if vertex_points:
-                        new_entity = target_space.add_lwpolyline(points=vertex_points)
-                        new_entity.dxf.layer = layer_name
-                        new_entity.dxf.color = layer_color
-                        if len(vertex_points) >= 3:
-                            new_entity.close()
+                vertices = attrs.get('vertices')
+                if vertices is not None and len(vertices):
+                    lwpolyline_attrs = {'layer': layer_name, 'color': layer_color}
+                    for attr_name in ('const_width', 'elevation'):
+                        if attr_name in dxfattribs:
+                            lwpolyline_attrs[attr_name] = dxfattribs[attr_name]
+                    # 頂点の幅・bulge と閉じフラグを元のまま出力する
+                    target_space.add_lwpolyline(
+                        points=[tuple(v) for v in vertices.tolist()],
+                        format='xyseb',
+                        close=bool(attrs.get('closed', False)),
+                        dxfattribs=lwpolyline_attrs)
+            
+            elif entity_type == 'VIEWPORT':
+                # ペーパー空間全体のビューポート（ID 1）はレイアウト作成時に自動で作られる
+                if attrs.get('id') == 1:
+                    return False
+                center = attrs.get('center', (0, 0, 0))
+                target_space.add_viewport(
+                    center=center,
+                    size=(attrs.get('width', 1.0), attrs.get('height', 1.0)),
+                    view_center_point=attrs.get('view_center_point', (0, 0)),
+                    view_height=attrs.get('view_height', 1.0),
+                    dxfattribs={'layer': layer_name, 'color': layer_color})
+            
+            elif absolute_entity.descriptor is not None:
+                return self._create_entity_from_descriptor(
+                    entity_type, absolute_entity.descriptor, target_space, layer_name, layer_color)
             
             else:
                 # サポートされていないエンティティ
@@ -859,15 +1764,147 @@ class OutputGenerator:
                 logger.debug(f"Error creating entity {entity_type}: {e}")
             return False
     
-    def _ensure_japanese_text_compatibility(self, output_file: str):
-        """日本語テキストの互換性を確保"""
-        try:
-            # DXF R2018+ はネイティブでUTF-8をサポートするため、
-            # ファイルがUTF-8で正しく保存されていることを確認
-            with open(output_file, 'rb') as f:
-                content = f.read()
-            
-            # UTF-8として読み込み、正常に読み込めることを確認
+    def _create_entity_from_descriptor(self, entity_type: str, descriptor: Dict[str, Any],
+                                       target_space, layer_name: str, layer_color: int) -> bool:
+        """ジオメトリ記述子から複合エンティティを再生成"""
+        base_attrs = {'layer': layer_name, 'color': layer_color}
+        points = descriptor['points']
+        codes = descriptor['codes'].tolist()
+
+        if entity_type == 'SPLINE':
+            degree, flags, n_control, n_fit, n_knots, _n_weights = codes
+            spline = target_space.add_spline(dxfattribs=dict(base_attrs, degree=degree))
+            spline.dxf.flags = flags
+            spline.control_points = points[:n_control].tolist()
+            spline.fit_points = points[n_control:n_control + n_fit].tolist()
+            spline.knots = descriptor['params'][:n_knots].tolist()
+            spline.weights = descriptor['params'][n_knots:].tolist()
+
+        elif entity_type == 'HATCH':
+            hatch = target_space.add_hatch(color=layer_color, dxfattribs={'layer': layer_name})
+            if codes[0]:
+                hatch.set_solid_fill(color=layer_color)
+            else:
+                pattern_args = dict(color=layer_color, angle=float(descriptor['params'][0]),
+                                    scale=float(descriptor['lengths'][0]))
+                try:
+                    hatch.set_pattern_fill(descriptor.get('label') or 'ANSI31', **pattern_args)
+                except Exception:
+                    # ezdxf に定義のないパターン名
+                    hatch.set_pattern_fill('ANSI31', **pattern_args)
+            self._add_hatch_boundary_paths(hatch, codes, points)
+
+        elif entity_type == 'POLYLINE':
+            kind = codes[0]
+            if kind == POLYLINE_KIND_MESH:
+                mesh = MeshBuilder()
+                mesh.vertices = [tuple(p) for p in points.tolist()]
+                position = 2
+                for _ in range(codes[1]):
+                    size = codes[position]
+                    mesh.faces.append(tuple(codes[position + 1:position + 1 + size]))
+                    position += 1 + size
+                mesh.render_polyface(target_space, dxfattribs=base_attrs)
+            elif kind == POLYLINE_KIND_3D:
+                target_space.add_polyline3d(points.tolist(), close=bool(codes[1]), dxfattribs=base_attrs)
+            else:
+                rows = np.column_stack([points[:, :2], descriptor['widths'], descriptor['bulges']])
+                target_space.add_polyline2d([tuple(r) for r in rows.tolist()], format='xyseb',
+                                            close=bool(codes[1]), dxfattribs=base_attrs)
+
+        elif entity_type == 'DIMENSION':
+            return self._create_dimension_from_descriptor(descriptor, target_space, base_attrs)
+
+        elif entity_type == 'LEADER':
+            dimstyle = self._available_dimstyle(target_space, descriptor.get('label', ''))
+            target_space.add_leader(
+                points.tolist(), dimstyle=dimstyle,
+                dxfattribs=dict(base_attrs, has_arrowhead=codes[0], path_type=codes[1]))
+
+        else:
+            return False
+
+        return True
+
+    @staticmethod
+    def _add_hatch_boundary_paths(hatch, codes: List[int], points: np.ndarray):
+        """記述子のコマンド列から HATCH の境界パスを再生成
+
+        直線のみのパスはポリラインパス、曲線を含むパスは LINE / SPLINE エッジのエッジパスにする。
+        """
+        points_per_command = {1: 1, 2: 2, 3: 3}  # LINE_TO / CURVE3_TO / CURVE4_TO
+        position, point_index = 2, 0
+        for _ in range(codes[1]):
+            flags, n_commands = codes[position], codes[position + 1]
+            command_types = codes[position + 2:position + 2 + n_commands]
+            position += 2 + n_commands
+            n_points = 1 + sum(points_per_command.get(c, 1) for c in command_types)
+            path_points = points[point_index:point_index + n_points, :2].tolist()
+            point_index += n_points
+
+            if all(c == 1 for c in command_types):
+                if len(path_points) > 1 and path_points[-1] == path_points[0]:
+                    path_points = path_points[:-1]
+                hatch.paths.add_polyline_path(path_points, is_closed=True, flags=flags)
+                continue
+
+            edge_path = hatch.paths.add_edge_path(flags)
+            current, cursor = path_points[0], 1
+            for command_type in command_types:
+                count = points_per_command.get(command_type, 1)
+                segment = path_points[cursor:cursor + count]
+                cursor += count
+                if command_type == 1:
+                    edge_path.add_line(current, segment[-1])
+                else:
+                    # 1区間のベジェ曲線は開一様ノットの B スプラインと同一
+                    edge_path.add_spline(control_points=[current] + segment, degree=count)
+                current = segment[-1]
+
+    @staticmethod
+    def _available_dimstyle(target_space, dimstyle: str) -> str:
+        """出力ドキュメントに存在する寸法スタイル名を返す（なければ Standard）"""
+        name = dimstyle.split('|', 1)[0]
+        return name if target_space.doc.dimstyles.has_entry(name) else 'Standard'
+
+    def _create_dimension_from_descriptor(self, descriptor: Dict[str, Any], target_space,
+                                          base_attrs: Dict) -> bool:
+        """記述子の定義点から DIMENSION を再生成し、寸法ジオメトリブロックを描画"""
+        dimtype, present = descriptor['codes'].tolist()
+        dimstyle, _, text = descriptor.get('label', '').partition('|')
+        dimattribs = dict(base_attrs,
+                          dimtype=dimtype,
+                          dimstyle=self._available_dimstyle(target_space, dimstyle),
+                          text=text,
+                          angle=float(descriptor['params'][0]))
+        for i, attr_name in enumerate(DIMENSION_POINT_ATTRS):
+            if present & (1 << i):
+                dimattribs[attr_name] = tuple(descriptor['points'][i])
+
+        dimension = target_space.new_entity('DIMENSION', dxfattribs=dimattribs)
+        try:
+            dimension.override().render()
+        except Exception as e:
+            # ezdxf が描画できない寸法タイプは、寸法値のテキストで代替する
+            if self.debug:
+                logger.debug(f"Failed to render DIMENSION: {e}")
+            target_space.delete_entity(dimension)
+            measurement = descriptor['lengths'][0] if 'lengths' in descriptor else descriptor['params'][-1]
+            position = dimattribs.get('text_midpoint', dimattribs.get('defpoint', (0, 0, 0)))
+            target_space.add_text(
+                text=text if text and text != '<>' else f"{measurement:g}",
+                dxfattribs=dict(base_attrs, insert=position, height=2.5))
+        return True
+
+    def _ensure_japanese_text_compatibility(self, output_file: str):
+        """日本語テキストの互換性を確保"""
+        try:
+            # DXF R2018+ はネイティブでUTF-8をサポートするため、
+            # ファイルがUTF-8で正しく保存されていることを確認
+            with open(output_file, 'rb') as f:
+                content = f.read()
+            
+            # UTF-8として読み込み、正常に読み込めることを確認
             try:
                 text_content = content.decode('utf-8')
                 # UTF-8で正常に読み込める場合は何もしない
@@ -888,74 +1925,320 @@ class OutputGenerator:
             logger.warning(f"Error ensuring Japanese text compatibility: {e}")
             # エラーの場合は元のファイルをそのまま使用
     
-    def create_diff_dxf(self, entities_a: Dict, entities_b: Dict, 
-                        deleted_hashes: Set[str], added_hashes: Set[str], 
-                        common_hashes: Set[str], output_file: str):
-        """差分DXFファイルを作成"""
+    def is_context_entity(self, absolute_entity: ExpandedEntity, context_min_length: float) -> bool:
+        """CONTEXT レイヤーに残す簡略化対象（図面枠・長い線分）かどうかを判定"""
+        entity_type = absolute_entity.dxftype
+        if entity_type not in ('LINE', 'LWPOLYLINE'):
+            # 対象外のタイプは attributes に触れない（DeferredExpandedEntity を展開しない）
+            return False
+        try:
+            if entity_type == 'LINE':
+                attrs = absolute_entity.attributes
+                # 図面枠（extract_labels の枠検出と同じ lineweight=100・color=7 の LINE）
+                if attrs.get('lineweight') == 100 and attrs.get('color') == 7:
+                    return True
+                start = attrs.get('start', (0, 0, 0))
+                end = attrs.get('end', (0, 0, 0))
+                return math.hypot(end[0] - start[0], end[1] - start[1]) >= context_min_length
+            if entity_type == 'LWPOLYLINE':
+                vertices = absolute_entity.attributes.get('vertices')
+                if vertices is None or len(vertices) < 2:
+                    return False
+                length = float(np.hypot(*np.diff(vertices[:, :2], axis=0).T).sum())
+                return length >= context_min_length
+        except Exception:
+            pass
+        return False
+
+    def _write_entities(self, entities: Dict, hashes: Set[str], msp, diff_type: str,
+                        entity_filter=None) -> int:
+        """ハッシュ集合のエンティティを指定レイヤーに書き出し、書き出し件数を返す"""
+        layer_name = self.layer_config.get_layer_name(diff_type)
+        layer_color = self.layer_config.get_layer_color(diff_type)
+
+        written = 0
+        for entity_hash in hashes:
+            absolute_entity = entities.get(entity_hash)  # 最初のインスタンスのみ保持されている
+            if absolute_entity is not None:
+                if entity_filter is None or entity_filter(absolute_entity):
+                    if self.create_entity_from_absolute(absolute_entity, msp, layer_name, layer_color):
+                        written += 1
+        return written
+
+    def _write_space_diff(self, space, entities_a: Dict, entities_b: Dict,
+                          deleted_hashes: Set[str], added_hashes: Set[str], common_hashes: Set[str],
+                          output_mode: str, context_min_length: float) -> Dict[str, int]:
+        """1つの空間（モデル空間またはレイアウト）に差分を書き出し、レイヤー別の書き出し件数を返す"""
+        # DELETED / ADDED エンティティを追加
+        written_deleted = self._write_entities(entities_a, deleted_hashes, space, 'DELETED')
+        written_added = self._write_entities(entities_b, added_hashes, space, 'ADDED')
+
+        # UNCHANGED エンティティを追加（出力モードに応じて全件・簡略化・なし）
+        written_unchanged = 0
+        written_context = 0
+        if output_mode == OUTPUT_MODE_FULL:
+            written_unchanged = self._write_entities(entities_a, common_hashes, space, 'UNCHANGED')
+        elif output_mode == OUTPUT_MODE_CHANGES_WITH_CONTEXT:
+            written_context = self._write_entities(
+                entities_a, common_hashes, space, 'CONTEXT',
+                entity_filter=lambda e: self.is_context_entity(e, context_min_length))
+
+        return {
+            'written_deleted': written_deleted,
+            'written_added': written_added,
+            'written_unchanged': written_unchanged,
+            'written_context': written_context,
+            'written_total': written_deleted + written_added + written_unchanged + written_context,
+        }
+
+    def create_diff_dxf(self, entities_a: Dict, entities_b: Dict,
+                        deleted_hashes: Set[str], added_hashes: Set[str],
+                        common_hashes: Set[str], output_file: str,
+                        output_mode: str = OUTPUT_MODE_FULL,
+                        context_min_length: float = 50.0,
+                        layout_diffs: Optional[List[Tuple[str, Dict, Dict, Set, Set, Set]]] = None):
+        """差分DXFファイルを作成
+
+        output_mode:
+            'full': DELETED / ADDED / UNCHANGED をすべて出力（従来の挙動）
+            'changes_only': DELETED / ADDED のみ出力
+            'changes_with_context': 差分に加え、UNCHANGED のうち図面枠と
+                context_min_length 以上の線分だけを CONTEXT レイヤーに出力
+
+        layout_diffs: ペーパー空間レイアウトの差分
+            (レイアウト名, entities_a, entities_b, deleted, added, common) のリスト。
+            出力DXFに同名のレイアウトを作成して書き出す。
+
+        出力件数と出力ドキュメントの準備時間（setup_seconds）は
+        self.last_output_counts に格納する（written_* は全空間の合計、
+        layout_diffs がある場合は layouts にレイアウト別の件数を持つ）。
+        """
+        self.last_output_counts = None
+        if output_mode not in OUTPUT_MODES:
+            logger.error(f"Unknown output mode: {output_mode}")
+            return False
+
+        template = None
         try:
             # R2018以降でより良いUnicode対応
-            new_doc = ezdxf.new('R2018', setup=True)
+            # レイヤー設定済みのテンプレートを再利用（ezdxf.new(setup=True) を毎回行わない）
+            setup_start = time.perf_counter()
+            template = get_diff_document_template('R2018')
+            new_doc = template.acquire(self.layer_config)
             msp = new_doc.modelspace()
+            setup_seconds = time.perf_counter() - setup_start
             
-            # レイヤーを作成
-            layers = new_doc.layers
-            for diff_type in ['DELETED', 'ADDED', 'UNCHANGED']:
-                layer_name = self.layer_config.get_layer_name(diff_type)
-                layer_color = self.layer_config.get_layer_color(diff_type)
-                layer = layers.new(layer_name)
-                layer.color = layer_color
-            
-            # DELETED エンティティを追加
-            layer_name = self.layer_config.get_layer_name('DELETED')
-            layer_color = self.layer_config.get_layer_color('DELETED')
-            
-            for entity_hash in deleted_hashes:
-                if entity_hash in entities_a:
-                    for location, virtual_entity in entities_a[entity_hash]:
-                        absolute_entity = virtual_entity['absolute_entity']
-                        self.create_entity_from_absolute(absolute_entity, msp, layer_name, layer_color)
-                        break  # 最初のインスタンスのみ
-            
-            # ADDED エンティティを追加
-            layer_name = self.layer_config.get_layer_name('ADDED')
-            layer_color = self.layer_config.get_layer_color('ADDED')
-            
-            for entity_hash in added_hashes:
-                if entity_hash in entities_b:
-                    for location, virtual_entity in entities_b[entity_hash]:
-                        absolute_entity = virtual_entity['absolute_entity']
-                        self.create_entity_from_absolute(absolute_entity, msp, layer_name, layer_color)
-                        break  # 最初のインスタンスのみ
-            
-            # UNCHANGED エンティティを追加
-            layer_name = self.layer_config.get_layer_name('UNCHANGED')
-            layer_color = self.layer_config.get_layer_color('UNCHANGED')
-            
-            for entity_hash in common_hashes:
-                if entity_hash in entities_a:
-                    for location, virtual_entity in entities_a[entity_hash]:
-                        absolute_entity = virtual_entity['absolute_entity']
-                        self.create_entity_from_absolute(absolute_entity, msp, layer_name, layer_color)
-                        break  # 最初のインスタンスのみ
+            written = self._write_space_diff(
+                msp, entities_a, entities_b, deleted_hashes, added_hashes, common_hashes,
+                output_mode, context_min_length)
+
+            # レイアウト別の差分を同名のペーパー空間レイアウトに書き出す
+            layout_written = {MODEL_LAYOUT_NAME: dict(written)}
+            for layout_name, layout_a, layout_b, layout_deleted, layout_added, layout_common in layout_diffs or []:
+                layout = (new_doc.layouts.get(layout_name) if layout_name in new_doc.layouts
+                          else new_doc.layouts.new(layout_name))
+                layout_written[layout_name] = self._write_space_diff(
+                    layout, layout_a, layout_b, layout_deleted, layout_added, layout_common,
+                    output_mode, context_min_length)
+                for key, value in layout_written[layout_name].items():
+                    written[key] += value
             
             # DXFファイルを保存（UTF-8エンコーディングで日本語テキストを保持）
             new_doc.saveas(output_file)
             
             # 日本語テキストの互換性確保
             self._ensure_japanese_text_compatibility(output_file)
+
+            self.last_output_counts = {
+                'output_mode': output_mode,
+                **written,
+                'output_bytes': os.path.getsize(output_file),
+                'setup_seconds': setup_seconds,
+            }
+            if layout_diffs:
+                self.last_output_counts['layouts'] = layout_written
             return True
             
         except Exception as e:
             logger.error(f"Error creating diff DXF file {output_file}: {e}")
             return False
 
+        finally:
+            if template is not None:
+                template.release()
+
+
+# 内容ダイジェストから除外するグループコード（ハンドル・所有者・リアクター等のポインタ類）
+_DIGEST_EXCLUDED_GROUP_CODES = frozenset({5, 102, 105, 390, 1005} | set(range(330, 370)))
+
+# 同一ファイル（同一内容）比較結果のキャッシュ
+# 出力DXFのバイト列を保持するため、件数に加えて合計バイト数でも上限を設ける
+# （上限を超える単一の出力はキャッシュしない）
+_IDENTICAL_RESULT_CACHE_SIZE = 8
+_IDENTICAL_RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+_identical_result_cache: 'OrderedDict[tuple, Tuple[Dict[str, Any], bytes]]' = OrderedDict()
+_identical_result_cache_lock = threading.Lock()
+
+
+def compute_file_digest(file_path: str) -> str:
+    """ファイル内容の SHA-256 ダイジェストを計算"""
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def compute_content_digest(doc) -> str:
+    """モデルスペース・ブロック内エンティティの順序非依存ダイジェストを計算
+
+    各エンティティを DXF タグに書き出し、ハンドル・所有者等のポインタ類を除いて
+    ハッシュ化する。ブロック内のハッシュはソートしてから結合するため、エンティティの
+    並び順・ハンドル・ヘッダー変数の違いは無視される。
+    """
+    from ezdxf.lldxf.tagwriter import TagCollector
+
+    block_digests = []
+    for block in doc.blocks:
+        entity_digests = []
+        for entity in block:
+            collector = TagCollector(dxfversion=doc.dxfversion)
+            entity.export_dxf(collector)
+            payload = '\x1f'.join(
+                f"{tag.code}\x1e{tag.value}" for tag in collector.tags
+                if tag.code not in _DIGEST_EXCLUDED_GROUP_CODES
+            )
+            entity_digests.append(hashlib.sha256(payload.encode('utf-8')).digest())
+        entity_digests.sort()
+        block_sha = hashlib.sha256(block.name.encode('utf-8'))
+        for digest in entity_digests:
+            block_sha.update(digest)
+        block_digests.append(block_sha.digest())
+
+    block_digests.sort()
+    total_sha = hashlib.sha256()
+    for digest in block_digests:
+        total_sha.update(digest)
+    return total_sha.hexdigest()
+
+
+def compute_block_entity_counts(doc) -> Dict[str, int]:
+    """ブロック（モデルスペース・ペーパースペースを含む）ごとのエンティティ数"""
+    return {block.name: len(block) for block in doc.blocks}
+
+
+def has_identical_dxf_content(doc_a, doc_b) -> bool:
+    """2つのドキュメントのエンティティ内容が同一か（ハンドル・ヘッダー変数を除く）を判定
+
+    ブロックごとのエンティティ数を先に比較し、一致した場合のみダイジェストを計算する。
+    """
+    try:
+        if compute_block_entity_counts(doc_a) != compute_block_entity_counts(doc_b):
+            return False
+        return compute_content_digest(doc_a) == compute_content_digest(doc_b)
+    except Exception as e:
+        logger.warning(f"Error computing content digest: {e}")
+        return False
+
+
+def _is_zero_offset(offset_b: Optional[Tuple[float, float]]) -> bool:
+    """オフセット未指定（またはゼロ）かどうか"""
+    return offset_b is None or (offset_b[0] == 0 and offset_b[1] == 0)
+
+
+def _get_identical_result(cache_key: tuple) -> Optional[Tuple[Dict[str, Any], bytes]]:
+    with _identical_result_cache_lock:
+        cached = _identical_result_cache.get(cache_key)
+        if cached is not None:
+            _identical_result_cache.move_to_end(cache_key)
+        return cached
+
+
+def _put_identical_result(cache_key: tuple, entity_counts: Dict[str, Any], output_data: bytes):
+    if len(output_data) > _IDENTICAL_RESULT_CACHE_MAX_BYTES:
+        return
+    with _identical_result_cache_lock:
+        _identical_result_cache[cache_key] = (dict(entity_counts), output_data)
+        _identical_result_cache.move_to_end(cache_key)
+        total_bytes = sum(len(data) for _, data in _identical_result_cache.values())
+        while (len(_identical_result_cache) > _IDENTICAL_RESULT_CACHE_SIZE
+               or total_bytes > _IDENTICAL_RESULT_CACHE_MAX_BYTES):
+            _, (_, evicted) = _identical_result_cache.popitem(last=False)
+            total_bytes -= len(evicted)
+
+
+def build_entity_counts(deleted_hashes: Set[str], added_hashes: Set[str],
+                        common_hashes: Set[str]) -> Dict[str, Any]:
+    """差分ハッシュ集合からエンティティ数情報を作成"""
+    deleted_count = len(deleted_hashes)
+    added_count = len(added_hashes)
+    unchanged_count = len(common_hashes)
+    return {
+        'deleted_entities': deleted_count,
+        'added_entities': added_count,
+        'unchanged_entities': unchanged_count,
+        'diff_entities': deleted_count + added_count,
+        'total_entities': deleted_count + added_count + unchanged_count
+    }
+
+
+def build_entity_breakdown(entities_a: Dict, entities_b: Dict,
+                           deleted_hashes: Set[str], added_hashes: Set[str],
+                           common_hashes: Set[str]) -> Dict[str, Dict[str, Dict[str, int]]]:
+    """差分ハッシュ集合をエンティティタイプ別・レイヤー別に集計
+
+    各ハッシュの最初のインスタンス（出力DXFに書き出されるもの）で分類する。
+    戻り値: {'by_type': {タイプ: {'deleted', 'added', 'unchanged'}},
+             'by_layer': {レイヤー: {'deleted', 'added', 'unchanged'}}}
+    """
+    by_type = defaultdict(lambda: {'deleted': 0, 'added': 0, 'unchanged': 0})
+    by_layer = defaultdict(lambda: {'deleted': 0, 'added': 0, 'unchanged': 0})
+
+    for key, entities, hashes in [('deleted', entities_a, deleted_hashes),
+                                  ('added', entities_b, added_hashes),
+                                  ('unchanged', entities_a, common_hashes)]:
+        for entity_hash in hashes:
+            absolute_entity = entities.get(entity_hash)
+            if absolute_entity is None:
+                continue
+            by_type[absolute_entity.dxftype][key] += 1
+            by_layer[entity_layer(absolute_entity)][key] += 1
+
+    return {
+        'by_type': {k: by_type[k] for k in sorted(by_type)},
+        'by_layer': {k: by_layer[k] for k in sorted(by_layer)},
+    }
+
+
+def _write_cached_identical_result(cache_key: tuple, output_file: str) -> bool:
+    """同一ファイル比較のキャッシュがあれば出力DXFを書き出す"""
+    cached = _get_identical_result(cache_key)
+    if cached is None:
+        return False
+    with open(output_file, 'wb') as f:
+        f.write(cached[1])
+    return True
+
+
+def _identical_counts(cache_key: tuple, short_circuit: str) -> Dict[str, Any]:
+    """キャッシュ済みのエンティティ数情報を short_circuit 付きで返す"""
+    entity_counts = dict(_get_identical_result(cache_key)[0])
+    entity_counts['short_circuit'] = short_circuit
+    entity_counts['setup_seconds'] = 0.0
+    return entity_counts
+
 
 def compare_dxf_files_and_generate_dxf(file_a: str, file_b: str, output_file: str,
                                        tolerance: float = 0.01,
                                        deleted_color: int = 6,
                                        added_color: int = 4,
                                        unchanged_color: int = 7,
-                                       offset_b: Optional[Tuple[float, float]] = None) -> Tuple[bool, Optional[Dict[str, int]]]:
+                                       offset_b: Optional[Tuple[float, float]] = None,
+                                       output_mode: str = OUTPUT_MODE_FULL,
+                                       context_min_length: float = 50.0,
+                                       precheck_identical: bool = True,
+                                       diff_engine: str = DIFF_ENGINE_SIGNATURE,
+                                       filter_config: Optional[FilterConfig] = None) -> Tuple[bool, Optional[Dict[str, Any]]]:
     """
     DXFファイル比較メイン処理（Streamlit用インターフェース）
 
@@ -968,36 +2251,72 @@ def compare_dxf_files_and_generate_dxf(file_a: str, file_b: str, output_file: st
         added_color: 追加エンティティの色（デフォルト: 4=シアン）
         unchanged_color: 変更なしエンティティの色（デフォルト: 7=白/黒）
         offset_b: ファイルBに適用するオフセット (dx, dy) のタプル (オプション)
+        output_mode: 出力モード（'full' / 'changes_only' / 'changes_with_context'）
+        context_min_length: 'changes_with_context' で CONTEXT に残す線分の最小長
+        precheck_identical: A/B がバイト単位またはエンティティ内容で同一なら、
+            B の展開・ハッシュ化を省略して全件 UNCHANGED の結果を返す
+            （オフセット指定時は無効。結果は A のファイルダイジェスト単位でキャッシュする）
+        diff_engine: 'signature'（署名ハッシュ）または 'columnar'（列指向テーブル）
+        filter_config: レイヤー・ブロック名・エンティティタイプのフィルタ（オプション）。
+            除外されたエンティティは展開・ハッシュ化・出力のいずれも行わない
 
     Returns:
-        Tuple[bool, Optional[Dict[str, int]]]: (成功フラグ, エンティティ数情報)
+        Tuple[bool, Optional[Dict[str, Any]]]: (成功フラグ, エンティティ数情報)
             エンティティ数情報は以下のキーを含む辞書:
                 - deleted_entities: 削除されたエンティティ数
                 - added_entities: 追加されたエンティティ数
                 - unchanged_entities: 変更なしエンティティ数
                 - diff_entities: 差分エンティティ数（削除+追加）
                 - total_entities: 総エンティティ数
+                - output_mode: 使用した出力モード
+                - written_deleted / written_added / written_unchanged / written_context:
+                  出力DXFに書き出したレイヤー別エンティティ数
+                - written_total: 出力DXFに書き出したエンティティ総数
+                - output_bytes: 出力DXFのファイルサイズ
+                - setup_seconds: 出力ドキュメント（テンプレート）の準備時間
+                - short_circuit: 'identical_file' / 'identical_content' / None
     """
     try:
         # 設定の初期化
         tolerance_config = ToleranceConfig(tolerance)
         transformer = CoordinateTransformer(tolerance_config, debug=False)
-        expander_a = EntityExpander(transformer, debug=False, global_offset=None)
-        expander_b = EntityExpander(transformer, debug=False, global_offset=offset_b)
-        signature_generator = SignatureGenerator(transformer, debug=False)
-        diff_analyzer = DiffAnalyzer(signature_generator, debug=False)
+        expander_a = EntityExpander(transformer, debug=False, global_offset=None, filter_config=filter_config)
+        expander_b = EntityExpander(transformer, debug=False, global_offset=offset_b, filter_config=filter_config)
+        diff_analyzer = create_diff_analyzer(transformer, diff_engine)
         layer_config = LayerConfig(deleted_color, added_color, unchanged_color)
         output_generator = OutputGenerator(transformer, layer_config, debug=False)
 
+        # 同一ファイル判定（バイト一致なら B の読み込み自体を省略）
+        short_circuit = None
+        cache_key = None
+        precheck = precheck_identical and _is_zero_offset(offset_b)
+        if precheck:
+            digest_a = compute_file_digest(file_a)
+            if digest_a == compute_file_digest(file_b):
+                short_circuit = 'identical_file'
+            cache_key = (digest_a, tolerance, deleted_color, added_color, unchanged_color,
+                         output_mode, context_min_length, diff_engine,
+                         filter_config.cache_key() if filter_config is not None else None)
+            if short_circuit and _write_cached_identical_result(cache_key, output_file):
+                return True, _identical_counts(cache_key, short_circuit)
+
         # DXFファイル読み込み
         doc_a = ezdxf.readfile(file_a)
-        doc_b = ezdxf.readfile(file_b)
+        doc_b = None if short_circuit else ezdxf.readfile(file_b)
+
+        # 同一内容判定（ハンドル・ヘッダー変数のみの違いは同一とみなす）
+        if precheck and doc_b is not None and has_identical_dxf_content(doc_a, doc_b):
+            short_circuit = 'identical_content'
+            if _write_cached_identical_result(cache_key, output_file):
+                return True, _identical_counts(cache_key, short_circuit)
 
         # エンティティ抽出（ファイルBにはオフセット適用済み）
-        entities_a, data_a, locations_a = diff_analyzer.extract_entities_from_doc(
-            doc_a, "A", expander_a)
-        entities_b, data_b, locations_b = diff_analyzer.extract_entities_from_doc(
-            doc_b, "B", expander_b)
+        # 同一と判定済みの場合は A の抽出結果を B にも使う
+        entities_a = diff_analyzer.extract_entities_from_doc(doc_a, "A", expander_a)
+        if short_circuit:
+            entities_b = entities_a
+        else:
+            entities_b = diff_analyzer.extract_entities_from_doc(doc_b, "B", expander_b)
         
         # 差分計算
         hashes_a = set(entities_a.keys())
@@ -1008,33 +2327,24 @@ def compare_dxf_files_and_generate_dxf(file_a: str, file_b: str, output_file: st
         common_hashes = hashes_a & hashes_b
 
         # エンティティ数を計算
-        deleted_count = len(deleted_hashes)
-        added_count = len(added_hashes)
-        unchanged_count = len(common_hashes)
-        diff_count = deleted_count + added_count
-        total_count = deleted_count + added_count + unchanged_count
-
-        entity_counts = {
-            'deleted_entities': deleted_count,
-            'added_entities': added_count,
-            'unchanged_entities': unchanged_count,
-            'diff_entities': diff_count,
-            'total_entities': total_count
-        }
+        entity_counts = build_entity_counts(deleted_hashes, added_hashes, common_hashes)
 
         # 差分DXFファイル生成
         success = output_generator.create_diff_dxf(
-            entities_a, entities_b, deleted_hashes, added_hashes, common_hashes, output_file)
+            entities_a, entities_b, deleted_hashes, added_hashes, common_hashes, output_file,
+            output_mode=output_mode, context_min_length=context_min_length)
+        if success and output_generator.last_output_counts:
+            entity_counts.update(output_generator.last_output_counts)
+        entity_counts['short_circuit'] = short_circuit
+        if success and short_circuit:
+            with open(output_file, 'rb') as f:
+                _put_identical_result(cache_key, entity_counts, f.read())
 
         # メモリ解放: 大きなデータ構造を削除
         del doc_a
         del doc_b
         del entities_a
         del entities_b
-        del data_a
-        del data_b
-        del locations_a
-        del locations_b
         del deleted_hashes
         del added_hashes
         del common_hashes
@@ -1047,4 +2357,678 @@ def compare_dxf_files_and_generate_dxf(file_a: str, file_b: str, output_file: st
         logger.error(f"DXF comparison error: {e}")
         # エラー時もメモリ解放
         gc.collect()
-        return False, None
\ No newline at end of file
+        return False, None
+
+
+def summarize_dxf_differences(file_a: str, file_b: str,
+                              tolerance: float = 0.01,
+                              offset_b: Optional[Tuple[float, float]] = None,
+                              precheck_identical: bool = True,
+                              diff_engine: str = DIFF_ENGINE_SIGNATURE,
+                              filter_config: Optional[FilterConfig] = None) -> Tuple[bool, Optional[Dict[str, Any]]]:
+    """
+    DXFファイル比較のサマリーのみを計算（差分DXFは生成しない）
+
+    ハッシュ差分を求めた時点で処理を終え、出力DXFの構築・保存・再読込を行わない。
+    改訂に意味のある変更があるかを大量のペアで素早く判定するための入り口。
+
+    Returns:
+        Tuple[bool, Optional[Dict[str, Any]]]: (成功フラグ, エンティティ数情報)
+            compare_dxf_files_and_generate_dxf と同じエンティティ数キーに加え、
+            以下のキーを含む:
+                - by_type: エンティティタイプ別の {'deleted', 'added', 'unchanged'}
+                - by_layer: レイヤー別の {'deleted', 'added', 'unchanged'}
+                - short_circuit: 'identical_file' / 'identical_content' / None
+    """
+    try:
+        tolerance_config = ToleranceConfig(tolerance)
+        transformer = CoordinateTransformer(tolerance_config, debug=False)
+        expander_a = EntityExpander(transformer, debug=False, global_offset=None, filter_config=filter_config)
+        expander_b = EntityExpander(transformer, debug=False, global_offset=offset_b, filter_config=filter_config)
+        diff_analyzer = create_diff_analyzer(transformer, diff_engine)
+
+        short_circuit = None
+        precheck = precheck_identical and _is_zero_offset(offset_b)
+        if precheck and compute_file_digest(file_a) == compute_file_digest(file_b):
+            short_circuit = 'identical_file'
+
+        doc_a = ezdxf.readfile(file_a)
+        doc_b = None if short_circuit else ezdxf.readfile(file_b)
+        if precheck and doc_b is not None and has_identical_dxf_content(doc_a, doc_b):
+            short_circuit = 'identical_content'
+
+        entities_a = diff_analyzer.extract_entities_from_doc(doc_a, "A", expander_a)
+        del doc_a
+        if short_circuit:
+            entities_b = entities_a
+        else:
+            entities_b = diff_analyzer.extract_entities_from_doc(doc_b, "B", expander_b)
+        del doc_b
+
+        success, entity_counts = diff_signature_tables(entities_a, entities_b, None)
+        entity_counts['short_circuit'] = short_circuit
+        return success, entity_counts
+
+    except Exception as e:
+        logger.error(f"DXF summary error: {e}")
+        return False, None
+
+
+def _summarize_pair(args):
+    """summarize_multiple_dxf_pairs のワーカー（プロセスプールから呼ばれる）"""
+    file_a, file_b, tolerance, offset_b, diff_engine, filter_config = args
+    return summarize_dxf_differences(file_a, file_b, tolerance=tolerance, offset_b=offset_b,
+                                     diff_engine=diff_engine, filter_config=filter_config)
+
+
+def summarize_multiple_dxf_pairs(file_pairs: List[Tuple[str, str]],
+                                 tolerance: float = 0.01,
+                                 offsets_b: Optional[List[Optional[Tuple[float, float]]]] = None,
+                                 max_workers: Optional[int] = None,
+                                 diff_engine: str = DIFF_ENGINE_SIGNATURE,
+                                 filter_config: Optional[FilterConfig] = None) -> List[Tuple[bool, Optional[Dict[str, Any]]]]:
+    """
+    複数ペアのサマリーを一括計算（差分DXFは生成しない）
+
+    Args:
+        file_pairs: (基準ファイル, 比較対象ファイル) のリスト
+        tolerance: 座標許容誤差
+        offsets_b: ペアごとのファイルBオフセット（オプション、file_pairs と同じ順序）
+        max_workers: 2以上でプロセス並列実行（None/1 は逐次実行）
+        diff_engine: 'signature' または 'columnar'
+        filter_config: レイヤー・ブロック名・エンティティタイプのフィルタ（オプション）
+
+    Returns:
+        file_pairs と同じ順序の (成功フラグ, エンティティ数情報) のリスト
+    """
+    tasks = [
+        (file_a, file_b, tolerance, offsets_b[i] if offsets_b and i < len(offsets_b) else None, diff_engine,
+         filter_config)
+        for i, (file_a, file_b) in enumerate(file_pairs)
+    ]
+
+    if not max_workers or max_workers <= 1 or len(tasks) <= 1:
+        return [_summarize_pair(task) for task in tasks]
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_summarize_pair, tasks, chunksize=max(1, len(tasks) // (max_workers * 4))))
+
+
+def diff_signature_tables(entities_a: Dict[str, ExpandedEntity], entities_b: Dict[str, ExpandedEntity],
+                          output_file: Optional[str],
+                          transformer: Optional[CoordinateTransformer] = None,
+                          deleted_color: int = 6,
+                          added_color: int = 4,
+                          unchanged_color: int = 7,
+                          output_mode: str = OUTPUT_MODE_FULL,
+                          context_min_length: float = 50.0) -> Tuple[bool, Optional[Dict[str, Any]]]:
+    """
+    抽出済みのハッシュテーブル同士を比較
+
+    output_file が None の場合はサマリーのみ（by_type / by_layer 付き）を返し、
+    指定された場合は差分DXFを生成して出力件数を含むエンティティ数情報を返す。
+    """
+    hashes_a = entities_a.keys()
+    hashes_b = entities_b.keys()
+    deleted_hashes = set(hashes_a - hashes_b)
+    added_hashes = set(hashes_b - hashes_a)
+    common_hashes = set(hashes_a & hashes_b)
+
+    entity_counts = build_entity_counts(deleted_hashes, added_hashes, common_hashes)
+    if output_file is None:
+        entity_counts.update(build_entity_breakdown(
+            entities_a, entities_b, deleted_hashes, added_hashes, common_hashes))
+        return True, entity_counts
+
+    if transformer is None:
+        transformer = CoordinateTransformer(ToleranceConfig(), debug=False)
+    layer_config = LayerConfig(deleted_color, added_color, unchanged_color)
+    output_generator = OutputGenerator(transformer, layer_config, debug=False)
+    success = output_generator.create_diff_dxf(
+        entities_a, entities_b, deleted_hashes, added_hashes, common_hashes, output_file,
+        output_mode=output_mode, context_min_length=context_min_length)
+    if success and output_generator.last_output_counts:
+        entity_counts.update(output_generator.last_output_counts)
+    return success, entity_counts if success else None
+
+
+class BaselineIndex:
+    """基準ファイル（A）の展開済みエンティティと署名テーブルを保持するインデックス
+
+    1つの基準図面を複数の比較対象（B）と比較する場合に、A の読み込み・INSERT展開・
+    ハッシュ化を1回で済ませる。構築後は読み取り専用として扱うため、逐次の比較でも
+    プロセス並列のワーカー（compare_many_against_baseline）でも共有できる。
+    """
+
+    def __init__(self, file_a: str, tolerance: float = 0.01, precheck_identical: bool = True,
+                 diff_engine: str = DIFF_ENGINE_SIGNATURE, filter_config: Optional[FilterConfig] = None):
+        self.file_a = file_a
+        self.tolerance = tolerance
+        self.precheck_identical = precheck_identical
+        self.diff_engine = diff_engine
+        self.filter_config = filter_config  # A・B の両方に適用する
+
+        self.transformer = CoordinateTransformer(ToleranceConfig(tolerance), debug=False)
+        self.diff_analyzer = create_diff_analyzer(self.transformer, diff_engine)
+
+        doc_a = ezdxf.readfile(file_a)
+        self.entities = self.diff_analyzer.extract_entities_from_doc(
+            doc_a, "A", EntityExpander(self.transformer, debug=False, global_offset=None,
+                                       filter_config=filter_config))
+        self.hashes = frozenset(self.entities.keys())
+
+        # 同一ファイル・同一内容判定用（summarize / compare で B 側と比較する）
+        self.file_digest = None
+        self.block_counts = None
+        self.content_digest = None
+        if precheck_identical:
+            try:
+                self.file_digest = compute_file_digest(file_a)
+                self.block_counts = compute_block_entity_counts(doc_a)
+                self.content_digest = compute_content_digest(doc_a)
+            except Exception as e:
+                logger.warning(f"Error computing baseline digest: {e}")
+        del doc_a
+
+    def extract_revision(self, file_b: str,
+                         offset_b: Optional[Tuple[float, float]] = None) -> Tuple[Dict[str, ExpandedEntity], Optional[str]]:
+        """比較対象ファイルを抽出し (entities_b, short_circuit) を返す
+
+        基準と同一（バイト一致または内容一致）の場合は基準のテーブルをそのまま返す。
+        """
+        precheck = self.precheck_identical and _is_zero_offset(offset_b) and self.file_digest
+        if precheck and compute_file_digest(file_b) == self.file_digest:
+            return self.entities, 'identical_file'
+
+        doc_b = ezdxf.readfile(file_b)
+        if precheck and self.content_digest:
+            try:
+                if (compute_block_entity_counts(doc_b) == self.block_counts
+                        and compute_content_digest(doc_b) == self.content_digest):
+                    return self.entities, 'identical_content'
+            except Exception as e:
+                logger.warning(f"Error computing content digest: {e}")
+
+        expander_b = EntityExpander(self.transformer, debug=False, global_offset=offset_b,
+                                    filter_config=self.filter_config)
+        entities_b = self.diff_analyzer.extract_entities_from_doc(doc_b, "B", expander_b)
+        return entities_b, None
+
+    def summarize(self, file_b: str,
+                  offset_b: Optional[Tuple[float, float]] = None) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """summarize_dxf_differences と同じ結果を、基準の抽出を再利用して返す"""
+        try:
+            entities_b, short_circuit = self.extract_revision(file_b, offset_b)
+            success, entity_counts = diff_signature_tables(self.entities, entities_b, None)
+            entity_counts['short_circuit'] = short_circuit
+            return success, entity_counts
+
+        except Exception as e:
+            logger.error(f"DXF summary error ({file_b}): {e}")
+            return False, None
+
+    def compare(self, file_b: str, output_file: str,
+                offset_b: Optional[Tuple[float, float]] = None,
+                deleted_color: int = 6,
+                added_color: int = 4,
+                unchanged_color: int = 7,
+                output_mode: str = OUTPUT_MODE_FULL,
+                context_min_length: float = 50.0) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """compare_dxf_files_and_generate_dxf と同じ結果を、基準の抽出を再利用して返す"""
+        try:
+            entities_b, short_circuit = self.extract_revision(file_b, offset_b)
+            success, entity_counts = diff_signature_tables(
+                self.entities, entities_b, output_file,
+                transformer=self.transformer,
+                deleted_color=deleted_color, added_color=added_color, unchanged_color=unchanged_color,
+                output_mode=output_mode, context_min_length=context_min_length)
+            if entity_counts is not None:
+                entity_counts['short_circuit'] = short_circuit
+
+            del entities_b
+            gc.collect()
+            return success, entity_counts
+
+        except Exception as e:
+            logger.error(f"DXF comparison error ({file_b}): {e}")
+            gc.collect()
+            return False, None
+
+
+# プロセス並列ワーカーが共有する基準インデックス（ワーカー初期化時に1回だけ受け取る）
+_worker_baseline_index: Optional[BaselineIndex] = None
+
+
+def _init_baseline_worker(baseline_index: BaselineIndex):
+    global _worker_baseline_index
+    _worker_baseline_index = baseline_index
+
+
+def _compare_with_worker_baseline(args):
+    """compare_many_against_baseline のワーカー"""
+    file_b, output_file, offset_b, options = args
+    if output_file is None:
+        return _worker_baseline_index.summarize(file_b, offset_b)
+    return _worker_baseline_index.compare(file_b, output_file, offset_b, **options)
+
+
+def compare_many_against_baseline(baseline: Any, files_b: List[str],
+                                  output_files: Optional[List[str]] = None,
+                                  tolerance: float = 0.01,
+                                  offsets_b: Optional[List[Optional[Tuple[float, float]]]] = None,
+                                  max_workers: Optional[int] = None,
+                                  diff_engine: str = DIFF_ENGINE_SIGNATURE,
+                                  filter_config: Optional[FilterConfig] = None,
+                                  **output_options) -> List[Tuple[bool, Optional[Dict[str, Any]]]]:
+    """
+    1つの基準ファイルを複数の比較対象ファイルと比較
+
+    Args:
+        baseline: 基準DXFファイルパス、または構築済みの BaselineIndex
+        files_b: 比較対象DXFファイルパスのリスト
+        output_files: files_b と同じ順序の出力DXFパス（None の場合はサマリーのみ）
+        tolerance: 座標許容誤差（baseline がパスの場合のみ使用）
+        offsets_b: 比較対象ごとのオフセット（オプション）
+        max_workers: 2以上でプロセス並列実行（各ワーカーは基準インデックスを1回だけ受け取る）
+        diff_engine: 'signature' または 'columnar'（baseline がパスの場合のみ使用）
+        filter_config: レイヤー・ブロック名・エンティティタイプのフィルタ（baseline がパスの場合のみ使用）
+        **output_options: BaselineIndex.compare に渡す出力設定
+            （deleted_color, added_color, unchanged_color, output_mode, context_min_length）
+
+    Returns:
+        files_b と同じ順序の (成功フラグ, エンティティ数情報) のリスト
+    """
+    baseline_index = (baseline if isinstance(baseline, BaselineIndex)
+                      else BaselineIndex(baseline, tolerance, diff_engine=diff_engine,
+                                         filter_config=filter_config))
+
+    tasks = [
+        (file_b,
+         output_files[i] if output_files else None,
+         offsets_b[i] if offsets_b and i < len(offsets_b) else None,
+         output_options)
+        for i, file_b in enumerate(files_b)
+    ]
+
+    if not max_workers or max_workers <= 1 or len(tasks) <= 1:
+        _init_baseline_worker(baseline_index)
+        try:
+            return [_compare_with_worker_baseline(task) for task in tasks]
+        finally:
+            _init_baseline_worker(None)
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_baseline_worker,
+                             initargs=(baseline_index,)) as executor:
+        return list(executor.map(_compare_with_worker_baseline, tasks))
+
+
+def _extract_chain_revision(args):
+    """compare_revision_chain のワーカー: 1ファイルを抽出し (ハッシュテーブル, ファイルダイジェスト) を返す"""
+    file_path, tolerance, diff_engine, filter_config = args
+    transformer = CoordinateTransformer(ToleranceConfig(tolerance), debug=False)
+    diff_analyzer = create_diff_analyzer(transformer, diff_engine)
+    doc = ezdxf.readfile(file_path)
+    entities = diff_analyzer.extract_entities_from_doc(
+        doc, file_path, EntityExpander(transformer, debug=False, global_offset=None,
+                                       filter_config=filter_config))
+    del doc
+    return entities, compute_file_digest(file_path)
+
+
+def compare_revision_chain(files: List[str],
+                           output_files: Optional[List[Optional[str]]] = None,
+                           tolerance: float = 0.01,
+                           include_first_to_last: bool = False,
+                           first_to_last_output: Optional[str] = None,
+                           max_workers: Optional[int] = None,
+                           diff_engine: str = DIFF_ENGINE_SIGNATURE,
+                           filter_config: Optional[FilterConfig] = None,
+                           **output_options) -> List[Tuple[str, str, bool, Optional[Dict[str, Any]]]]:
+    """
+    改訂履歴（rev A → B → C → ...）を各ファイル1回の抽出で比較
+
+    各ファイルの読み込み・展開・ハッシュ化は1回だけ行い（max_workers が2以上なら
+    プロセス並列）、そのハッシュテーブルを前後両方の比較で再利用する。
+
+    Args:
+        files: 改訂順に並べたDXFファイルパスのリスト
+        output_files: 連続ペアごとの出力DXFパス（長さ len(files)-1、None または要素 None はサマリーのみ）
+        tolerance: 座標許容誤差
+        include_first_to_last: 最初と最後のファイルの比較も行う
+        first_to_last_output: 最初と最後の比較の出力DXFパス（None はサマリーのみ）
+        max_workers: 2以上でファイルごとの抽出をプロセス並列実行
+        diff_engine: 'signature' または 'columnar'
+        filter_config: レイヤー・ブロック名・エンティティタイプのフィルタ（オプション）
+        **output_options: 出力設定（deleted_color, added_color, unchanged_color,
+            output_mode, context_min_length）
+
+    Returns:
+        (基準ファイル, 比較対象ファイル, 成功フラグ, エンティティ数情報) のリスト。
+        連続ペアの順に並び、include_first_to_last の場合は最後に最初→最後の比較が付く。
+    """
+    if len(files) < 2:
+        return []
+
+    tasks = [(file_path, tolerance, diff_engine, filter_config) for file_path in files]
+    tables: List[Optional[Tuple[Dict[str, ExpandedEntity], str]]] = [None] * len(files)
+
+    def _safe_extract(task):
+        try:
+            return _extract_chain_revision(task)
+        except Exception as e:
+            logger.error(f"DXF extraction error ({task[0]}): {e}")
+            return None
+
+    if not max_workers or max_workers <= 1:
+        tables = [_safe_extract(task) for task in tasks]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_extract_chain_revision, task) for task in tasks]
+            for i, future in enumerate(futures):
+                try:
+                    tables[i] = future.result()
+                except Exception as e:
+                    logger.error(f"DXF extraction error ({files[i]}): {e}")
+
+    transformer = CoordinateTransformer(ToleranceConfig(tolerance), debug=False)
+    pairs = [(i, i + 1, output_files[i] if output_files and i < len(output_files) else None)
+             for i in range(len(files) - 1)]
+    if include_first_to_last and len(files) > 2:
+        pairs.append((0, len(files) - 1, first_to_last_output))
+
+    results = []
+    for index_a, index_b, output_file in pairs:
+        table_a, table_b = tables[index_a], tables[index_b]
+        if table_a is None or table_b is None:
+            results.append((files[index_a], files[index_b], False, None))
+            continue
+        try:
+            success, entity_counts = diff_signature_tables(
+                table_a[0], table_b[0], output_file, transformer=transformer, **output_options)
+            if entity_counts is not None:
+                entity_counts['short_circuit'] = 'identical_file' if table_a[1] == table_b[1] else None
+        except Exception as e:
+            logger.error(f"DXF comparison error ({files[index_a]} -> {files[index_b]}): {e}")
+            success, entity_counts = False, None
+        results.append((files[index_a], files[index_b], success, entity_counts))
+
+    del tables
+    gc.collect()
+    return results
+
+
+def _matched_layout_names(names_a: List[str], names_b: List[str], include_model: bool) -> List[str]:
+    """A・B のレイアウト名を名前で対応付けた一覧（A のタブ順、続いて B にのみあるものを B のタブ順）"""
+    names = [name for name in names_a if name != MODEL_LAYOUT_NAME]
+    known = set(names)
+    names += [name for name in names_b if name != MODEL_LAYOUT_NAME and name not in known]
+    return ([MODEL_LAYOUT_NAME] if include_model else []) + names
+
+
+def _extract_layout_side(args):
+    """compare_dxf_layouts のワーカー: 1ファイルを1回だけ読み込み、全レイアウトを抽出
+
+    戻り値は (タブ順のレイアウト名一覧, {レイアウト名: entities})。
+    include_model が False の場合はモデル空間を抽出しない。
+    """
+    file_path, doc_label, offset, include_model, tolerance, diff_engine, filter_config = args
+    transformer = CoordinateTransformer(ToleranceConfig(tolerance), debug=False)
+    diff_analyzer = create_diff_analyzer(transformer, diff_engine)
+    expander = EntityExpander(transformer, debug=False, global_offset=None, filter_config=filter_config)
+    # オフセットはモデル空間にのみ適用する（ペーパー空間は用紙座標のため）
+    expander_model = EntityExpander(transformer, debug=False, global_offset=offset, filter_config=filter_config)
+
+    doc = ezdxf.readfile(file_path)
+    names = doc.layouts.names_in_taborder()
+    tables = {}
+    for name in names:
+        if name == MODEL_LAYOUT_NAME and not include_model:
+            continue
+        layout_expander = expander_model if name == MODEL_LAYOUT_NAME else expander
+        tables[name] = diff_analyzer.extract_entities_from_doc(doc, doc_label, layout_expander, doc.layouts.get(name))
+
+    del doc
+    return names, tables
+
+
+def compare_dxf_layouts(file_a: str, file_b: str, output_file: Optional[str] = None,
+                        tolerance: float = 0.01,
+                        offset_b: Optional[Tuple[float, float]] = None,
+                        include_model: bool = True,
+                        max_workers: Optional[int] = None,
+                        diff_engine: str = DIFF_ENGINE_SIGNATURE,
+                        filter_config: Optional[FilterConfig] = None,
+                        **output_options) -> Tuple[bool, Optional[Dict[str, Any]]]:
+    """
+    モデル空間とペーパー空間レイアウトをレイアウト単位で比較
+
+    A・B のレイアウトを名前で対応付け、レイアウトごとに独立して差分を求める。
+    各ファイルは1回だけ読み込み、そのファイルの全レイアウトをまとめて抽出する。
+    max_workers が2以上の場合は A と B の読み込み・抽出を別プロセスで並列に行う
+    （ワーカー数はファイル数の 2 が上限）。出力DXFでは、モデル空間の差分はモデル空間に、
+    各レイアウトの差分は同名のペーパー空間レイアウトに書き出す。
+
+    Args:
+        file_a: 基準DXFファイルパス
+        file_b: 比較対象DXFファイルパス
+        output_file: 出力DXFパス（None の場合はサマリーのみ）
+        tolerance: 座標許容誤差
+        offset_b: ファイルBのモデル空間に適用するオフセット (dx, dy)（ペーパー空間には適用しない）
+        include_model: モデル空間も比較する
+        max_workers: 2以上で A・B の抽出をプロセス並列実行（上限 2）
+        diff_engine: 'signature' または 'columnar'
+        filter_config: レイヤー・ブロック名・エンティティタイプのフィルタ（オプション）
+        **output_options: 出力設定（deleted_color, added_color, unchanged_color,
+            output_mode, context_min_length）
+
+    Returns:
+        Tuple[bool, Optional[Dict[str, Any]]]: (成功フラグ, エンティティ数情報)
+            全レイアウト合計のエンティティ数キーに加え、以下のキーを含む:
+                - layouts: レイアウト名 → {deleted_entities, added_entities,
+                  unchanged_entities, diff_entities, total_entities, status}
+                  （status は 'both' / 'only_a' / 'only_b'、出力時は written_* も含む）
+    """
+    try:
+        tasks = [(file_a, "A", None, include_model, tolerance, diff_engine, filter_config),
+                 (file_b, "B", offset_b, include_model, tolerance, diff_engine, filter_config)]
+        worker_count = min(max(1, max_workers or 1), len(tasks))
+        if worker_count == 1:
+            results = [_extract_layout_side(task) for task in tasks]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=worker_count) as executor:
+                results = list(executor.map(_extract_layout_side, tasks))
+
+        (names_a, tables_a), (names_b, tables_b) = results
+        names = _matched_layout_names(names_a, names_b, include_model)
+        tables = {}
+        for name in names:
+            in_a, in_b = name in tables_a, name in tables_b
+            status = 'both' if in_a and in_b else ('only_a' if in_a else 'only_b')
+            tables[name] = (tables_a.get(name, {}), tables_b.get(name, {}), status)
+        del tables_a, tables_b
+
+        layout_counts = {}
+        layout_diffs = []
+        totals = {'deleted': set(), 'added': set(), 'common': set()}
+        for name in names:
+            entities_a, entities_b, status = tables[name]
+            hashes_a, hashes_b = entities_a.keys(), entities_b.keys()
+            deleted_hashes = set(hashes_a - hashes_b)
+            added_hashes = set(hashes_b - hashes_a)
+            common_hashes = set(hashes_a & hashes_b)
+
+            counts = build_entity_counts(deleted_hashes, added_hashes, common_hashes)
+            counts['status'] = status
+            layout_counts[name] = counts
+
+            # 合計はレイアウトをまたいで同じハッシュがあっても別エンティティとして数える
+            totals['deleted'].update((name, h) for h in deleted_hashes)
+            totals['added'].update((name, h) for h in added_hashes)
+            totals['common'].update((name, h) for h in common_hashes)
+            layout_diffs.append((name, entities_a, entities_b, deleted_hashes, added_hashes, common_hashes))
+
+        entity_counts = build_entity_counts(totals['deleted'], totals['added'], totals['common'])
+        entity_counts['layouts'] = layout_counts
+        if output_file is None:
+            return True, entity_counts
+
+        output_keys = ('deleted_color', 'added_color', 'unchanged_color')
+        layer_config = LayerConfig(*(output_options.get(key, default)
+                                     for key, default in zip(output_keys, (6, 4, 7))))
+        transformer = CoordinateTransformer(ToleranceConfig(tolerance), debug=False)
+        output_generator = OutputGenerator(transformer, layer_config, debug=False)
+
+        model_diff = (MODEL_LAYOUT_NAME, {}, {}, set(), set(), set())
+        if include_model:
+            model_diff = layout_diffs.pop(0)
+        success = output_generator.create_diff_dxf(
+            *model_diff[1:], output_file,
+            output_mode=output_options.get('output_mode', OUTPUT_MODE_FULL),
+            context_min_length=output_options.get('context_min_length', 50.0),
+            layout_diffs=layout_diffs or None)
+        if success and output_generator.last_output_counts:
+            written_by_layout = output_generator.last_output_counts.pop(
+                'layouts', {MODEL_LAYOUT_NAME: {key: value for key, value in output_generator.last_output_counts.items()
+                                                if key.startswith('written_')}})
+            entity_counts.update(output_generator.last_output_counts)
+            for layout_name, written in written_by_layout.items():
+                if layout_name in layout_counts:
+                    layout_counts[layout_name].update(written)
+
+        del tables, layout_diffs
+        gc.collect()
+        return success, entity_counts if success else None
+
+    except Exception as e:
+        logger.error(f"DXF layout comparison error: {e}")
+        gc.collect()
+        return False, None
+
+
+def profile_dxf_extraction(file_path: str, tolerance: float = 0.01,
+                           diff_engine: str = DIFF_ENGINE_SIGNATURE,
+                           filter_config: Optional[FilterConfig] = None) -> Dict[str, Any]:
+    """
+    1ファイルの読み込み・展開・ハッシュ化のメモリ使用量と時間を計測
+
+    tracemalloc で計測するため通常の比較より遅くなる。サーバーで比較できる図面サイズの
+    見積もりや、エンティティ表現の変更によるメモリ削減の確認に使う。
+
+    Returns:
+        - expanded_entities: 展開後のエンティティ総数（重複を含む）
+        - unique_hashes: 署名ハッシュの種類数
+        - read_peak_bytes: DXF読み込み時のピークメモリ
+        - extract_peak_bytes: 展開・ハッシュ化時のピークメモリ（読み込み済みドキュメントを除く）
+        - retained_bytes: 抽出結果（ハッシュテーブル）が保持するメモリ
+        - read_seconds / extract_seconds: 各段階の処理時間
+    """
+    import tracemalloc
+
+    transformer = CoordinateTransformer(ToleranceConfig(tolerance), debug=False)
+    diff_analyzer = create_diff_analyzer(transformer, diff_engine)
+    expander = EntityExpander(transformer, debug=False, global_offset=None, filter_config=filter_config)
+
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        doc = ezdxf.readfile(file_path)
+        read_seconds = time.perf_counter() - start
+        _, read_peak = tracemalloc.get_traced_memory()
+
+        base_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        entities = diff_analyzer.extract_entities_from_doc(doc, file_path, expander)
+        extract_seconds = time.perf_counter() - start
+        current_bytes, extract_peak = tracemalloc.get_traced_memory()
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+
+    return {
+        'expanded_entities': sum(e.instance_count for e in entities.values()),
+        'unique_hashes': len(entities),
+        'read_peak_bytes': read_peak,
+        'extract_peak_bytes': max(0, extract_peak - base_bytes),
+        'retained_bytes': max(0, current_bytes - base_bytes),
+        'read_seconds': read_seconds,
+        'extract_seconds': extract_seconds,
+    }
+
+
+def main():
+    """コマンドラインから2つのDXFファイルを比較する"""
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(
+        description='2つのDXFファイルを比較し、差分DXFを出力します',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='''
+使用例:
+  python -m utils.compare_dxf drawing_A.dxf drawing_B.dxf diff.dxf
+  python -m utils.compare_dxf drawing_A.dxf drawing_B.dxf diff.dxf --include-layers WIRE,DEVICE
+  python -m utils.compare_dxf drawing_A.dxf drawing_B.dxf --exclude-types HATCH,DIMENSION
+        '''
+    )
+
+    parser.add_argument('file_a', help='基準DXFファイル (File A)')
+    parser.add_argument('file_b', help='比較対象DXFファイル (File B)')
+    parser.add_argument('output_file', nargs='?', default=None,
+                        help='出力DXFファイル（省略時はサマリーのみ表示）')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.01,
+                        help='座標許容誤差 (デフォルト: 0.01)')
+    parser.add_argument('--offset', type=float, nargs=2, metavar=('DX', 'DY'), default=None,
+                        help='ファイルBに適用するオフセット')
+    parser.add_argument('--output-mode', choices=OUTPUT_MODES, default=OUTPUT_MODE_FULL,
+                        help='出力モード (デフォルト: full)')
+    parser.add_argument('--context-min-length', type=float, default=50.0,
+                        help='changes_with_context で CONTEXT に残す線分の最小長 (デフォルト: 50.0)')
+    parser.add_argument('--engine', choices=tuple(DIFF_ENGINES), default=DIFF_ENGINE_SIGNATURE,
+                        help='差分エンジン (デフォルト: signature)')
+    parser.add_argument('--include-layers', help='対象にするレイヤー（カンマ区切り）')
+    parser.add_argument('--exclude-layers', help='除外するレイヤー（カンマ区切り）')
+    parser.add_argument('--include-blocks', help='展開するブロック名（カンマ区切り）')
+    parser.add_argument('--exclude-blocks', help='展開しないブロック名（カンマ区切り）')
+    parser.add_argument('--include-types', help='対象にするエンティティタイプ（カンマ区切り）')
+    parser.add_argument('--exclude-types', help='除外するエンティティタイプ（カンマ区切り）')
+
+    args = parser.parse_args()
+
+    filter_config = FilterConfig(
+        include_layers=args.include_layers, exclude_layers=args.exclude_layers,
+        include_blocks=args.include_blocks, exclude_blocks=args.exclude_blocks,
+        include_types=args.include_types, exclude_types=args.exclude_types)
+    offset_b = tuple(args.offset) if args.offset else None
+
+    if args.output_file:
+        success, entity_counts = compare_dxf_files_and_generate_dxf(
+            args.file_a, args.file_b, args.output_file,
+            tolerance=args.tolerance, offset_b=offset_b,
+            output_mode=args.output_mode, context_min_length=args.context_min_length,
+            diff_engine=args.engine, filter_config=filter_config)
+    else:
+        success, entity_counts = summarize_dxf_differences(
+            args.file_a, args.file_b, tolerance=args.tolerance, offset_b=offset_b,
+            diff_engine=args.engine, filter_config=filter_config)
+
+    if not success or entity_counts is None:
+        print("エラー: DXFファイルの比較に失敗しました")
+        sys.exit(1)
+
+    print(f"削除: {entity_counts['deleted_entities']}")
+    print(f"追加: {entity_counts['added_entities']}")
+    print(f"変更なし: {entity_counts['unchanged_entities']}")
+    if args.output_file:
+        print(f"出力: {args.output_file} ({entity_counts.get('written_total', 0)} エンティティ)")
+
+
+if __name__ == "__main__":
+    main()
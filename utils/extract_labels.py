@@ -1,10 +1,23 @@
 import ezdxf
+import numpy as np
 import re
 import os
 import sys
 import gc
+import math
+import signal
+import threading
+import time
+import warnings
+import weakref
+from collections import OrderedDict
+from functools import lru_cache
 from typing import List, Tuple, Dict, Optional
 
+from ezdxf.filemanagement import dxf_file_info
+from ezdxf.lldxf.tagger import ascii_tags_loader, binary_tags_loader
+from ezdxf.lldxf.validator import is_binary_dxf_file
+from ezdxf.math import Vec3, Z_AXIS
 from ezdxf.tools.text import plain_mtext
 
 # 抽出設定の読み込み（環境適応型）
@@ -30,17 +43,125 @@ except ImportError:
 from .common_utils import process_circuit_symbol_labels
 
 
-def get_layers_from_dxf(dxf_file):
-    """DXFファイルからレイヤー一覧を取得する"""
+def scan_layer_table(dxf_file) -> List[Dict]:
+    """DXFファイルのタグを TABLES セクションの LAYER テーブルまで読み、レイヤー一覧を返す。
+
+    ezdxf.readfile() のようにエンティティを含む文書全体を構築せず、LAYER
+    テーブルを読み終えた時点で打ち切る。ASCII（HEADER の $DWGCODEPAGE /
+    $ACADVER からエンコーディングを判定）とバイナリの両形式に対応する。
+
+    Returns:
+        テーブル順の [{'name': str, 'color': int, 'frozen': bool, 'off': bool}, ...]。
+        color は ACI の絶対値（負の値はレイヤー非表示を表すため off に分離する）。
+        LAYER テーブルが見つからない場合は空リスト。
+    """
+    if is_binary_dxf_file(str(dxf_file)):
+        with open(dxf_file, 'rb') as fp:
+            tags = binary_tags_loader(fp.read())
+            return _layers_from_tags(tags)
+
+    encoding = dxf_file_info(str(dxf_file)).encoding
+    with open(dxf_file, 'rt', encoding=encoding, errors='ignore') as fp:
+        return _layers_from_tags(ascii_tags_loader(fp))
+
+
+def _layers_from_tags(tags) -> List[Dict]:
+    """DXF タグ列から LAYER テーブルのエントリーを取り出す（テーブル終端で打ち切る）。"""
+    layers = []
+    section = None
+    expect_section_name = False
+    in_layer_table = False
+    current = None
+
+    for code, value in tags:
+        if code == 0:
+            if current is not None:
+                layers.append(current)
+                current = None
+            if value == 'SECTION':
+                expect_section_name = True
+                continue
+            if value == 'ENDSEC':
+                if section == 'TABLES':
+                    break
+                section = None
+            elif section == 'TABLES':
+                if value == 'ENDTAB' and in_layer_table:
+                    break
+                if in_layer_table and value == 'LAYER':
+                    current = {'name': '', 'color': 7, 'frozen': False, 'off': False}
+            expect_section_name = False
+            continue
+
+        if expect_section_name and code == 2:
+            section = value
+            expect_section_name = False
+            if section in ('BLOCKS', 'ENTITIES', 'OBJECTS'):
+                # TABLES セクションは BLOCKS より前にあるため、ここまで来たら無い
+                break
+            continue
+
+        if section != 'TABLES':
+            continue
+        if current is None:
+            if code == 2 and value == 'LAYER':
+                in_layer_table = True
+            continue
+        if code == 2:
+            current['name'] = value
+        elif code == 62:
+            color = int(value)
+            current['color'] = abs(color)
+            current['off'] = color < 0
+        elif code == 70:
+            current['frozen'] = bool(int(value) & 1)
+
+    if current is not None:
+        layers.append(current)
+    return layers
+
+
+def get_layers_from_dxf(dxf_file, with_properties=False):
+    """DXFファイルからレイヤー一覧を取得する
+
+    レイヤーテーブルだけを読む scan_layer_table() を使い、文書全体は構築しない。
+    テーブルを読み取れない場合は ezdxf.readfile() による従来の方法で取得する。
+    with_properties=True では名前順の
+    [{'name', 'color', 'frozen', 'off'}, ...] を返す（既定は名前のリスト）。
+    """
     try:
-        doc = ezdxf.readfile(dxf_file)
-        layer_names = [layer.dxf.name for layer in doc.layers]
-        return sorted(layer_names)
+        layers = scan_layer_table(dxf_file)
+    except Exception:
+        layers = []
+
+    try:
+        if not layers:
+            doc = ezdxf.readfile(dxf_file)
+            layers = [
+                {
+                    'name': layer.dxf.name,
+                    'color': abs(layer.dxf.color),
+                    'frozen': layer.is_frozen(),
+                    'off': layer.dxf.color < 0,
+                }
+                for layer in doc.layers
+            ]
+        layers = sorted(layers, key=lambda layer: layer['name'])
+        if with_properties:
+            return layers
+        return [layer['name'] for layer in layers]
     except Exception as e:
         print(f"レイヤー一覧の取得中にエラーが発生しました: {str(e)}")
         return []
 
 
+# clean_mtext_format_codes のメモ化件数上限
+# 端子ラベル・注記・線番など同一の MTEXT 文字列が図面内・ブロック間で大量に
+# 繰り返されるため、plain_mtext の解析結果を LRU で再利用する。
+_MTEXT_CLEAN_CACHE_SIZE = 8192
+
+
+@lru_cache(maxsize=_MTEXT_CLEAN_CACHE_SIZE)
 def clean_mtext_format_codes(text: str) -> str:
     r"""MTEXTのフォーマットコードを除去してテキスト内容を返す。
 
@@ -52,6 +173,10 @@ def clean_mtext_format_codes(text: str) -> str:
       - ``^I`` / ``^J`` / ``^M`` キャレットシーケンス → 空白
     日本語環境の円マーク（¥）→ バックスラッシュ正規化は plain_mtext の
     前処理として、``\P`` 等で生じる改行 → スペース化は後処理として残す。
+
+    結果は LRU でメモ化する（``clean_mtext_format_codes.cache_info()`` で
+    ヒット数・ミス数を確認できる。extract_labels は info['mtext_cache'] に
+    1ファイル分の差分を記録する）。
     """
     if not text:
         return ""
@@ -104,6 +229,85 @@ def _block_has_text_content(doc, block_name, cache, _visiting=None):
     return has
 
 
+def _block_text_template(doc, block_name, cache):
+    """ブロック定義直下の TEXT/MTEXT をブロック座標のままテンプレート化する。
+
+    戻り値は {'entries': [(dxftype, layer, clean_text), ...], 'points': (m, 3) 配列}。
+    clean_text は extract_text_from_entity() で整形済み（MTEXT は
+    clean_mtext_format_codes() 適用済み）。INSERT ごとに virtual_entities() で
+    ジオメトリまで複製・変換する代わりに、このテンプレートの挿入点だけを変換して
+    ラベルを生成する。virtual_entities() はネストINSERTを展開しないため、
+    テンプレートも直下のテキストのみを対象とする（出力結果は変えない）。
+
+    押し出し方向が Z 軸以外のテキストを含む等、挿入点の単純な行列変換で
+    virtual_entities() と同じ結果にならないブロックは None を返し、呼び出し元は
+    従来の virtual_entities() 展開にフォールバックする。
+    block_name 単位でメモ化する（cache は呼び出し元が1ファイル処理につき1つ用意する）。
+    """
+    if block_name in cache:
+        return cache[block_name]
+
+    template = None
+    try:
+        blk = doc.blocks.get(block_name)
+        if blk is not None:
+            entries = []
+            points = []
+            for x in blk:
+                xt = x.dxftype()
+                if xt not in ('TEXT', 'MTEXT'):
+                    continue
+                if not Z_AXIS.isclose(x.dxf.extrusion):
+                    raise ValueError("non-default extrusion")
+                _raw, clean_text, _coords = extract_text_from_entity(x)
+                entries.append((xt, x.dxf.layer, clean_text))
+                points.append(Vec3(x.dxf.insert).xyz)
+            template = {
+                'entries': entries,
+                'points': np.array(points, dtype=float).reshape(-1, 3),
+            }
+    except Exception:
+        template = None
+
+    cache[block_name] = template
+    return template
+
+
+def _insert_allows_template(insert) -> bool:
+    """INSERT の変換がテンプレートの挿入点変換だけで再現できるかを判定する。
+
+    押し出し方向が Z 軸以外、鏡像（X/Y 尺度の符号が異なる、Z 尺度が負）、
+    尺度0（特異行列）の INSERT は virtual_entities() に任せる。鏡像 INSERT では
+    TEXT の押し出し方向が反転し、挿入点が OCS 座標で返るため。
+    """
+    dxf = insert.dxf
+    if not Z_AXIS.isclose(dxf.extrusion):
+        return False
+    if dxf.zscale <= 0 or dxf.xscale * dxf.yscale <= 0:
+        return False
+    return True
+
+
+def _transform_template_points(points, matrices):
+    """テンプレートの挿入点 (m, 3) を複数 INSERT の変換行列でまとめて変換し、
+    (k, m, 3) 配列を返す。
+
+    ezdxf の Matrix44.transform() と同じ演算順序（x*m0 + y*m4 + z*m8 + m12）で
+    計算するため、virtual_entities() 経由の座標とビット単位で一致する。
+    """
+    m = np.array([list(matrix) for matrix in matrices], dtype=float)
+    px, py, pz = points[:, 0], points[:, 1], points[:, 2]
+    out = np.empty((len(m), len(points), 3), dtype=float)
+    for axis in range(3):
+        out[:, :, axis] = (
+            px * m[:, axis, None]
+            + py * m[:, 4 + axis, None]
+            + pz * m[:, 8 + axis, None]
+            + m[:, 12 + axis, None]
+        )
+    return out
+
+
 def extract_text_from_entity(entity) -> Tuple[str, str, Tuple[float, float]]:
     """TEXT / MTEXT エンティティからテキストと座標を抽出する"""
     try:
@@ -156,12 +360,21 @@ def extract_text_from_entity(entity) -> Tuple[str, str, Tuple[float, float]]:
         return "", "", (0.0, 0.0)
 
 
+@lru_cache(maxsize=8)
+def _drawing_number_regex(pattern: str):
+    """図面番号パターンのコンパイル結果（config で差し替えられるためパターン文字列で引く）"""
+    return re.compile(pattern, re.IGNORECASE)
+
+
 def extract_drawing_numbers(text: str) -> List[str]:
     """テキストから図面番号フォーマットに一致する文字列を抽出する"""
     drawing_numbers = []
-    for match in re.findall(extraction_config.DRAWING_NUMBER_PATTERN, text, re.IGNORECASE):
-        if match.upper() not in [dn.upper() for dn in drawing_numbers]:
-            drawing_numbers.append(match.upper())
+    seen = set()
+    for match in _drawing_number_regex(extraction_config.DRAWING_NUMBER_PATTERN).findall(text):
+        number = match.upper()
+        if number not in seen:
+            seen.add(number)
+            drawing_numbers.append(number)
     return drawing_numbers
 
 
@@ -184,38 +397,161 @@ def is_single_uppercase_letter(text: str) -> bool:
     return False
 
 
+# ラベル空間索引のセルサイズ（図面座標単位）
+_LABEL_INDEX_CELL_SIZE = 50.0
+
+
+class _LabelSpatialIndex:
+    """ラベル座標の一様グリッド索引（1ファイルにつき1回構築する）。
+
+    タイトル・サブタイトル・図番判別のヒューリスティクスが近傍ラベルを探すたびに
+    全ラベルを線形走査していたのを、矩形・半径の範囲問い合わせに置き換える。
+    問い合わせは境界を1セル広げた候補（ラベルの index 昇順）を返すだけで、
+    厳密な条件判定は呼び出し側が従来と同じ式で行う。index 昇順は元のラベル順と
+    同じなので、先勝ち・同値時の選択も従来と一致する（出力結果は変えない）。
+    """
+
+    def __init__(self, labels, cell_size=_LABEL_INDEX_CELL_SIZE):
+        # (テキスト, 座標, グループ) に正規化（グループ未指定は None）
+        self.labels = [(item[0], item[1], item[2] if len(item) >= 3 else None) for item in labels]
+        self.cell_size = float(cell_size)
+        self._columns = {}    # セルX -> {セルY: [index, ...]}
+        self._unplaced = []   # 座標が有限でないラベル（常に候補に含める）
+        self._by_text = {}    # label.upper().strip() -> [index, ...]
+        for index, (label, coords, _group) in enumerate(self.labels):
+            self._by_text.setdefault(label.upper().strip(), []).append(index)
+            x, y = coords[0], coords[1]
+            if not (math.isfinite(x) and math.isfinite(y)):
+                self._unplaced.append(index)
+                continue
+            column = self._columns.setdefault(self._cell(x), {})
+            column.setdefault(self._cell(y), []).append(index)
+
+    def _cell(self, value: float) -> int:
+        return math.floor(value / self.cell_size)
+
+    def _cells_in_range(self, mapping, low, high):
+        low_cell = self._cell(low) - 1 if math.isfinite(low) else None
+        high_cell = self._cell(high) + 1 if math.isfinite(high) else None
+        if low_cell is not None and high_cell is not None and high_cell - low_cell < len(mapping):
+            for cell in range(low_cell, high_cell + 1):
+                if cell in mapping:
+                    yield mapping[cell]
+            return
+        for cell, value in mapping.items():
+            if (low_cell is None or cell >= low_cell) and (high_cell is None or cell <= high_cell):
+                yield value
+
+    def indices_with_text(self, text_upper: str) -> List[int]:
+        """label.upper().strip() が一致するラベルの index（昇順）。"""
+        return self._by_text.get(text_upper, [])
+
+    def query_rect(self, x_min=-math.inf, x_max=math.inf, y_min=-math.inf, y_max=math.inf) -> List[int]:
+        """矩形 [x_min, x_max] x [y_min, y_max] に入り得るラベルの index（昇順）。"""
+        result = list(self._unplaced)
+        for column in self._cells_in_range(self._columns, x_min, x_max):
+            for indices in self._cells_in_range(column, y_min, y_max):
+                result.extend(indices)
+        result.sort()
+        return result
+
+    def query_radius(self, center: Tuple[float, float], radius: float) -> List[int]:
+        """center から radius 以内に入り得るラベルの index（昇順）。"""
+        return self.query_rect(center[0] - radius, center[0] + radius,
+                               center[1] - radius, center[1] + radius)
+
+
+def _dedupe_nearby_labels(candidates, coord_tolerance):
+    """同じテキストで座標差が coord_tolerance 以内の候補を先勝ちで除去する。
+
+    テキストごとに採用済み座標をグリッド（セル幅 2×許容値）へ登録し、隣接セル
+    だけと比較する。全採用済み候補との総当たりと同じ結果になる。
+    """
+    cell_size = 2.0 * coord_tolerance if coord_tolerance > 0 else 1.0
+    kept_by_label = {}
+    deduplicated = []
+    for label, coords in candidates:
+        try:
+            cx = math.floor(coords[0] / cell_size)
+            cy = math.floor(coords[1] / cell_size)
+        except (OverflowError, ValueError):
+            # 有限でない座標は差分比較が常に偽になるため、重複扱いにならない
+            deduplicated.append((label, coords))
+            continue
+        cells = kept_by_label.setdefault(label, {})
+        is_dup = any(
+            abs(coords[0] - ex_coords[0]) <= coord_tolerance
+            and abs(coords[1] - ex_coords[1]) <= coord_tolerance
+            for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+            for ex_coords in cells.get((cx + dx, cy + dy), ())
+        )
+        if not is_dup:
+            deduplicated.append((label, coords))
+            cells.setdefault((cx, cy), []).append(coords)
+    return deduplicated
+
+
+# 図面枠バウンディングボックスのキャッシュ（ドキュメントごと）
+# 同じドキュメントで同じタイトルブロックを何度も判定する場合（タイトル・サブタイトル
+# 候補ごとの呼び出し）に枠の再計算を省く。ブロック名が同じでも枠の内容は図面ごとに
+# 異なり得るため、ドキュメントをまたいでは共有しない（ドキュメントの破棄とともに消える）。
+# Streamlit のセッションはスレッドで動くため、ロックで保護する。
+_FRAME_BBOX_CACHE_SIZE = 64
+_frame_bbox_cache: 'weakref.WeakKeyDictionary' = weakref.WeakKeyDictionary()
+_frame_bbox_cache_lock = threading.Lock()
+
+
 def _titleblock_frame_bbox(doc, group_handle, frame_lineweight=100, frame_color=7, margin=1.0):
     """タイトルブロック（INSERT）が持つ図面枠のバウンディングボックスを返す。
 
     機器符号抽出（ref_designator.py）と同じ識別キー（lineweight=100 かつ color=7 の
-    LINE）で図面枠を検出する。group_handle で指定した INSERT の内部（virtual_entities()
-    で展開・ワールド座標変換済み）のみを見るため、同一座標に重なった旧・現行の
-    タイトルブロックがあっても自身の枠だけを対象にできる。検出できない場合は None
-    （呼び出し側は枠外判定をスキップし、従来どおり内容ベースの判定にフォールバックする）。
+    LINE）で図面枠を検出する。group_handle で指定した INSERT のブロック直下の LINE
+    （INSERT の変換行列でワールド座標へ変換）のみを見るため、同一座標に重なった
+    旧・現行のタイトルブロックがあっても自身の枠だけを対象にできる。検出できない
+    場合は None（呼び出し側は枠外判定をスキップし、従来どおり内容ベースの判定に
+    フォールバックする）。
+
+    INSERT は doc.entitydb から handle で直接引く（全レイアウトの走査はしない）。
+    結果はドキュメントごとに、ブロック名・ブロックの要素数・INSERT の変換行列・
+    判定パラメータをキーにキャッシュする。枠の LINE は virtual_entities() と同じく
+    Matrix44.transform() で変換するため、展開して求めた場合と同じ値になる。
     """
     if doc is None or not group_handle:
         return None
     try:
-        insert_entity = None
-        for layout in doc.layouts:
-            for e in layout:
-                if e.dxftype() == 'INSERT' and getattr(e.dxf, 'handle', None) == group_handle:
-                    insert_entity = e
-                    break
-            if insert_entity is not None:
-                break
-        if insert_entity is None:
+        insert_entity = doc.entitydb.get(group_handle)
+        if insert_entity is None or insert_entity.dxftype() != 'INSERT' or not insert_entity.is_alive:
             return None
 
-        xs, ys = [], []
-        for v in insert_entity.virtual_entities():
-            if v.dxftype() == 'LINE':
-                if getattr(v.dxf, 'lineweight', None) == frame_lineweight and getattr(v.dxf, 'color', None) == frame_color:
-                    xs.extend([v.dxf.start[0], v.dxf.end[0]])
-                    ys.extend([v.dxf.start[1], v.dxf.end[1]])
-        if not xs:
+        block_name = insert_entity.dxf.name
+        block = doc.blocks.get(block_name)
+        if block is None:
             return None
-        return (min(xs) - margin, max(xs) + margin, min(ys) - margin, max(ys) + margin)
+        m = insert_entity.matrix44()
+        cache_key = (block_name, len(block), tuple(m), frame_lineweight, frame_color, margin)
+        with _frame_bbox_cache_lock:
+            doc_cache = _frame_bbox_cache.setdefault(doc, OrderedDict())
+            if cache_key in doc_cache:
+                doc_cache.move_to_end(cache_key)
+                return doc_cache[cache_key]
+
+        xs, ys = [], []
+        for e in block:
+            if e.dxftype() == 'LINE':
+                if getattr(e.dxf, 'lineweight', None) == frame_lineweight and getattr(e.dxf, 'color', None) == frame_color:
+                    start = m.transform(e.dxf.start)
+                    end = m.transform(e.dxf.end)
+                    xs.extend([start[0], end[0]])
+                    ys.extend([start[1], end[1]])
+        bbox = None
+        if xs:
+            bbox = (min(xs) - margin, max(xs) + margin, min(ys) - margin, max(ys) + margin)
+
+        with _frame_bbox_cache_lock:
+            doc_cache[cache_key] = bbox
+            while len(doc_cache) > _FRAME_BBOX_CACHE_SIZE:
+                doc_cache.popitem(last=False)
+        return bbox
     except Exception:
         return None
 
@@ -245,6 +581,7 @@ def extract_title_and_subtitle(
     drawing_numbers: Optional[List[Tuple]],
     main_drawing_group=None,
     doc=None,
+    label_index=None,
 ) -> Dict[str, Optional[str]]:
     """テキストラベルの位置関係からタイトルとサブタイトルを抽出する。
 
@@ -262,31 +599,35 @@ def extract_title_and_subtitle(
     除外する（`_is_titleblock_noise_label`）。doc 省略時・枠検出不能時は枠外
     判定を行わず、数字のみラベルの除外のみ行う（内容ベースの判定に安全側で
     フォールバック）。
+
+    label_index は all_labels から構築した `_LabelSpatialIndex`（省略時はここで
+    構築する）。図番判別と共有するため、extract_labels() では1ファイルにつき
+    1回だけ構築して渡す。
     """
     if not all_labels:
         return {'title': None, 'subtitle': None}
 
-    # ラベルを (テキスト, 座標, グループ) に正規化（グループ未指定は None）
-    norm = [(item[0], item[1], item[2] if len(item) >= 3 else None) for item in all_labels]
+    if label_index is None:
+        label_index = _LabelSpatialIndex(all_labels)
+    norm = label_index.labels
+
+    # 同一グループ内に TITLE があれば、そのグループのラベルだけを対象にする
+    scope_group = None
     if main_drawing_group is not None:
-        same_group = [item for item in norm if item[2] == main_drawing_group]
-        if any(label.upper().strip() == 'TITLE' for label, _c, _g in same_group):
-            norm = same_group
-    all_labels = [(label, coords) for label, coords, _g in norm]
+        if any(norm[i][2] == main_drawing_group for i in label_index.indices_with_text('TITLE')):
+            scope_group = main_drawing_group
+
+    def _scoped(indices):
+        if scope_group is None:
+            return indices
+        return [i for i in indices if norm[i][2] == scope_group]
 
     title_text = None
     subtitle_text = None
 
     # TITLE と REVISION の位置を特定（複数ある場合は最も右側を採用）
-    title_label_positions = []
-    revision_label_positions = []
-
-    for label, coords in all_labels:
-        label_upper = label.upper().strip()
-        if label_upper == 'TITLE':
-            title_label_positions.append(coords)
-        elif label_upper == 'REVISION':
-            revision_label_positions.append(coords)
+    title_label_positions = [norm[i][1] for i in _scoped(label_index.indices_with_text('TITLE'))]
+    revision_label_positions = [norm[i][1] for i in _scoped(label_index.indices_with_text('REVISION'))]
 
     if not title_label_positions:
         return {'title': None, 'subtitle': None}
@@ -298,12 +639,19 @@ def extract_title_and_subtitle(
     title_proximity_x = extraction_config.TITLE_PROXIMITY_X
     title_candidates = []
     frame_bbox = _titleblock_frame_bbox(doc, main_drawing_group)
+    drawing_number_texts = {dn for dn, *_ in drawing_numbers} if drawing_numbers else set()
 
-    for label, coords in all_labels:
+    nearby = label_index.query_rect(
+        x_min=title_label_pos[0] + 10,
+        x_max=title_label_pos[0] + title_proximity_x,
+        y_max=revision_label_pos[1] if revision_label_pos else math.inf,
+    )
+    for index in _scoped(nearby):
+        label, coords, _group = norm[index]
         label_upper = label.upper().strip()
         if label_upper in ['TITLE', 'REVISION']:
             continue
-        if drawing_numbers and any(dn == label for dn, *_ in drawing_numbers):
+        if label in drawing_number_texts:
             continue
         if _is_titleblock_noise_label(label, coords, frame_bbox):
             continue
@@ -320,20 +668,7 @@ def extract_title_and_subtitle(
         return {'title': None, 'subtitle': None}
 
     # 座標が近く同じラベルの重複を除去
-    coord_tolerance = 1.0
-    deduplicated = []
-    for label, coords in title_candidates:
-        is_dup = False
-        for ex_label, ex_coords in deduplicated:
-            if (label == ex_label
-                    and abs(coords[0] - ex_coords[0]) <= coord_tolerance
-                    and abs(coords[1] - ex_coords[1]) <= coord_tolerance):
-                is_dup = True
-                break
-        if not is_dup:
-            deduplicated.append((label, coords))
-
-    title_candidates = deduplicated
+    title_candidates = _dedupe_nearby_labels(title_candidates, coord_tolerance=1.0)
     if not title_candidates:
         return {'title': None, 'subtitle': None}
 
@@ -416,6 +751,7 @@ def determine_drawing_number_types(
     drawing_numbers: List[Tuple],
     all_labels: Optional[List[Tuple[str, Tuple[float, float]]]] = None,
     filename: Optional[str] = None,
+    label_index=None,
 ) -> Dict[str, str]:
     """ラベルと座標に基づいて図番と流用元図番を判別する。
 
@@ -428,7 +764,8 @@ def determine_drawing_number_types(
     戻り値の 'main_group' は図番が属するグループキー（不明な場合は None）。
     タイトル抽出（extract_title_and_subtitle）で同一ブロック内に候補を絞る
     ために使う。all_labels の各要素は `(テキスト, 座標)` または
-    `(テキスト, 座標, グループキー)`。
+    `(テキスト, 座標, グループキー)`。label_index は all_labels から構築した
+    `_LabelSpatialIndex`（省略時は必要になった時点でここで構築する）。
     """
     if len(drawing_numbers) == 0:
         return {'main_drawing': None, 'source_drawing': None, 'main_group': None}
@@ -455,21 +792,34 @@ def determine_drawing_number_types(
 
     # 2. ラベルベースの判別
     if all_labels:
-        label_pairs = [(item[0], item[1]) for item in all_labels]
-        source_label_positions = [
-            coords for label, coords in label_pairs
+        if label_index is None:
+            label_index = _LabelSpatialIndex(all_labels)
+        label_pairs = [(item[0], item[1]) for item in label_index.labels]
+        source_label_indices = {
+            index for index, (label, coords) in enumerate(label_pairs)
             if '流用元図番' in label or '流用元' in label
-        ]
-        dwg_label_positions = [
-            coords for label, coords in label_pairs
+        }
+        dwg_label_indices = {
+            index for index, (label, coords) in enumerate(label_pairs)
             if ('DWG' in label.upper().replace('\n', '').replace('\r', '').replace(' ', '')
                 and 'NO' in label.upper().replace('\n', '').replace('\r', '').replace(' ', ''))
-        ]
+        }
+
+        def _nearest_label_distance(dn_coords, anchor_indices, radius):
+            # radius 未満にあるアンカーラベルまでの最短距離（無ければ inf）。
+            # radius 以上の候補は採用されないため、範囲問い合わせで絞ってよい。
+            nearest = float('inf')
+            for index in label_index.query_radius(dn_coords, radius):
+                if index in anchor_indices:
+                    distance = calculate_distance(dn_coords, label_pairs[index][1])
+                    if distance < nearest:
+                        nearest = distance
+            return nearest
 
         # 流用元図番を「流用元図番」ラベルに最も近い図面番号から判別する。
         # 図番のグループが分かっている場合は、同一グループ内の候補に限定して
         # 判定し、重なった別ブロック（旧版）の図番を拾わないようにする。
-        if source_label_positions:
+        if source_label_indices:
             source_pool = norm
             if main_group is not None:
                 same_group = [c for c in norm if c[2] == main_group and c[0] != main_drawing]
@@ -481,27 +831,27 @@ def determine_drawing_number_types(
             for dn, dn_coords, group in source_pool:
                 if main_drawing and dn == main_drawing:
                     continue
-                for label_coords in source_label_positions:
-                    distance = calculate_distance(dn_coords, label_coords)
-                    if distance < min_distance:
-                        min_distance = distance
-                        closest_dn = dn
+                distance = _nearest_label_distance(
+                    dn_coords, source_label_indices, extraction_config.SOURCE_LABEL_PROXIMITY)
+                if distance < min_distance:
+                    min_distance = distance
+                    closest_dn = dn
             if closest_dn and min_distance < extraction_config.SOURCE_LABEL_PROXIMITY:
                 if closest_dn != main_drawing:
                     source_drawing = closest_dn
 
         # 図番を「DWG No.」ラベルに最も近い図面番号から確認
-        if dwg_label_positions and not main_drawing:
+        if dwg_label_indices and not main_drawing:
             min_distance = float('inf')
             closest_dn = None
             closest_group = None
             for dn, dn_coords, group in norm:
-                for label_coords in dwg_label_positions:
-                    distance = calculate_distance(dn_coords, label_coords)
-                    if distance < min_distance:
-                        min_distance = distance
-                        closest_dn = dn
-                        closest_group = group
+                distance = _nearest_label_distance(
+                    dn_coords, dwg_label_indices, extraction_config.DWG_NO_LABEL_PROXIMITY)
+                if distance < min_distance:
+                    min_distance = distance
+                    closest_dn = dn
+                    closest_group = group
             if closest_dn and min_distance < extraction_config.DWG_NO_LABEL_PROXIMITY:
                 main_drawing = closest_dn
                 main_group = closest_group
@@ -538,11 +888,207 @@ def determine_drawing_number_types(
     return {'main_drawing': main_drawing, 'source_drawing': source_drawing, 'main_group': main_group}
 
 
+def _layouts_in_scan_order(doc) -> list:
+    """ラベル抽出の走査順（Model → ペーパー空間の各レイアウト）でレイアウトを返す。"""
+    layouts = [doc.modelspace()]
+    try:
+        layouts.extend(layout for layout in doc.layouts if layout.name != 'Model')
+    except Exception:
+        pass
+    return layouts
+
+
+def _entity_handle(entity):
+    return getattr(entity.dxf, 'handle', None)
+
+
+class _LabelCollector:
+    """レイアウトを1パスで走査し、分類・重複除去・テキスト抽出をその場で行う。
+
+    以前はレイアウトごとに TEXT/MTEXT 収集と INSERT 展開で2回ずつ走査し、
+    さらに全エンティティをリストに溜めてから重複除去・抽出の2パスを回していた。
+    group_key は所属タイトルブロック（INSERT）の識別子。INSERT 由来は親 INSERT の
+    handle、直接配置は自身の handle を使う。旧・現行のタイトルブロックが同一座標に
+    重なっているケースで、図番と流用元図番が同じブロックに属することを判定する
+    ために用いる。
+
+    重複除去は先勝ちのため、処理順は従来と同じ「全レイアウトの直接配置テキスト →
+    INSERT 由来テキスト」を保つ。INSERT は scan_layout() 中に参照だけを控えておき、
+    expand_pending_inserts() で展開する。
+
+    regions（(x_min, x_max, y_min, y_max) のリスト）を指定すると、いずれかの
+    矩形内にあるラベルだけを抽出する（get_title_and_subtitle の高速モード用）。
+    矩形外のテキストは整形処理も行わない。
+    """
+
+    def __init__(self, doc, selected_layers, collect_positions=False, regions=None):
+        self.doc = doc
+        self.selected_layers = selected_layers
+        self.collect_positions = collect_positions
+        self.regions = regions
+
+        self.labels = []
+        self.labels_with_coordinates = []
+        self.drawing_number_candidates = []
+        self.all_labels_with_coords = []
+        self.layout_timings = {}
+        self.template_inserts = 0
+
+        self.block_templates = {}
+        self._seen_entities = set()
+        self._pending_inserts = []
+        self._block_text_cache = {}
+
+    def in_regions(self, x, y) -> bool:
+        if self.regions is None:
+            return True
+        return any(x0 <= x <= x1 and y0 <= y <= y1 for x0, x1, y0, y1 in self.regions)
+
+    def _add_label(self, clean_text, coordinates, group_key):
+        if not clean_text:
+            return
+
+        if self.collect_positions:
+            self.all_labels_with_coords.append((clean_text, coordinates, group_key))
+
+            # タイトル抽出（extract_title_option）も、同一タイトルブロック
+            # グループ制限（main_drawing_group、extract_labels 参照）のために
+            # 図番候補を内部的に必要とするため、extract_drawing_numbers_option の
+            # 指定に関わらず収集する（2026-07-29、呼び出し側の渡し忘れに強くする
+            # ための内部結合解消）。
+            for dn in extract_drawing_numbers(clean_text):
+                self.drawing_number_candidates.append((dn, coordinates, group_key))
+
+        self.labels.append(clean_text)
+        self.labels_with_coordinates.append((clean_text, coordinates[0], coordinates[1]))
+
+    def accept_text(self, e, group_key):
+        """TEXT/MTEXT（実体または仮想エンティティ）を1件取り込む。"""
+        # 重複除去（同一種・同一レイヤー・同一座標）
+        try:
+            entity_key = (
+                e.dxftype(),
+                e.dxf.layer if hasattr(e.dxf, 'layer') else '',
+                getattr(e.dxf, 'insert', (0, 0)) if hasattr(e.dxf, 'insert') else (0, 0),
+            )
+            if entity_key in self._seen_entities:
+                return
+            self._seen_entities.add(entity_key)
+        except Exception:
+            pass
+
+        # テキスト抽出
+        if e.dxf.layer not in self.selected_layers:
+            return
+        if self.regions is not None:
+            try:
+                insert = e.dxf.insert
+                if not self.in_regions(insert[0], insert[1]):
+                    return
+            except Exception:
+                return
+        raw_text, clean_text, coordinates = extract_text_from_entity(e)
+        self._add_label(clean_text, coordinates, group_key)
+
+    def accept_template_label(self, dxftype, layer, point, clean_text, group_key):
+        """ブロックテキストテンプレートから変換済みのラベルを1件取り込む。"""
+        entity_key = (dxftype, layer, Vec3(point))
+        if entity_key in self._seen_entities:
+            return
+        self._seen_entities.add(entity_key)
+        if layer in self.selected_layers and self.in_regions(point[0], point[1]):
+            self._add_label(clean_text, (point[0], point[1]), group_key)
+
+    def scan_layout(self, layout, insert_filter=None):
+        """レイアウトを1回走査し、TEXT/MTEXT を取り込み、展開対象の INSERT を控える。
+
+        insert_filter を指定すると、それが True を返す INSERT だけを展開対象にする。
+        """
+        layout_start = time.perf_counter()
+        self.layout_timings.setdefault(layout.name, 0.0)
+        try:
+            for e in layout:
+                dxftype = e.dxftype()
+                if dxftype in ('TEXT', 'MTEXT'):
+                    self.accept_text(e, _entity_handle(e))
+                elif dxftype == 'INSERT' and e.dxf.layer in self.selected_layers:
+                    # テキストを含まないブロック（手描き回路図のコネクタ等の
+                    # 記号で多い）は展開対象に含めず、無駄な展開コストを避ける。
+                    if not _block_has_text_content(self.doc, e.dxf.name, self._block_text_cache):
+                        continue
+                    if insert_filter is not None and not insert_filter(e):
+                        continue
+                    self._pending_inserts.append((layout.name, e))
+        except Exception:
+            pass
+        self.layout_timings[layout.name] += time.perf_counter() - layout_start
+
+    def expand_pending_inserts(self):
+        """控えておいた INSERT のテキストを取り込む。
+
+        ブロックごとのテキストテンプレート（ブロック座標の挿入点と整形済み
+        テキスト）を、レイアウト内の同名ブロックの INSERT 全件分まとめて変換する。
+        テンプレートで再現できない INSERT のみ virtual_entities() で展開する。
+        いずれも親 INSERT の handle をグループキーとして付与する。
+        """
+        pending_inserts = self._pending_inserts
+        batches = {}
+        for index, (layout_name, e) in enumerate(pending_inserts):
+            block_name = e.dxf.name
+            template = _block_text_template(self.doc, block_name, self.block_templates)
+            if template is not None and _insert_allows_template(e):
+                batches.setdefault((layout_name, block_name), []).append(index)
+
+        insert_points = {}
+        for (layout_name, block_name), indices in batches.items():
+            batch_start = time.perf_counter()
+            template = self.block_templates[block_name]
+            if template['entries']:
+                try:
+                    points = _transform_template_points(
+                        template['points'],
+                        [pending_inserts[i][1].matrix44() for i in indices],
+                    )
+                    for row, index in enumerate(indices):
+                        insert_points[index] = points[row].tolist()
+                except Exception:
+                    pass
+            else:
+                # ネストINSERT内にのみテキストを持つブロック（直下には無い）
+                for index in indices:
+                    insert_points[index] = []
+            self.layout_timings[layout_name] += time.perf_counter() - batch_start
+
+        for index, (layout_name, e) in enumerate(pending_inserts):
+            insert_start = time.perf_counter()
+            insert_group = _entity_handle(e)
+            points = insert_points.get(index)
+            if points is not None:
+                template = self.block_templates[e.dxf.name]
+                for (dxftype, layer, clean_text), point in zip(template['entries'], points):
+                    self.accept_template_label(dxftype, layer, point, clean_text, insert_group)
+            else:
+                try:
+                    for virtual_entity in e.virtual_entities():
+                        if virtual_entity.dxftype() in ('TEXT', 'MTEXT'):
+                            self.accept_text(virtual_entity, insert_group)
+                except Exception:
+                    pass
+            self.layout_timings[layout_name] += time.perf_counter() - insert_start
+
+        self.template_inserts += len(insert_points)
+        self._pending_inserts = []
+
+
 def extract_labels(dxf_file, filter_non_parts=False, sort_order="asc", debug=False,
                    selected_layers=None, validate_ref_designators=False,
                    extract_drawing_numbers_option=False, extract_title_option=False,
-                   include_coordinates=False, original_filename=None):
-    """DXFファイルからテキストラベルを抽出する"""
+                   include_coordinates=False, original_filename=None, doc=None):
+    """DXFファイルからテキストラベルを抽出する
+
+    doc に読み込み済みの ezdxf Document を渡すと、dxf_file の再読み込みを省く
+    （dxf_file はファイル名の表示・図番照合にのみ使う）。
+    """
     info = {
         "total_extracted": 0,
         "filtered_count": 0,
@@ -556,10 +1102,17 @@ def extract_labels(dxf_file, filter_non_parts=False, sort_order="asc", debug=Fal
         "all_drawing_numbers": [],
         "title": None,
         "subtitle": None,
+        "entity_passes": 0,
+        "layout_timings": {},
+        "template_inserts": 0,
+        "mtext_cache": {"hits": 0, "misses": 0},
+        "label_category_counts": {},
     }
+    mtext_cache_before = clean_mtext_format_codes.cache_info()
 
     try:
-        doc = ezdxf.readfile(dxf_file)
+        if doc is None:
+            doc = ezdxf.readfile(dxf_file)
         msp = doc.modelspace()
 
         all_layers = [layer.dxf.name for layer in doc.layers]
@@ -569,112 +1122,34 @@ def extract_labels(dxf_file, filter_non_parts=False, sort_order="asc", debug=Fal
             selected_layers = all_layers
         info["processed_layers"] = len(selected_layers)
 
-        labels = []
-        labels_with_coordinates = []
-        drawing_number_candidates = []
-        all_labels_with_coords = []
-
-        # エンティティ収集
-        # 各要素は (entity, group_key)。group_key は所属タイトルブロック（INSERT）の
-        # 識別子。INSERT 由来は親 INSERT の handle、直接配置は自身の handle を使う。
-        # 旧・現行のタイトルブロックが同一座標に重なっているケースで、図番と流用元
-        # 図番が同じブロックに属することを判定するために用いる。
-        all_entities_to_process = []
-
-        def _entity_handle(entity):
-            return getattr(entity.dxf, 'handle', None)
-
-        # MODEL_SPACE
-        for e in msp:
-            if e.dxftype() in ['TEXT', 'MTEXT']:
-                all_entities_to_process.append((e, _entity_handle(e)))
-
-        # PAPER_SPACE（Model 以外のレイアウト）
-        try:
-            for layout in doc.layouts:
-                if layout.name != 'Model':
-                    for e in layout:
-                        if e.dxftype() in ['TEXT', 'MTEXT']:
-                            all_entities_to_process.append((e, _entity_handle(e)))
-        except Exception:
-            pass
-
-        # INSERT エンティティを virtual_entities() で展開（座標変換を含む）
-        # 展開後の仮想エンティティには親 INSERT の handle をグループキーとして付与する。
-        # テキストを含まないブロック（手描き回路図のコネクタ等の記号で多い）は
-        # virtual_entities() を呼ぶ前にスキップし、無駄な展開コストを避ける。
-        block_text_cache = {}
-        try:
-            for e in msp:
-                if e.dxftype() == 'INSERT' and e.dxf.layer in selected_layers:
-                    if not _block_has_text_content(doc, e.dxf.name, block_text_cache):
-                        continue
-                    insert_group = _entity_handle(e)
-                    try:
-                        for virtual_entity in e.virtual_entities():
-                            if virtual_entity.dxftype() in ['TEXT', 'MTEXT']:
-                                all_entities_to_process.append((virtual_entity, insert_group))
-                    except Exception:
-                        pass
-
-            for layout in doc.layouts:
-                if layout.name != 'Model':
-                    for e in layout:
-                        if e.dxftype() == 'INSERT' and e.dxf.layer in selected_layers:
-                            if not _block_has_text_content(doc, e.dxf.name, block_text_cache):
-                                continue
-                            insert_group = _entity_handle(e)
-                            try:
-                                for virtual_entity in e.virtual_entities():
-                                    if virtual_entity.dxftype() in ['TEXT', 'MTEXT']:
-                                        all_entities_to_process.append((virtual_entity, insert_group))
-                            except Exception:
-                                pass
-        except Exception:
-            pass
-
-        # 重複除去（同一種・同一レイヤー・同一座標）
-        seen_entities = set()
-        unique_entities = []
-        for e, group_key in all_entities_to_process:
-            try:
-                entity_key = (
-                    e.dxftype(),
-                    e.dxf.layer if hasattr(e.dxf, 'layer') else '',
-                    getattr(e.dxf, 'insert', (0, 0)) if hasattr(e.dxf, 'insert') else (0, 0),
-                )
-                if entity_key not in seen_entities:
-                    seen_entities.add(entity_key)
-                    unique_entities.append((e, group_key))
-            except Exception:
-                unique_entities.append((e, group_key))
-
-        del all_entities_to_process
-        del seen_entities
-
-        # テキスト抽出
-        for e, group_key in unique_entities:
-            if e.dxf.layer in selected_layers:
-                raw_text, clean_text, coordinates = extract_text_from_entity(e)
-
-                if clean_text:
-                    if extract_drawing_numbers_option or extract_title_option:
-                        all_labels_with_coords.append((clean_text, coordinates, group_key))
-
-                    # タイトル抽出（extract_title_option）も、同一タイトルブロック
-                    # グループ制限（main_drawing_group、下記参照）のために図番候補を
-                    # 内部的に必要とするため、extract_drawing_numbers_option の指定に
-                    # 関わらず収集する（2026-07-29、呼び出し側の渡し忘れに強くする
-                    # ための内部結合解消。詳細は下記コメント）。
-                    if extract_drawing_numbers_option or extract_title_option:
-                        for dn in extract_drawing_numbers(clean_text):
-                            drawing_number_candidates.append((dn, coordinates, group_key))
-
-                    labels.append(clean_text)
-                    labels_with_coordinates.append((clean_text, coordinates[0], coordinates[1]))
-
+        # エンティティの走査（レイアウトごとに1パス、詳細は _LabelCollector 参照）
+        collector = _LabelCollector(
+            doc, selected_layers,
+            collect_positions=extract_drawing_numbers_option or extract_title_option,
+        )
+        layouts_to_scan = _layouts_in_scan_order(doc)
+        for layout in layouts_to_scan:
+            collector.scan_layout(layout)
+        collector.expand_pending_inserts()
+
+        labels = collector.labels
+        labels_with_coordinates = collector.labels_with_coordinates
+        drawing_number_candidates = collector.drawing_number_candidates
+        all_labels_with_coords = collector.all_labels_with_coords
+
+        info["template_inserts"] = collector.template_inserts
+        mtext_cache_after = clean_mtext_format_codes.cache_info()
+        info["mtext_cache"] = {
+            "hits": mtext_cache_after.hits - mtext_cache_before.hits,
+            "misses": mtext_cache_after.misses - mtext_cache_before.misses,
+        }
+        info["entity_passes"] = len(layouts_to_scan)
+        info["layout_timings"] = collector.layout_timings
         info["total_extracted"] = len(labels)
 
+        # タイトル・図番のヒューリスティクスが共有する空間索引（1ファイルにつき1回）
+        label_index = _LabelSpatialIndex(all_labels_with_coords) if all_labels_with_coords else None
+
         # 図面番号の判別
         # main_drawing_group は extract_title_and_subtitle() の同一タイトルブロック
         # グループ制限に使うため、extract_title_option=True であれば
@@ -693,6 +1168,7 @@ def extract_labels(dxf_file, filter_non_parts=False, sort_order="asc", debug=Fal
                 drawing_number_candidates,
                 all_labels=all_labels_with_coords,
                 filename=filename_for_matching,
+                label_index=label_index,
             )
             main_drawing_group = drawing_info['main_group']
             if extract_drawing_numbers_option:
@@ -707,6 +1183,7 @@ def extract_labels(dxf_file, filter_non_parts=False, sort_order="asc", debug=Fal
                 drawing_numbers=drawing_number_candidates or None,
                 main_drawing_group=main_drawing_group,
                 doc=doc,
+                label_index=label_index,
             )
             info["title"] = title_info['title']
             info["subtitle"] = title_info['subtitle']
@@ -720,6 +1197,7 @@ def extract_labels(dxf_file, filter_non_parts=False, sort_order="asc", debug=Fal
         processed_labels = symbol_result['labels']
         info["filtered_count"] = symbol_result['filtered_count']
         info["invalid_ref_designators"] = symbol_result['invalid_ref_designators']
+        info["label_category_counts"] = symbol_result['category_counts']
 
         # ソートと返却形式の選択
         if include_coordinates:
@@ -754,59 +1232,377 @@ def extract_labels(dxf_file, filter_non_parts=False, sort_order="asc", debug=Fal
         return [], info
 
 
-def get_title_and_subtitle(dxf_file, original_filename=None):
-    """DXFファイルのタイトル・サブタイトルのみを取得する軽量ラッパー。
+def _is_titleblock_template(template) -> bool:
+    """ブロックテキストテンプレートが「TITLE」ラベルを持つ（タイトルブロック）か。"""
+    return any(text.upper().strip() == 'TITLE' for _t, _l, text in template['entries'])
 
-    タイトル・サブタイトルだけが必要な呼び出し元（ラベル一覧やフィルタ結果は
-    不要な場合）のための入り口。内部では `extract_labels()` を
-    `extract_drawing_numbers_option=True` と `extract_title_option=True` の
-    組み合わせで呼び出す。v1.9.22の内部結合解消により `extract_title_option=True`
-    単独でも正しく動作するようになっているが、呼び出し元がオプションの組み合わせを
-    都度考えずに済むよう、この関数を経由することを推奨する（2026-07-29追加。
-    呼び出し側のオプション指定ミスで実際に不具合が発生した経緯は
-    determine_drawing_number_types / extract_title_and_subtitle のdocstring参照）。
+
+def _titleblock_regions(doc, layouts, block_templates):
+    """タイトルブロック INSERT の周辺矩形 (x_min, x_max, y_min, y_max) を返す。
+
+    ブロック直下に「TITLE」ラベルを持つブロックの INSERT をタイトルブロックと
+    みなす。矩形は図面枠（_titleblock_frame_bbox）、枠が無ければブロック内
+    テキストの挿入点の範囲を基準に、タイトル・図番の近傍判定距離ぶん広げる。
+    """
+    margin = max(
+        extraction_config.TITLE_PROXIMITY_X,
+        extraction_config.SOURCE_LABEL_PROXIMITY,
+        extraction_config.DWG_NO_LABEL_PROXIMITY,
+    )
+    regions = []
+    for layout in layouts:
+        for e in layout.query('INSERT'):
+            template = _block_text_template(doc, e.dxf.name, block_templates)
+            if template is None or not _is_titleblock_template(template):
+                continue
+            bbox = _titleblock_frame_bbox(doc, _entity_handle(e), margin=0.0)
+            if bbox is None:
+                try:
+                    points = _transform_template_points(template['points'], [e.matrix44()])[0]
+                except Exception:
+                    continue
+                bbox = (points[:, 0].min(), points[:, 0].max(), points[:, 1].min(), points[:, 1].max())
+            x0, x1, y0, y1 = bbox
+            regions.append((x0 - margin, x1 + margin, y0 - margin, y1 + margin))
+    return regions
+
+
+def _title_info_from_titleblock_region(doc, filename):
+    """タイトルブロック周辺のラベルだけでタイトル・図番を判定する（高速モード）。
+
+    全 INSERT の展開・全ラベルの整形を行わず、タイトルブロック INSERT と
+    その周辺矩形内のテキストだけを抽出する。タイトルブロックが見つからない
+    場合、および図番が決まらない・図番のタイトルブロック内に TITLE が無い
+    場合（全体処理では矩形外のラベルも候補になり、結果が一致しない）は
+    None を返す。
+    """
+    layouts = _layouts_in_scan_order(doc)
+    block_templates = {}
+    regions = _titleblock_regions(doc, layouts, block_templates)
+    if not regions:
+        return None
+    all_layers = [layer.dxf.name for layer in doc.layers]
+    collector = _LabelCollector(doc, all_layers, collect_positions=True, regions=regions)
+    collector.block_templates = block_templates
+
+    def _insert_near_titleblock(insert):
+        template = _block_text_template(doc, insert.dxf.name, block_templates)
+        if template is None or _is_titleblock_template(template):
+            # テンプレート化できないブロックは挿入点だけで位置を判断できないため展開する
+            return True
+        point = insert.dxf.insert
+        return collector.in_regions(point[0], point[1])
+
+    for layout in layouts:
+        collector.scan_layout(layout, insert_filter=_insert_near_titleblock)
+    collector.expand_pending_inserts()
+
+    result = {'title': None, 'subtitle': None, 'main_drawing_number': None, 'source_drawing_number': None}
+    all_labels_with_coords = collector.all_labels_with_coords
+    drawing_number_candidates = collector.drawing_number_candidates
+    if not all_labels_with_coords:
+        return result
+
+    label_index = _LabelSpatialIndex(all_labels_with_coords)
+    main_drawing_group = None
+    if drawing_number_candidates:
+        drawing_info = determine_drawing_number_types(
+            drawing_number_candidates,
+            all_labels=all_labels_with_coords,
+            filename=filename,
+            label_index=label_index,
+        )
+        main_drawing_group = drawing_info['main_group']
+        result['main_drawing_number'] = drawing_info['main_drawing']
+        result['source_drawing_number'] = drawing_info['source_drawing']
+
+    # 図番が属するタイトルブロック内に TITLE が無い場合、全体処理では矩形外の
+    # ラベルもタイトル候補になり得るため、周辺だけの判定は信用せずに全体処理へ回す
+    if result['main_drawing_number'] is None or main_drawing_group is None:
+        return None
+    norm = label_index.labels
+    if not any(norm[i][2] == main_drawing_group for i in label_index.indices_with_text('TITLE')):
+        return None
+
+    title_info = extract_title_and_subtitle(
+        all_labels_with_coords,
+        drawing_numbers=drawing_number_candidates or None,
+        main_drawing_group=main_drawing_group,
+        doc=doc,
+        label_index=label_index,
+    )
+    result['title'] = title_info['title']
+    result['subtitle'] = title_info['subtitle']
+    return result
+
+
+def extract_title_info(dxf_file, original_filename=None, fast=False):
+    """DXFファイルのタイトル・サブタイトル・図番を取得し、処理モードと時間を返す。
+
+    fast=True では、まずタイトルブロック INSERT とその周辺のテキストだけを
+    抽出して判定する（高速モード）。文書管理の同期処理のように大量のファイルで
+    タイトルだけが必要な場合に、全 INSERT の展開と全ラベルの整形を省く。
+    周辺だけでは全体処理と同じ候補を選べる保証が無い図面もあるため、既定は
+    fast=False（従来どおりの全体処理）で、高速モードは明示的に指定した場合のみ。
+    タイトルブロックが見つからない、またはタイトルが判定できない場合は、
+    同じ Document を使って `extract_labels()` による従来の全体処理に
+    フォールバックする（タイトルブロックがブロック化されず直接配置されている
+    図面等）。
 
     Returns:
-        (title, subtitle) のタプル。いずれも str または None。
+        info 辞書。'title', 'subtitle', 'main_drawing_number',
+        'source_drawing_number', 'mode'（'fast' / 'full'）、
+        'timings'（'read', 'fast', 'full' の秒数。実行したものだけ）を持つ。
+        読み込みに失敗した場合は 'error' を持つ。
     """
-    _, info = extract_labels(
+    info = {
+        "title": None,
+        "subtitle": None,
+        "main_drawing_number": None,
+        "source_drawing_number": None,
+        "mode": None,
+        "timings": {},
+    }
+    filename_for_matching = original_filename if original_filename else dxf_file
+
+    start = time.perf_counter()
+    try:
+        doc = ezdxf.readfile(dxf_file)
+    except Exception as e:
+        print(f"エラー: {str(e)}")
+        info["error"] = str(e)
+        return info
+    info["timings"]["read"] = time.perf_counter() - start
+
+    if fast:
+        start = time.perf_counter()
+        try:
+            result = _title_info_from_titleblock_region(doc, filename_for_matching)
+        except Exception:
+            result = None
+        info["timings"]["fast"] = time.perf_counter() - start
+        if result is not None and result['title'] is not None:
+            info.update(result)
+            info["mode"] = "fast"
+            return info
+
+    start = time.perf_counter()
+    _, full_info = extract_labels(
         dxf_file,
         extract_drawing_numbers_option=True,
         extract_title_option=True,
         original_filename=original_filename,
+        doc=doc,
     )
+    info["timings"]["full"] = time.perf_counter() - start
+    for key in ("title", "subtitle", "main_drawing_number", "source_drawing_number", "error"):
+        if key in full_info:
+            info[key] = full_info[key]
+    info["mode"] = "full"
+    return info
+
+
+def get_title_and_subtitle(dxf_file, original_filename=None, fast=False):
+    """DXFファイルのタイトル・サブタイトルのみを取得する軽量ラッパー。
+
+    タイトル・サブタイトルだけが必要な呼び出し元（ラベル一覧やフィルタ結果は
+    不要な場合）のための入り口。内部では `extract_title_info()` を呼び出し、
+    `extract_labels()` を `extract_drawing_numbers_option=True` と
+    `extract_title_option=True` の組み合わせで呼び出す全体処理を行う。
+    fast=True ではタイトルブロック周辺だけを抽出する高速モードを先に試し、
+    判定できなければ全体処理にフォールバックする。v1.9.22の内部結合解消により
+    `extract_title_option=True` 単独でも正しく動作するようになっているが、
+    呼び出し元がオプションの組み合わせを都度考えずに済むよう、この関数を経由する
+    ことを推奨する（2026-07-29追加。呼び出し側のオプション指定ミスで実際に不具合が
+    発生した経緯は determine_drawing_number_types / extract_title_and_subtitle の
+    docstring参照）。
+
+    Returns:
+        (title, subtitle) のタプル。いずれも str または None。
+    """
+    info = extract_title_info(dxf_file, original_filename=original_filename, fast=fast)
     return info.get('title'), info.get('subtitle')
 
 
-def process_multiple_dxf_files(dxf_files, filter_non_parts=False, sort_order="asc", debug=False,
-                                selected_layers=None, validate_ref_designators=False,
-                                extract_drawing_numbers_option=False, extract_title_option=False,
-                                original_filenames=None):
-    """複数のDXFファイルからラベルを抽出する"""
-    results = {}
+class _ExtractionTimeout(BaseException):
+    """ファイル単位のタイムアウト。
+
+    抽出処理内部の `except Exception` で握りつぶされないよう BaseException を継承する。
+    """
+
+
+def _timeout_supported_in_current_thread() -> bool:
+    """このスレッドで _call_with_timeout による打ち切りが効くか。"""
+    return hasattr(signal, 'SIGALRM') and threading.current_thread() is threading.main_thread()
+
+
+def _call_with_timeout(func, timeout):
+    """func() を実行し、timeout 秒を超えたら _ExtractionTimeout を送出する。
+
+    SIGALRM が使える環境のメインスレッド（プロセスプールのワーカーはこれに該当）
+    でのみ打ち切る。それ以外（Windows、Streamlit のスクリプトスレッド等）では
+    タイムアウトなしで実行する。
+    """
+    if not timeout or not _timeout_supported_in_current_thread():
+        return func()
+
+    def _on_alarm(signum, frame):
+        raise _ExtractionTimeout()
+
+    previous = signal.signal(signal.SIGALRM, _on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return func()
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
 
+def _extract_labels_task(args):
+    """process_multiple_dxf_files のワーカー（プロセスプールからも呼ばれる）"""
+    file_path, options, original_filename, timeout = args
+    try:
+        return _call_with_timeout(
+            lambda: extract_labels(file_path, original_filename=original_filename, **options),
+            timeout,
+        )
+    except _ExtractionTimeout:
+        return [], {
+            "filename": os.path.basename(file_path),
+            "error": f"タイムアウト（{timeout}秒）",
+            "timed_out": True,
+        }
+
+
+def _collect_dxf_tasks(dxf_files, original_filenames):
+    """入力（ファイル・ディレクトリ混在）を (ファイルパス, 元ファイル名) の列に展開する。
+
+    ディレクトリ内はパス順に並べ、結果の順序が実行環境に依存しないようにする。
+    """
+    tasks = []
     for i, dxf_file in enumerate(dxf_files):
         original_filename = original_filenames[i] if original_filenames and i < len(original_filenames) else None
 
         if os.path.isdir(dxf_file):
-            for root, _, files in os.walk(dxf_file):
-                for file in files:
+            for root, dirs, files in os.walk(dxf_file):
+                dirs.sort()
+                for file in sorted(files):
                     if file.lower().endswith('.dxf'):
-                        file_path = os.path.join(root, file)
-                        labels, info = extract_labels(
-                            file_path, filter_non_parts, sort_order, debug,
-                            selected_layers, validate_ref_designators,
-                            extract_drawing_numbers_option, extract_title_option,
-                            original_filename=file,
-                        )
-                        results[file_path] = (labels, info)
+                        tasks.append((os.path.join(root, file), file))
         elif os.path.isfile(dxf_file) and dxf_file.lower().endswith('.dxf'):
-            labels, info = extract_labels(
-                dxf_file, filter_non_parts, sort_order, debug,
-                selected_layers, validate_ref_designators,
-                extract_drawing_numbers_option, extract_title_option,
-                original_filename=original_filename,
+            tasks.append((dxf_file, original_filename))
+    return tasks
+
+
+def _build_extraction_tasks(dxf_files, original_filenames, timeout, **options):
+    """_extract_labels_task に渡す引数の列（入力順。ディレクトリ内はパス順）"""
+    return [
+        (file_path, options, original_filename, timeout)
+        for file_path, original_filename in _collect_dxf_tasks(dxf_files, original_filenames)
+    ]
+
+
+def _iter_extraction_results(tasks, max_workers, timeout):
+    """tasks を実行し、(完了数, 総数, ファイルパス, labels, info) を完了順に返す。"""
+    total = len(tasks)
+    use_pool = bool(max_workers and max_workers > 1 and total > 1)
+    worker_count = max_workers if use_pool else 1
+    if timeout and total and not use_pool and not _timeout_supported_in_current_thread():
+        if hasattr(signal, 'SIGALRM'):
+            # ワーカーのメインスレッドなら SIGALRM で打ち切れる
+            use_pool = True
+        else:
+            warnings.warn(
+                f"timeout={timeout} はこの環境（SIGALRM なし）では無視されます",
+                RuntimeWarning,
+                stacklevel=3,
             )
-            results[dxf_file] = (labels, info)
 
+    if not use_pool:
+        for index, task in enumerate(tasks):
+            labels, info = _extract_labels_task(task)
+            yield index + 1, total, task[0], labels, info
+        return
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    with ProcessPoolExecutor(max_workers=worker_count) as executor:
+        futures = {executor.submit(_extract_labels_task, task): index for index, task in enumerate(tasks)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            file_path = tasks[futures[future]][0]
+            try:
+                labels, info = future.result()
+            except Exception as e:
+                labels, info = [], {"filename": os.path.basename(file_path), "error": str(e)}
+            yield done, total, file_path, labels, info
+
+
+def iter_multiple_dxf_files(dxf_files, filter_non_parts=False, sort_order="asc", debug=False,
+                            selected_layers=None, validate_ref_designators=False,
+                            extract_drawing_numbers_option=False, extract_title_option=False,
+                            original_filenames=None, max_workers=None, timeout=None):
+    """複数のDXFファイルからラベルを抽出し、1ファイル完了ごとに結果を返すジェネレータ
+
+    引数は process_multiple_dxf_files と同じ（progress_callback を除く）。全ファイルの
+    完了を待たずに結果を表示・保存したい呼び出し元（Streamlit 等）向け。
+
+    timeout を指定して逐次実行をメインスレッド以外（Streamlit のスクリプトスレッド等）
+    から呼んだ場合は SIGALRM が使えないため、ワーカー1つのプロセスプールで実行して
+    タイムアウトを有効にする。SIGALRM の無い環境（Windows）ではワーカーでも
+    打ち切れないため、RuntimeWarning を出してタイムアウトなしで実行する。
+
+    Yields:
+        (完了数, 総数, ファイルパス, labels, info)。並列実行では完了した順。
+    """
+    tasks = _build_extraction_tasks(
+        dxf_files, original_filenames, timeout,
+        filter_non_parts=filter_non_parts,
+        sort_order=sort_order,
+        debug=debug,
+        selected_layers=selected_layers,
+        validate_ref_designators=validate_ref_designators,
+        extract_drawing_numbers_option=extract_drawing_numbers_option,
+        extract_title_option=extract_title_option,
+    )
+    yield from _iter_extraction_results(tasks, max_workers, timeout)
+
+
+def process_multiple_dxf_files(dxf_files, filter_non_parts=False, sort_order="asc", debug=False,
+                                selected_layers=None, validate_ref_designators=False,
+                                extract_drawing_numbers_option=False, extract_title_option=False,
+                                original_filenames=None, max_workers=None,
+                                progress_callback=None, timeout=None):
+    """複数のDXFファイルからラベルを抽出する
+
+    Args:
+        max_workers: 2以上でファイルごとの抽出をプロセス並列実行（None/1 は逐次実行）
+        progress_callback: 1ファイル完了ごとに (完了数, 総数, ファイルパス, labels, info)
+            で呼ばれる。並列実行では完了した順に呼ばれるため、全ファイルの完了を
+            待たずに結果を順次表示・保存できる（iter_multiple_dxf_files も参照）
+        timeout: 1ファイルあたりの上限秒数。超えたファイルは空のラベルと
+            'error'・'timed_out' を持つ info を返す（SIGALRM を使うため Windows では
+            無効。メインスレッド以外からの逐次実行はワーカー1つのプールで実行する）
+
+    Returns:
+        {ファイルパス: (labels, info)}。並列実行でも、入力順（ディレクトリ内は
+        パス順）に並ぶ。
+    """
+    tasks = _build_extraction_tasks(
+        dxf_files, original_filenames, timeout,
+        filter_non_parts=filter_non_parts,
+        sort_order=sort_order,
+        debug=debug,
+        selected_layers=selected_layers,
+        validate_ref_designators=validate_ref_designators,
+        extract_drawing_numbers_option=extract_drawing_numbers_option,
+        extract_title_option=extract_title_option,
+    )
+    outcomes = {}
+    for done, total, file_path, labels, info in _iter_extraction_results(tasks, max_workers, timeout):
+        outcomes[file_path] = (labels, info)
+        if progress_callback is not None:
+            progress_callback(done, total, file_path, labels, info)
+
+    results = {}
+    for file_path, *_rest in tasks:
+        results[file_path] = outcomes[file_path]
     return results
@@ -7,12 +7,19 @@ diff_labels.xlsx / unchanged_labels.xlsx をアプリ内で生成する。
 
 import io
 from collections import Counter
+from collections.abc import Sequence
 from typing import List, Dict, Tuple, Optional
 
+import numpy as np
 import pandas as pd
 
 from .extract_labels import extract_labels
 
+# ラベル照合方式
+LABEL_MATCH_ROUNDED = 'rounded'     # 座標を許容誤差単位で丸め、同じ丸め座標のラベル同士を照合（従来方式）
+LABEL_MATCH_NEIGHBOR = 'neighbor'   # 格子の隣接セルも探索し、距離が許容誤差以内のラベルを近い順に照合
+LABEL_MATCH_MODES = (LABEL_MATCH_ROUNDED, LABEL_MATCH_NEIGHBOR)
+
 
 def _load_labels_with_cache(
     file_path: str,
@@ -65,6 +72,567 @@ def group_labels_by_coordinate(rounded_labels: List[Tuple[str, float, float]]):
     return groups
 
 
+def round_label_arrays(labels: List[Tuple[str, float, float]], tolerance: float):
+    """round_labels_with_coordinates の numpy 版。(ラベル配列, X配列, Y配列) を返す。
+
+    np.rint は round() と同じ偶数丸めのため、丸め結果は一致する。
+    round() は整数を返すので -0.0 が生じないが、np.rint は -0.0 を返し得るため
+    +0.0 で正規化する。許容誤差が整数の場合は round() 版と同じく整数座標になる。
+    """
+    frame = pd.DataFrame(labels, columns=['label', 'x', 'y'])
+    label_array = frame['label'].to_numpy(dtype=object)
+    coords = []
+    for column in ('x', 'y'):
+        values = frame[column].to_numpy(dtype=float)
+        if tolerance:
+            steps = np.rint(values / tolerance) + 0.0
+            if isinstance(tolerance, int):
+                steps = steps.astype('int64')
+            values = steps * tolerance
+        coords.append(values)
+    return label_array, coords[0], coords[1]
+
+
+def count_labels_by_coordinate(rounded_new, rounded_old) -> Dict[str, np.ndarray]:
+    """group_labels_by_coordinate の numpy 版。新旧を (X, Y, ラベル) ごとに集計する。
+
+    ラベルは文字列順の整数コードに置き換え、(X, Y, ラベル) の辞書順に並べた
+    グループごとの新旧件数を返す。
+    Returns: {'x', 'y', 'label_code', 'n_new', 'n_old'} の配列と 'labels'（コード→ラベル）
+    """
+    labels = np.concatenate([rounded_new[0], rounded_old[0]])
+    xs = np.concatenate([rounded_new[1], rounded_old[1]])
+    ys = np.concatenate([rounded_new[2], rounded_old[2]])
+    is_old = np.zeros(len(labels), dtype=np.int64)
+    is_old[len(rounded_new[0]):] = 1
+
+    codes, uniques = pd.factorize(labels, sort=True)
+    total = len(labels)
+    if total == 0:
+        empty_int = np.zeros(0, dtype=np.int64)
+        return {'x': xs, 'y': ys, 'label_code': empty_int, 'n_new': empty_int, 'n_old': empty_int,
+                'labels': np.asarray(uniques, dtype=object)}
+
+    # X・Y・ラベルをそれぞれ順序を保つ密な整数に置き換え、1つの整数キーで並べる
+    # （3キーの lexsort より速い）
+    _, x_rank = np.unique(xs, return_inverse=True)
+    _, y_rank = np.unique(ys, return_inverse=True)
+    key = (x_rank.astype(np.int64) * (int(y_rank.max()) + 1) + y_rank) * (len(uniques) + 1) + codes
+    order = np.argsort(key, kind='stable')
+    xs, ys, codes, is_old, key = xs[order], ys[order], codes[order], is_old[order], key[order]
+
+    boundary = np.empty(total, dtype=bool)
+    boundary[0] = True
+    boundary[1:] = key[1:] != key[:-1]
+    starts = np.flatnonzero(boundary)
+    n_old = np.add.reduceat(is_old, starts)
+    n_new = np.diff(np.append(starts, total)) - n_old
+    return {
+        'x': xs[starts],
+        'y': ys[starts],
+        'label_code': codes[starts],
+        'n_new': n_new,
+        'n_old': n_old,
+        'labels': np.asarray(uniques, dtype=object),
+    }
+
+
+def _rank_within_coordinate(coord_ids: np.ndarray) -> np.ndarray:
+    """座標 ID 順に並んだ配列で、同一座標内の 0 始まりの通し番号を返す。"""
+    if len(coord_ids) == 0:
+        return np.zeros(0, dtype=np.int64)
+    positions = np.arange(len(coord_ids))
+    first = np.empty(len(coord_ids), dtype=bool)
+    first[0] = True
+    first[1:] = coord_ids[1:] != coord_ids[:-1]
+    return positions - np.maximum.accumulate(np.where(first, positions, 0))
+
+
+class LabelRecords(Sequence):
+    """列の配列で保持し、要素に触れた時点で辞書のリストに変換するレコード列。
+
+    len・添字・反復・== は辞書のリストと同じように使える。to_frame() は辞書を
+    作らずに列から直接 DataFrame を組み立てる（ワークブック出力で使用）。
+    fields は 辞書のキー → 列名、または複数列を組にする場合は列名のタプル。
+    """
+
+    __hash__ = None
+
+    def __init__(self, columns: Dict[str, np.ndarray], fields: Optional[Dict[str, object]] = None):
+        self._columns = columns
+        self._fields = fields if fields is not None else {name: name for name in columns}
+        self._rows = None
+
+    def _materialize(self) -> List[Dict]:
+        if self._rows is None:
+            values = {name: np.asarray(column).tolist() for name, column in self._columns.items()}
+            parts = [
+                values[field] if isinstance(field, str) else list(zip(*(values[name] for name in field)))
+                for field in self._fields.values()
+            ]
+            keys = list(self._fields)
+            self._rows = [dict(zip(keys, row)) for row in zip(*parts)]
+        return self._rows
+
+    def __len__(self):
+        return len(next(iter(self._columns.values()))) if self._columns else 0
+
+    def __getitem__(self, index):
+        return self._materialize()[index]
+
+    def __iter__(self):
+        return iter(self._materialize())
+
+    def __eq__(self, other):
+        if isinstance(other, LabelRecords):
+            other = other._materialize()
+        if not isinstance(other, list):
+            return NotImplemented
+        return self._materialize() == other
+
+    def __repr__(self):
+        return f'LabelRecords({self._materialize()!r})'
+
+    def to_frame(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """辞書のリストから作る DataFrame と同じ内容を列から直接作る（組の項目は列ごとに展開）"""
+        data = {}
+        for key, field in self._fields.items():
+            if isinstance(field, str):
+                data[key] = self._columns[field]
+            else:
+                for name in field:
+                    data[name] = self._columns[name]
+        return pd.DataFrame(data, columns=columns)
+
+
+def find_label_change_pairs_vectorized(
+    counts: Dict[str, np.ndarray],
+    sort_by_label: bool = False,
+    detect_moves: bool = False,
+    move_search_radius: float = 1.0,
+    max_move_distance: Optional[float] = None,
+):
+    """find_label_change_pairs の numpy 版（同じ内容の change_rows / unchanged_entries を返す）。
+
+    共通件数を未変更とし、残数をグループ（座標・ラベル順）ごとに展開して座標内の
+    通し番号で新旧を突き合わせる。座標・区分（名称変更 → 削除のみ → 追加のみ）・
+    通し番号の順に並べると、座標ごとのループ版と同じ順序になる。
+    sort_by_label=True では、change_rows をさらに (旧ラベル, 新ラベル)（None は
+    空文字扱い）で安定ソートした順で返す（compute_label_differences の並び順）。
+    detect_moves=True では、名称変更の突き合わせ前に残数のうち同じラベルの新旧を
+    _match_moved_labels で対応付けて移動として取り除く。
+
+    change_rows / unchanged_entries は列のまま保持する LabelRecords で、辞書には
+    要素に触れた時点で変換する。
+
+    Returns: (change_rows, unchanged_entries, moved_rows)
+    """
+    gx, gy, codes = counts['x'], counts['y'], counts['label_code']
+    label_names = counts['labels']
+    shared = np.minimum(counts['n_new'], counts['n_old'])
+
+    mask = shared > 0
+    unchanged_entries = LabelRecords(
+        {'label': label_names[codes[mask]], 'count': shared[mask], 'x': gx[mask], 'y': gy[mask]},
+        fields={'label': 'label', 'count': 'count', 'coordinate': ('x', 'y')},
+    )
+
+    if len(gx) == 0:
+        no_labels = np.empty(0, dtype=object)
+        change_rows = LabelRecords({'Coordinate X': gx, 'Coordinate Y': gy,
+                                    'Old Label': no_labels, 'New Label': no_labels})
+        return change_rows, unchanged_entries, []
+
+    new_coord = np.empty(len(gx), dtype=bool)
+    new_coord[0] = True
+    new_coord[1:] = (gx[1:] != gx[:-1]) | (gy[1:] != gy[:-1])
+    coord_id = np.cumsum(new_coord) - 1
+    coord_count = int(coord_id[-1]) + 1
+
+    # 残数を件数ぶん展開（グループ順 = 座標・ラベル順）
+    old_groups = np.repeat(np.arange(len(gx)), counts['n_old'] - shared)
+    new_groups = np.repeat(np.arange(len(gx)), counts['n_new'] - shared)
+
+    moved_rows = []
+    if detect_moves:
+        group_xy = np.column_stack([gx, gy]).astype(float)
+        moved_new, moved_old, moved_distance = _match_moved_labels(
+            group_xy[new_groups], codes[new_groups], group_xy[old_groups], codes[old_groups],
+            move_search_radius, max_move_distance,
+        )
+        moved_rows = _build_moved_rows(
+            label_names[codes[new_groups[moved_new]]],
+            gx[old_groups[moved_old]], gy[old_groups[moved_old]],
+            gx[new_groups[moved_new]], gy[new_groups[moved_new]],
+            moved_distance,
+        )
+        old_groups = np.delete(old_groups, moved_old)
+        new_groups = np.delete(new_groups, moved_new)
+
+    old_coord, new_coord_ids = coord_id[old_groups], coord_id[new_groups]
+    old_rank = _rank_within_coordinate(old_coord)
+    new_rank = _rank_within_coordinate(new_coord_ids)
+
+    pairable = np.minimum(np.bincount(old_coord, minlength=coord_count),
+                          np.bincount(new_coord_ids, minlength=coord_count))
+    old_paired = old_rank < pairable[old_coord]
+    new_paired = new_rank < pairable[new_coord_ids]
+
+    old_only = ~old_paired
+    new_only = ~new_paired
+    missing_old = np.full(int(new_only.sum()), -1)
+    missing_new = np.full(int(old_only.sum()), -1)
+    section = np.concatenate([
+        np.zeros(int(old_paired.sum()), dtype=np.int64),
+        np.ones(len(missing_new), dtype=np.int64),
+        np.full(len(missing_old), 2, dtype=np.int64),
+    ])
+    row_coord = np.concatenate([old_coord[old_paired], old_coord[old_only], new_coord_ids[new_only]])
+    row_rank = np.concatenate([old_rank[old_paired], old_rank[old_only], new_rank[new_only]])
+    row_old = np.concatenate([old_groups[old_paired], old_groups[old_only], missing_old])
+    row_new = np.concatenate([new_groups[new_paired], missing_new, new_groups[new_only]])
+
+    order = np.lexsort((row_rank, section, row_coord))
+    row_old, row_new = row_old[order], row_new[order]
+    row_group = np.where(row_old >= 0, row_old, row_new)
+
+    group_labels = label_names[codes]
+    old_labels = np.where(row_old >= 0, group_labels[row_old], None)
+    new_labels = np.where(row_new >= 0, group_labels[row_new], None)
+
+    if sort_by_label and len(row_group):
+        # ラベル文字列の順序を保つ整数コードで安定ソート（lexsort は安定）
+        label_codes, _ = pd.factorize(
+            np.concatenate([np.where(row_old >= 0, old_labels, ''),
+                            np.where(row_new >= 0, new_labels, '')]),
+            sort=True,
+        )
+        by_label = np.lexsort((label_codes[len(row_group):], label_codes[:len(row_group)]))
+        row_group, old_labels, new_labels = row_group[by_label], old_labels[by_label], new_labels[by_label]
+
+    change_rows = LabelRecords({
+        'Coordinate X': gx[row_group], 'Coordinate Y': gy[row_group],
+        'Old Label': old_labels, 'New Label': new_labels,
+    })
+    return change_rows, unchanged_entries, moved_rows
+
+
+def _neighbor_candidate_pairs(
+    new_xy: np.ndarray,
+    old_xy: np.ndarray,
+    tolerance: float,
+    new_keys: Optional[np.ndarray] = None,
+    old_keys: Optional[np.ndarray] = None,
+):
+    """許容誤差内にある新旧ラベルの候補ペアを格子で列挙する。
+
+    セル幅 = tolerance の格子に旧ラベルを振り分け、新ラベルごとに自セルと隣接 8 セルを
+    探索し、ユークリッド距離が tolerance 以内のものを候補にする（距離が tolerance 以内
+    なら X・Y の差も tolerance 以内のため、必ず 3×3 セル内に入る）。
+    keys を指定した場合は同じキー（ラベルコード）同士だけを候補にする。
+    Returns: (新 index 配列, 旧 index 配列, 距離配列)
+    """
+    empty = np.zeros(0, dtype=np.int64)
+    if len(new_xy) == 0 or len(old_xy) == 0:
+        return empty, empty, np.zeros(0)
+
+    new_cells = np.floor(new_xy / tolerance).astype(np.int64)
+    old_cells = np.floor(old_xy / tolerance).astype(np.int64)
+
+    offsets = np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)], dtype=np.int64)
+    probe_index = np.repeat(np.arange(len(new_xy)), len(offsets))
+    probe_cells = np.repeat(new_cells, len(offsets), axis=0) + np.tile(offsets, (len(new_xy), 1))
+
+    probes = pd.DataFrame({'cx': probe_cells[:, 0], 'cy': probe_cells[:, 1], 'new': probe_index})
+    bucket = pd.DataFrame({'cx': old_cells[:, 0], 'cy': old_cells[:, 1], 'old': np.arange(len(old_xy))})
+    on = ['cx', 'cy']
+    if new_keys is not None:
+        probes['key'] = new_keys[probe_index]
+        bucket['key'] = old_keys
+        on.append('key')
+    merged = probes.merge(bucket, on=on, how='inner')
+
+    new_idx = merged['new'].to_numpy(dtype=np.int64)
+    old_idx = merged['old'].to_numpy(dtype=np.int64)
+    delta = new_xy[new_idx] - old_xy[old_idx]
+    distance = np.hypot(delta[:, 0], delta[:, 1])
+    within = distance <= tolerance
+    return new_idx[within], old_idx[within], distance[within]
+
+
+def _greedy_match(new_idx: np.ndarray, old_idx: np.ndarray, distance: np.ndarray):
+    """候補ペアを距離の近い順（同距離は新・旧 index 順）に採用し、1対1 の対応を返す。"""
+    order = np.lexsort((old_idx, new_idx, distance))
+    used_new = set()
+    used_old = set()
+    matched_new = []
+    matched_old = []
+    for i, j in zip(new_idx[order].tolist(), old_idx[order].tolist()):
+        if i in used_new or j in used_old:
+            continue
+        used_new.add(i)
+        used_old.add(j)
+        matched_new.append(i)
+        matched_old.append(j)
+    return np.asarray(matched_new, dtype=np.int64), np.asarray(matched_old, dtype=np.int64)
+
+
+_MOVE_CANDIDATES_PER_LABEL = 8    # 移動検出で新ラベル1件あたりに残す近傍の旧ラベル数（初回）
+_MOVE_CANDIDATES_MAX = 64         # 探索し直すたびに 2 倍にする近傍数の上限
+_MOVE_CELL_CAPACITY = 32          # 移動検出の格子探索で1セルから列挙する旧ラベル数（近傍数未満にはしない）
+
+
+def _capped_cell_candidates(
+    new_xy: np.ndarray,
+    new_codes: np.ndarray,
+    old_xy: np.ndarray,
+    old_codes: np.ndarray,
+    cell: float,
+    cap: int,
+):
+    """セル幅 cell の格子で、自セルと隣接 8 セルにある同じラベルの旧ラベルを列挙する。
+
+    _neighbor_candidate_pairs と同じ探索だが、1セルから列挙する旧ラベルは最大 cap 件。
+    cap 件を超えるセルでは新ラベルごとに開始位置をずらして cap 件を選び、同じラベルが
+    密集したセルを多数の新ラベルが探索しても、候補が同じ旧ラベルに偏らないようにする。
+    Returns: (新 index 配列, 旧 index 配列, 距離配列)
+    """
+    new_cells = np.floor(new_xy / cell).astype(np.int64)
+    old_cells = np.floor(old_xy / cell).astype(np.int64)
+
+    # 旧ラベルを (ラベル, セル) 順に並べ、セルごとの開始位置と件数の表を作る
+    order = np.lexsort((old_cells[:, 1], old_cells[:, 0], old_codes))
+    sorted_codes, sorted_cells = old_codes[order], old_cells[order]
+    boundary = np.empty(len(order), dtype=bool)
+    boundary[0] = True
+    boundary[1:] = ((sorted_codes[1:] != sorted_codes[:-1])
+                    | np.any(sorted_cells[1:] != sorted_cells[:-1], axis=1))
+    starts = np.flatnonzero(boundary)
+    buckets = pd.DataFrame({
+        'key': sorted_codes[starts], 'cx': sorted_cells[starts, 0], 'cy': sorted_cells[starts, 1],
+        'start': starts, 'size': np.diff(np.append(starts, len(order))),
+    })
+
+    offsets = np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)], dtype=np.int64)
+    probe_index = np.repeat(np.arange(len(new_xy)), len(offsets))
+    probe_cells = np.repeat(new_cells, len(offsets), axis=0) + np.tile(offsets, (len(new_xy), 1))
+    probes = pd.DataFrame({
+        'key': new_codes[probe_index], 'cx': probe_cells[:, 0], 'cy': probe_cells[:, 1], 'new': probe_index,
+    })
+    merged = probes.merge(buckets, on=['key', 'cx', 'cy'], how='inner')
+
+    hit_new = merged['new'].to_numpy(dtype=np.int64)
+    hit_start = merged['start'].to_numpy(dtype=np.int64)
+    hit_size = merged['size'].to_numpy(dtype=np.int64)
+    take = np.minimum(hit_size, cap)
+    first = (hit_new * cap) % hit_size
+
+    new_idx = np.repeat(hit_new, take)
+    step = np.arange(int(take.sum())) - np.repeat(np.cumsum(take) - take, take)
+    size = np.repeat(hit_size, take)
+    old_idx = order[np.repeat(hit_start, take) + (np.repeat(first, take) + step) % size]
+    delta = new_xy[new_idx] - old_xy[old_idx]
+    return new_idx, old_idx, np.hypot(delta[:, 0], delta[:, 1])
+
+
+def _nearest_same_label_candidates(
+    new_xy: np.ndarray,
+    new_codes: np.ndarray,
+    old_xy: np.ndarray,
+    old_codes: np.ndarray,
+    start_radius: float,
+    limit: float,
+    k: int,
+):
+    """新ラベルごとに、同じラベル（コード）の旧ラベルのうち近いもの最大 k 件を返す。
+
+    セル幅 start_radius から 2 倍ずつ粗くした格子（_capped_cell_candidates）で探索し、
+    半径内に k 件見つかった・同じラベルの旧ラベルをすべて見た・半径が limit に
+    達した新ラベルから探索を打ち切る。半径 r の探索では距離 r 以内の旧ラベルが
+    列挙されるため（_MOVE_CELL_CAPACITY・k 件を超えて密集したセルを除く）、
+    打ち切り時点の近い k 件は k 近傍になる。密集したセルでは一部だけを候補にする
+    ため近似になるが、新ラベルごとの探索量は段数 × 9 セル × 上限件数に抑えられる。
+    Returns: (新 index 配列, 旧 index 配列, 距離配列)（新 index・距離順）
+    """
+    old_per_code = np.bincount(old_codes, minlength=int(new_codes.max()) + 1)
+    active = np.arange(len(new_xy))
+    found_new, found_old, found_distance = [], [], []
+    radius = start_radius
+    while len(active):
+        radius = min(radius, limit)
+        cand_new, cand_old, distance = _capped_cell_candidates(
+            new_xy[active], new_codes[active], old_xy, old_codes, radius, max(k, _MOVE_CELL_CAPACITY),
+        )
+        within = distance <= radius
+        cand_new, cand_old, distance = cand_new[within], cand_old[within], distance[within]
+
+        hits = np.bincount(cand_new, minlength=len(active))
+        done = (hits >= k) | (hits >= old_per_code[new_codes[active]]) | (radius >= limit)
+        keep = done[cand_new]
+        found_new.append(active[cand_new[keep]])
+        found_old.append(cand_old[keep])
+        found_distance.append(distance[keep])
+        active = active[~done]
+        radius *= 2
+
+    new_idx = np.concatenate(found_new)
+    old_idx = np.concatenate(found_old)
+    distance = np.concatenate(found_distance)
+    order = np.lexsort((old_idx, distance, new_idx))
+    new_idx, old_idx, distance = new_idx[order], old_idx[order], distance[order]
+    nearest = _rank_within_coordinate(new_idx) < k
+    return new_idx[nearest], old_idx[nearest], distance[nearest]
+
+
+def _match_moved_labels(
+    new_xy: np.ndarray,
+    new_codes: np.ndarray,
+    old_xy: np.ndarray,
+    old_codes: np.ndarray,
+    start_radius: float,
+    max_distance: Optional[float] = None,
+):
+    """同じラベル（コード）の新旧を、距離の近い順に 1対1 で対応付ける（移動検出）。
+
+    新ラベルごとに同じラベルの近い旧ラベル（_nearest_same_label_candidates、最大
+    _MOVE_CANDIDATES_PER_LABEL 件）だけを候補にして貪欲に対応付け、候補がすべて
+    他に取られた新ラベルは残りの旧ラベルで探索し直す。探索し直すたびに近傍数を
+    2 倍（_MOVE_CANDIDATES_MAX まで）にして、同じラベルが密集して近傍を取り合う
+    場合の繰り返し回数を抑える。同じラベルが大量に残っても全ペアは列挙しない。
+    新旧どちらかが尽きたラベルは探索対象から外す。
+    max_distance を指定した場合はそれより離れたペアを対応付けない。
+    Returns: (新 index 配列, 旧 index 配列, 距離配列)
+    """
+    matched_new, matched_old, matched_distance = [], [], []
+    rest_new = np.arange(len(new_xy))
+    rest_old = np.arange(len(old_xy))
+    if len(rest_new) and len(rest_old):
+        all_xy = np.concatenate([new_xy, old_xy])
+        limit = float(np.hypot(*np.ptp(all_xy, axis=0)))
+        if max_distance is not None:
+            limit = min(limit, max_distance)
+        k = _MOVE_CANDIDATES_PER_LABEL
+        while limit > 0:
+            common = np.intersect1d(new_codes[rest_new], old_codes[rest_old])
+            rest_new = rest_new[np.isin(new_codes[rest_new], common)]
+            rest_old = rest_old[np.isin(old_codes[rest_old], common)]
+            if len(rest_new) == 0:
+                break
+
+            pick_new, pick_old = _greedy_match(*_nearest_same_label_candidates(
+                new_xy[rest_new], new_codes[rest_new], old_xy[rest_old], old_codes[rest_old],
+                start_radius, limit, k,
+            ))
+            if len(pick_new) == 0:
+                break
+            k = min(k * 2, _MOVE_CANDIDATES_MAX)
+            matched_new.append(rest_new[pick_new])
+            matched_old.append(rest_old[pick_old])
+            matched_distance.append(np.hypot(*(new_xy[rest_new[pick_new]] - old_xy[rest_old[pick_old]]).T))
+            rest_new = np.delete(rest_new, pick_new)
+            rest_old = np.delete(rest_old, pick_old)
+
+    if not matched_new:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0)
+    return np.concatenate(matched_new), np.concatenate(matched_old), np.concatenate(matched_distance)
+
+
+def _build_moved_rows(labels, old_x, old_y, new_x, new_y, distance) -> List[Dict]:
+    """移動ラベルの行（ラベル・旧座標・新座標・移動距離）を (ラベル, 旧座標) 順で返す。"""
+    rows = [
+        {'Label': label, 'Old X': ox, 'Old Y': oy, 'New X': nx, 'New Y': ny, 'Distance': d}
+        for label, ox, oy, nx, ny, d in zip(
+            np.asarray(labels).tolist(), np.asarray(old_x).tolist(), np.asarray(old_y).tolist(),
+            np.asarray(new_x).tolist(), np.asarray(new_y).tolist(), np.asarray(distance).tolist(),
+        )
+    ]
+    rows.sort(key=lambda r: (r['Label'], r['Old X'], r['Old Y']))
+    return rows
+
+
+def match_labels_with_neighbors(
+    labels_new: List[Tuple[str, float, float]],
+    labels_old: List[Tuple[str, float, float]],
+    tolerance: float,
+    detect_moves: bool = False,
+    max_move_distance: Optional[float] = None,
+):
+    """隣接セル探索による許容誤差照合で変更候補・未変更候補を求める。
+
+    丸め座標の境界をまたいで微小移動したラベルも、距離が tolerance 以内であれば
+    照合する。まず同じラベル同士を距離の近い順に対応付けて未変更とし、残りを
+    ラベルを問わず同様に対応付けて名称変更とする。対応の付かないものは追加・削除。
+    detect_moves=True では、名称変更の対応付け前に残った同じラベル同士を
+    _match_moved_labels で対応付けて移動とする（移動距離は丸める前の座標で計算）。
+    出力座標は round_coordinate で丸めた値（名称変更・追加は新ラベル、削除は旧ラベルの位置）。
+
+    Returns: (change_rows, unchanged_entries, moved_rows)
+    """
+    new_names, new_x, new_y = round_label_arrays(labels_new, tolerance)
+    old_names, old_x, old_y = round_label_arrays(labels_old, tolerance)
+    new_xy = np.array([(x, y) for _, x, y in labels_new], dtype=float).reshape(-1, 2)
+    old_xy = np.array([(x, y) for _, x, y in labels_old], dtype=float).reshape(-1, 2)
+
+    codes, _ = pd.factorize(np.concatenate([new_names, old_names]))
+    new_codes, old_codes = codes[:len(new_names)], codes[len(new_names):]
+
+    # 同じラベル同士の照合 → 未変更
+    same_new, same_old = _greedy_match(*_neighbor_candidate_pairs(new_xy, old_xy, tolerance, new_codes, old_codes))
+    unchanged_counts = Counter(
+        zip(new_names[same_new].tolist(), new_x[same_new].tolist(), new_y[same_new].tolist())
+    )
+    unchanged_entries = [
+        {'label': label, 'count': count, 'coordinate': (x, y)}
+        for (label, x, y), count in sorted(unchanged_counts.items(), key=lambda item: (item[0][1], item[0][2], item[0][0]))
+    ]
+
+    # 残りをラベルを問わず照合 → 名称変更
+    rest_new = np.setdiff1d(np.arange(len(new_names)), same_new)
+    rest_old = np.setdiff1d(np.arange(len(old_names)), same_old)
+
+    moved_rows = []
+    if detect_moves:
+        moved_new, moved_old, moved_distance = _match_moved_labels(
+            new_xy[rest_new], new_codes[rest_new], old_xy[rest_old], old_codes[rest_old],
+            tolerance, max_move_distance,
+        )
+        moved_new, moved_old = rest_new[moved_new], rest_old[moved_old]
+        moved_rows = _build_moved_rows(
+            new_names[moved_new], old_x[moved_old], old_y[moved_old],
+            new_x[moved_new], new_y[moved_new], moved_distance,
+        )
+        rest_new = np.setdiff1d(rest_new, moved_new)
+        rest_old = np.setdiff1d(rest_old, moved_old)
+
+    cand_new, cand_old, distance = _neighbor_candidate_pairs(new_xy[rest_new], old_xy[rest_old], tolerance)
+    renamed_new, renamed_old = _greedy_match(cand_new, cand_old, distance)
+    renamed_new, renamed_old = rest_new[renamed_new], rest_old[renamed_old]
+    added = np.setdiff1d(rest_new, renamed_new)
+    removed = np.setdiff1d(rest_old, renamed_old)
+
+    new_names, new_x, new_y = new_names.tolist(), new_x.tolist(), new_y.tolist()
+    old_names, old_x, old_y = old_names.tolist(), old_x.tolist(), old_y.tolist()
+    change_rows = []
+    for i, j in zip(renamed_new.tolist(), renamed_old.tolist()):
+        change_rows.append({
+            'Coordinate X': new_x[i], 'Coordinate Y': new_y[i],
+            'Old Label': old_names[j], 'New Label': new_names[i],
+        })
+    for j in removed.tolist():
+        change_rows.append({
+            'Coordinate X': old_x[j], 'Coordinate Y': old_y[j],
+            'Old Label': old_names[j], 'New Label': None,
+        })
+    for i in added.tolist():
+        change_rows.append({
+            'Coordinate X': new_x[i], 'Coordinate Y': new_y[i],
+            'Old Label': None, 'New Label': new_names[i],
+        })
+    change_rows.sort(key=lambda r: (r['Coordinate X'], r['Coordinate Y']))
+    return change_rows, unchanged_entries, moved_rows
+
+
 def compute_label_differences(
     new_file: str,
     old_file: str,
@@ -72,34 +640,59 @@ def compute_label_differences(
     label_cache: Optional[dict] = None,
     filter_non_parts: bool = False,
     validate_ref_designators: bool = False,
+    match_mode: str = LABEL_MATCH_ROUNDED,
+    detect_moves: bool = False,
+    max_move_distance: Optional[float] = None,
 ):
     """
     ラベルを抽出（ブロック展開を含む）し、変更候補・未変更候補を計算する。
 
+    match_mode:
+        LABEL_MATCH_ROUNDED  - 丸め座標が一致するラベル同士を照合（従来方式）
+        LABEL_MATCH_NEIGHBOR - 隣接セルも探索し、距離が許容誤差以内のラベルを近い順に照合
+                               （match_labels_with_neighbors。tolerance が 0 の場合は従来方式）
+    detect_moves:
+        True の場合、照合後に残った同じラベルの削除・追加を距離の近い順に対応付け、
+        移動ラベルとして extra_info['moved_rows'] に返す（change_rows からは除く）。
+        max_move_distance より離れたものは移動として扱わない（None は無制限）。
+
     Returns
     -------
     tuple(list, list, dict)
-        change_rows: 変更候補（座標と旧/新ラベルを含む辞書のリスト）
+        change_rows: 変更候補（座標と旧/新ラベルを含む辞書のリスト、または同じ内容の LabelRecords）
         unchanged_entries: 同一座標で一致したラベル情報のリスト
-        extra_info: {'labels_new': [...], 'invalid_ref_designators': [...]}
+        extra_info: {'labels_new': [...], 'invalid_ref_designators': [...], 'moved_rows': [...]}
     """
+    if match_mode not in LABEL_MATCH_MODES:
+        raise ValueError(f"Unknown label match mode: {match_mode}")
+
     labels_new, info_new = _load_labels_with_cache(new_file, label_cache, filter_non_parts, validate_ref_designators)
     labels_old, _ = _load_labels_with_cache(old_file, label_cache, filter_non_parts, False)
 
-    rounded_new = round_labels_with_coordinates(labels_new, tolerance)
-    rounded_old = round_labels_with_coordinates(labels_old, tolerance)
-
-    grouped_new = group_labels_by_coordinate(rounded_new)
-    grouped_old = group_labels_by_coordinate(rounded_old)
-
-    change_rows, unchanged_entries = find_label_change_pairs(grouped_new, grouped_old)
-    change_rows.sort(key=lambda r: ((r['Old Label'] or ''), (r['New Label'] or '')))
+    if match_mode == LABEL_MATCH_NEIGHBOR and tolerance:
+        change_rows, unchanged_entries, moved_rows = match_labels_with_neighbors(
+            labels_new, labels_old, tolerance, detect_moves, max_move_distance,
+        )
+        change_rows.sort(key=lambda r: ((r['Old Label'] or ''), (r['New Label'] or '')))
+    else:
+        # 座標丸め・座標ごとの集計・突き合わせは pandas/numpy でまとめて行う
+        # （round_labels_with_coordinates → group_labels_by_coordinate →
+        # find_label_change_pairs と同じ結果）
+        counts = count_labels_by_coordinate(
+            round_label_arrays(labels_new, tolerance),
+            round_label_arrays(labels_old, tolerance),
+        )
+        change_rows, unchanged_entries, moved_rows = find_label_change_pairs_vectorized(
+            counts, sort_by_label=True, detect_moves=detect_moves,
+            move_search_radius=tolerance or 1.0, max_move_distance=max_move_distance,
+        )
 
     extra_info = {
         'labels_new': labels_new,
         'invalid_ref_designators': info_new.get('invalid_ref_designators', []),
         'title': info_new.get('title'),
         'subtitle': info_new.get('subtitle'),
+        'moved_rows': moved_rows,
     }
     return change_rows, unchanged_entries, extra_info
 
@@ -195,7 +788,9 @@ def build_diff_labels_workbook(
 ) -> bytes:
     """diff_labels.xlsx のバイナリデータを生成する。
 
-    シート順: Summary → Total（任意）→ ペアシート × N → Invalid（任意）
+    シート順: Summary → Total（任意）→ ペアシート × N → Moved（任意）→ Invalid（任意）
+    Moved シートは、いずれかのペアに 'moved_rows'（compute_label_differences の
+    extra_info['moved_rows']）が指定された場合に、全ペアの移動ラベルをまとめて出力する。
     """
     # ペアシート名を事前決定（Summary の図番ハイパーリンクに必要）
     tmp_used: set = set()
@@ -203,6 +798,9 @@ def build_diff_labels_workbook(
         tmp_used.add('Summary')
     if total_data is not None:
         tmp_used.add('Total')
+    has_moved = any(s.get('moved_rows') is not None for s in sheets)
+    if has_moved:
+        tmp_used.add('Moved')
     pair_sheet_names = [
         ensure_unique_sheet_name(s.get('sheet_name') or 'Sheet', tmp_used)
         for s in sheets
@@ -253,13 +851,29 @@ def build_diff_labels_workbook(
             # ── ペアシート ──
             for sheet, sheet_name in zip(sheets, pair_sheet_names):
                 rows = sheet.get('rows') or []
-                df = pd.DataFrame(rows, columns=['Coordinate X', 'Coordinate Y', 'Old Label', 'New Label'])
+                columns = ['Coordinate X', 'Coordinate Y', 'Old Label', 'New Label']
+                if isinstance(rows, LabelRecords):
+                    df = rows.to_frame(columns)
+                else:
+                    df = pd.DataFrame(rows, columns=columns)
                 old_col = sheet.get('old_label_name', 'Old Label')
                 new_col = sheet.get('new_label_name', 'New Label')
                 df.rename(columns={'Old Label': old_col, 'New Label': new_col}, inplace=True)
                 df.to_excel(writer, sheet_name=sheet_name, index=False)
                 format_sheet(writer, sheet_name, df)
 
+            # ── Moved シート ──
+            if has_moved:
+                moved_columns = ['Label', 'Old X', 'Old Y', 'New X', 'New Y', 'Distance']
+                moved_records = [
+                    {'Sheet': sheet_name, **row}
+                    for sheet, sheet_name in zip(sheets, pair_sheet_names)
+                    for row in (sheet.get('moved_rows') or [])
+                ]
+                moved_df = pd.DataFrame(moved_records, columns=['Sheet'] + moved_columns)
+                moved_df.to_excel(writer, sheet_name='Moved', index=False)
+                format_sheet(writer, 'Moved', moved_df)
+
             # ── Invalid シート ──
             if invalid_data is not None:
                 invalid_df = pd.DataFrame(invalid_data, columns=['機器符号', '個数', 'ファイル名'])
@@ -308,11 +922,11 @@ def format_sheet(writer, sheet_name: str, df: pd.DataFrame):
     worksheet = writer.sheets[sheet_name]
     if not df.empty:
         for col_idx, column in enumerate(df.columns):
-            if column in ('Coordinate X', 'Coordinate Y'):
+            if column in ('Coordinate X', 'Coordinate Y', 'Old X', 'Old Y', 'New X', 'New Y', 'Distance'):
                 width = 14
             elif column in ('Old Label', 'New Label', 'Label'):
                 width = 100
-            elif column in ('ラベル', '機器符号'):
+            elif column in ('ラベル', '機器符号', 'Sheet'):
                 width = 20
             elif column == 'ファイル名':
                 width = 40